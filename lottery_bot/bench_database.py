@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк database.py на таблицах реального размера.
+
+Генератор заполняет базу синтетическими участниками за несколько сотен дней
+(последний день - сегодня). Сгенерированные базы кэшируются в --data-dir,
+каждый прогон работает с копией, чтобы записи бенчмарка не накапливались.
+
+Измеряются: init_db (создание Database при запуске бота), save_participant,
+can_user_participate_today, get_participants_by_date, get_participants_page,
+get_database_stats и запрос списка дат для клавиатуры /list (get_recent_dates).
+
+Результат - JSON (--output). Регрессия - превышение бюджета DEFAULT_BUDGETS_MS
+по p95 или рост медианы относительно --baseline больше чем на --tolerance;
+в этом случае код выхода 1.
+
+Запуск:
+    python bench_database.py --sizes 10k,1m --output bench.json
+    python bench_database.py --sizes 10k,1m,10m --baseline bench.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database import Database, ISO_DATE_FORMAT, DISPLAY_DATE_FORMAT
+from migrations import rebuild_daily_stats
+
+# Размеры по умолчанию: число записей participants
+DEFAULT_SIZES = '10k,1m,10m'
+
+# Число дней с участниками
+DEFAULT_DAYS = 300
+
+# Сколько записей вставлять одним executemany при генерации
+GENERATE_CHUNK = 100000
+
+# Бюджеты p95 (мс) для операций, время которых не должно зависеть от размера таблицы
+DEFAULT_BUDGETS_MS = {
+    'save_participant': 10.0,
+    'can_user_participate_today': 0.05,
+    'get_participants_page': 2.0,
+    'get_database_stats': 5.0,
+    'get_recent_dates': 2.0,
+}
+
+# Разница медиан меньше этого порога считается шумом при сравнении с базовым прогоном
+NOISE_FLOOR_MS = 0.05
+
+CODE_WORDS = ["Снежинка", "снежинка", "СНЕЖИНКА", "Снежинко", "Ёлка", "елка", "Подарок", "Звезда"]
+
+
+def parse_size(text):
+    """10k -> 10000, 1m -> 1000000"""
+    text = text.strip().lower()
+    multiplier = {'k': 10 ** 3, 'm': 10 ** 6}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def size_label(rows):
+    if rows >= 10 ** 6 and rows % 10 ** 6 == 0:
+        return f'{rows // 10 ** 6}m'
+    if rows >= 10 ** 3 and rows % 10 ** 3 == 0:
+        return f'{rows // 10 ** 3}k'
+    return str(rows)
+
+
+def bench_dates(days):
+    """Даты с участниками от старых к новым, последняя - сегодня (YYYY-MM-DD)"""
+    today = datetime.now()
+    return [(today - timedelta(days=days - 1 - i)).strftime(ISO_DATE_FORMAT) for i in range(days)]
+
+
+def generate_database(path, rows, days, seed):
+    """
+    Синтетическая база: rows записей за days дней, пользователь участвует не чаще раза в день.
+    Триггер статистики и индексы на время заливки удаляются и затем создаются заново -
+    так генерация 10 млн строк занимает минуты, а не часы.
+    """
+    rng = random.Random(seed)
+
+    # Схема создается миграциями бота, чтобы совпадать с рабочей
+    Database(db_path=path, batch_writes=False).close()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    deferred = conn.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = 'participants' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    ''').fetchall()
+    for object_type, name, _ in deferred:
+        conn.execute(f'DROP {object_type.upper()} {name}')
+
+    dates = bench_dates(days)
+    per_day = [rows // days + (1 if i < rows % days else 0) for i in range(days)]
+    users_pool = max(max(per_day) * 3, rows // 5, 1)
+
+    def generate():
+        for date, count in zip(dates, per_day):
+            for user_id in rng.sample(range(1, users_pool + 1), count):
+                seconds = rng.randrange(18 * 3600 + 1800, 20 * 3600)
+                yield (
+                    date,
+                    rng.choice(CODE_WORDS),
+                    user_id,
+                    f'user{user_id}' if user_id % 4 else None,
+                    f'User{user_id}',
+                    f'+79{user_id:09d}',
+                    f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}',
+                )
+
+    started = time.perf_counter()
+    batch = []
+    for row in generate():
+        batch.append(row)
+        if len(batch) >= GENERATE_CHUNK:
+            insert_generated(conn, batch)
+            batch = []
+    if batch:
+        insert_generated(conn, batch)
+
+    for _, _, sql in deferred:
+        conn.execute(sql)
+    conn.commit()
+    rebuild_daily_stats(conn)
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+
+    print(f"  сгенерировано {rows} записей за {time.perf_counter() - started:.1f} с", flush=True)
+
+
+def insert_generated(conn, batch):
+    conn.executemany('''
+        INSERT INTO participants (date, kode_slovo, user_id, username, first_name, phone, registration_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', batch)
+    conn.commit()
+
+
+def summarize(samples):
+    """Статистика по замерам в миллисекундах"""
+    values = sorted(s * 1000 for s in samples)
+    return {
+        'runs': len(values),
+        'median_ms': round(statistics.median(values), 4),
+        'p95_ms': round(values[max(0, math.ceil(len(values) * 0.95) - 1)], 4),
+        'min_ms': round(values[0], 4),
+    }
+
+
+def timed(func, args_list):
+    """Время каждого вызова func(*args) в секундах"""
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run_benchmarks(path, days, seed):
+    """Замеры на копии сгенерированной базы"""
+    rng = random.Random(seed)
+    results = {}
+
+    # Запуск бота: миграции (уже применены), прогрев индекса участников за сегодня
+    samples = []
+    for _ in range(5):
+        started = time.perf_counter()
+        db = Database(db_path=path, batch_writes=False)
+        samples.append(time.perf_counter() - started)
+        db.close()
+    results['init_db'] = summarize(samples)
+
+    db = Database(db_path=path, batch_writes=False)
+    try:
+        dates = [datetime.strptime(d, ISO_DATE_FORMAT).strftime(DISPLAY_DATE_FORMAT) for d in bench_dates(days)]
+        today = dates[-1]
+        known_users = [row[0] for row in db.get_connection().execute(
+            'SELECT user_id FROM participants WHERE date = ?', (bench_dates(days)[-1],)
+        )]
+
+        # Новые участники сегодня (ID вне диапазона сгенерированных)
+        new_users = range(10 ** 9, 10 ** 9 + 1000)
+        results['save_participant'] = summarize(timed(
+            db.save_participant,
+            [('Снежинка', user_id, f'bench{user_id}', 'Bench', '+79000000000') for user_id in new_users]
+        ))
+
+        checks = [
+            (rng.choice(known_users) if known_users and i % 2 else 10 ** 10 + i,)
+            for i in range(10000)
+        ]
+        results['can_user_participate_today'] = summarize(timed(db.can_user_participate_today, checks))
+
+        results['get_participants_by_date'] = summarize(timed(
+            db.get_participants_by_date, [(rng.choice(dates),) for _ in range(10)] + [(today,)] * 10
+        ))
+        results['get_participants_page'] = summarize(timed(
+            db.get_participants_page, [(rng.choice(dates),) for _ in range(200)]
+        ))
+        results['get_database_stats'] = summarize(timed(db.get_database_stats, [()] * 100))
+        results['get_recent_dates'] = summarize(timed(db.get_recent_dates, [()] * 200))
+    finally:
+        db.close()
+
+    return results
+
+
+def check_regressions(report, baseline, tolerance):
+    """Список превышений бюджетов и регрессий относительно базового прогона"""
+    problems = []
+
+    for size, results in report['results'].items():
+        for name, stats in results.items():
+            budget = DEFAULT_BUDGETS_MS.get(name)
+            if budget is not None and stats['p95_ms'] > budget:
+                problems.append(f"{size} {name}: p95 {stats['p95_ms']} мс > бюджета {budget} мс")
+
+            if not baseline:
+                continue
+            previous = baseline.get('results', {}).get(size, {}).get(name)
+            if not previous:
+                continue
+            limit = previous['median_ms'] * (1 + tolerance)
+            if stats['median_ms'] > limit and stats['median_ms'] - previous['median_ms'] > NOISE_FLOOR_MS:
+                problems.append(
+                    f"{size} {name}: медиана {stats['median_ms']} мс, в базовом прогоне "
+                    f"{previous['median_ms']} мс (+{(stats['median_ms'] / previous['median_ms'] - 1) * 100:.0f}%)"
+                )
+
+    return problems
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк операций с базой данных")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="размеры таблицы через запятую (10k,1m,10m)")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="число дней с участниками")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'lottery_bench'),
+                        help="каталог для сгенерированных баз (переиспользуются между прогонами)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="сохранить результат в JSON")
+    parser.add_argument('--baseline', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="допустимый рост медианы относительно базового прогона (0.2 = 20%%)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Журнал базы на уровне INFO пишет строку на каждую запись
+    logging.basicConfig(level=logging.WARNING)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'days': args.days,
+            'seed': args.seed,
+        },
+        'results': {},
+    }
+
+    for rows in (parse_size(size) for size in args.sizes.split(',')):
+        label = size_label(rows)
+        # База привязана к дате: последний день генерации - сегодня
+        source = os.path.join(
+            args.data_dir, f"bench_{label}_{args.days}d_{args.seed}_{datetime.now():%Y%m%d}.db"
+        )
+        print(f"📦 {label}: {rows} записей за {args.days} дней", flush=True)
+        if not os.path.exists(source):
+            generate_database(source + '.tmp', rows, args.days, args.seed)
+            os.replace(source + '.tmp', source)
+
+        workdir = tempfile.mkdtemp(prefix='lottery_bench_')
+        path = os.path.join(workdir, 'bench.db')
+        shutil.copyfile(source, path)
+        try:
+            report['results'][label] = run_benchmarks(path, args.days, args.seed)
+        finally:
+            shutil.rmtree(workdir)
+
+        print(f"  {'операция':<30}{'медиана, мс':>14}{'p95, мс':>12}{'мин, мс':>12}")
+        for name, stats in report['results'][label].items():
+            print(f"  {name:<30}{stats['median_ms']:>14}{stats['p95_ms']:>12}{stats['min_ms']:>12}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    problems = check_regressions(report, baseline, args.tolerance)
+    report['regressions'] = problems
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if problems:
+        print("\n⚠️ Регрессии:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+
+    print("\n✅ Регрессий нет")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
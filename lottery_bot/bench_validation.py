@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк проверки ввода: стоимость обработки одного сообщения
+с кодовым словом и номером телефона на типичных входных данных.
+Для сравнения приведена прежняя цепочка проверок из handle_lottery_number.
+
+Запуск: python bench_validation.py [число повторов]
+"""
+
+import re
+import sys
+import timeit
+
+from validation import (
+    validate_kode_slovo, validate_phone, OK, TOO_LONG, FORBIDDEN, EMPTY, WORD_TOO_LONG, INVALID
+)
+
+# Типичные сообщения во время розыгрыша (и по примеру на каждый результат проверки)
+KODE_SLOVO_INPUTS = [
+    "Снежинка",
+    "  снежинка ",
+    "СНЕЖ ИНКА",
+    "Новогодний2025",
+    "ёлка",
+    "Привет, какое слово?",
+    "очень длинное сообщение вместо кодового слова " * 3,
+    "drop table",
+    "слово'; --",
+    "🎄🎄🎄",
+    "   ",
+    "снежинка снежинка снежинка",
+]
+
+PHONE_INPUTS = [
+    "+79123456789",
+    "89123456789",
+    "+7 (912) 345-67-89",
+    "8 912 345 67 89",
+    "12345",
+    "телефон",
+    "🎄",
+    "8" * 31,
+]
+
+
+def legacy_kode_slovo(raw):
+    """Прежняя цепочка проверок кодового слова (для сравнения): (результат, значение)"""
+    raw_text = raw.strip()
+    if len(raw_text) > 100:
+        return TOO_LONG, None
+    cleaned_text = re.compile(r'[^a-zA-Zа-яА-ЯёЁ0-9\s\-_.,!?()@#%&*+=]').sub('', raw_text).strip()
+    upper_text = raw_text.upper()
+    for keyword in ['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'DROP', 'UNION', 'OR', 'AND']:
+        if keyword in upper_text:
+            return FORBIDDEN, None
+    for pattern in ['--', ';', '/*', '*/', "'", '"', '`']:
+        if pattern in raw_text:
+            return FORBIDDEN, None
+    kode_slovo = re.sub(r'\s+', '', cleaned_text)
+    if not kode_slovo:
+        return EMPTY, None
+    if len(kode_slovo) > 16:
+        return WORD_TOO_LONG, None
+    return OK, kode_slovo
+
+
+def legacy_phone(raw):
+    """Прежняя цепочка проверок телефона (для сравнения): (результат, значение)"""
+    phone_input = raw.strip()
+    if len(phone_input) > 30:
+        return TOO_LONG, None
+    safe = re.compile(r'[^a-zA-Zа-яА-ЯёЁ0-9\s\-_.,!?()@#%&*+=]').sub('', phone_input).strip()
+    if not safe:
+        return EMPTY, None
+    cleaned = re.sub(r'[^\d+]', '', safe)
+    if '+' in cleaned:
+        cleaned = '+' + cleaned.replace('+', '')
+    if not cleaned or len(cleaned) < 11:
+        return INVALID, None
+    return OK, cleaned
+
+
+def check_equivalence():
+    """Новая проверка должна давать те же результаты и значения, что и прежняя"""
+    for text in KODE_SLOVO_INPUTS:
+        verdict = validate_kode_slovo(text)
+        assert (verdict.status, verdict.value) == legacy_kode_slovo(text), text
+    for text in PHONE_INPUTS:
+        verdict = validate_phone(text)
+        assert (verdict.status, verdict.value) == legacy_phone(text), text
+
+
+def bench(name, func, inputs, number):
+    def run():
+        for text in inputs:
+            func(text)
+
+    best = min(timeit.repeat(run, number=number, repeat=5))
+    per_message_us = best / (number * len(inputs)) * 1e6
+    print(f"{name:<28} {per_message_us:8.2f} мкс/сообщение")
+    return per_message_us
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    check_equivalence()
+    print("✅ Результаты совпадают с прежней проверкой\n")
+
+    old = bench("кодовое слово (прежняя)", legacy_kode_slovo, KODE_SLOVO_INPUTS, number)
+    new = bench("кодовое слово (validation)", validate_kode_slovo, KODE_SLOVO_INPUTS, number)
+    print(f"{'ускорение':<28} {old / new:8.2f}x\n")
+
+    old = bench("телефон (прежняя)", legacy_phone, PHONE_INPUTS, number)
+    new = bench("телефон (validation)", validate_phone, PHONE_INPUTS, number)
+    print(f"{'ускорение':<28} {old / new:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,33 @@
 import logging
 from config import config
 import re
-import sqlite3
-import sys
+import threading
+import time
 import traceback
 from datetime import datetime, timedelta
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Updater, CommandHandler, MessageHandler, Filters,
     CallbackContext, ConversationHandler, CallbackQueryHandler 
 )
 
-from database import Database
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler('bot_errors.log', encoding='utf-8'
-                            ),
-        logging.StreamHandler(stream=sys.stdout)
-    ]
+from database import Database, to_iso_date
+from export import write_participants_csv
+from webhook import WebhookReceiver, register_webhook
+from workers import WorkerLanes
+from outbound import OutboundLimiter, QueuedBot, MeteredRequest, bulk
+from metrics import MetricsServer, GaugeCallback, HANDLER_ERRORS, track_handler
+from persistence import SQLitePersistence
+from logging_setup import setup_logging
+from error_digest import ErrorDigest
+from validation import (
+    validate_kode_slovo, validate_phone, OK, START, TOO_LONG, FORBIDDEN, EMPTY, WORD_TOO_LONG, INVALID
 )
+from templates import reply, START_KEYBOARD
+
+# Настройка логирования: файл с ротацией и консоль пишутся фоновым потоком,
+# медленные запросы к БД с планами выполнения - в отдельный файл
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Состояния для ConversationHandler
@@ -41,22 +46,37 @@ db = Database()
 ADMIN_ID = config.ADMIN_ID
 TOKEN = config.BOT_TOKEN
 
-MAX_INPUT_LENGTH = 100
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
 
-def sanitize_text(text: str) -> str:
-    """
-    Очистка текста от потенциально опасных символов.
-    Оставляет только буквы, цифры и некоторые безопасные символы.
-    """
-    if not text:
-        return ""
-    
-    # Оставляем только безопасные символы (кириллица, латиница, цифры, некоторые знаки препинания)
-    # Это более строгая проверка для максимальной безопасности
-    safe_pattern = re.compile(r'[^a-zA-Zа-яА-ЯёЁ0-9\s\-_.,!?()@#%&*+=]')
-    cleaned_text = safe_pattern.sub('', text)
-    
-    return cleaned_text.strip()
+# Кэш клавиатуры выбора даты: (ключ, время построения, (текст, клавиатура))
+_dates_keyboard_cache = None
+
+# Максимальная длина текста одной страницы списка (лимит Telegram - 4096 символов)
+MAX_MESSAGE_LENGTH = 4000
+
+# Срок жизни кэша клавиатуры (на случай записи участников другим процессом), секунды
+DATES_KEYBOARD_TTL = 60
+
+# Максимальное число победителей в одном розыгрыше /draw
+MAX_DRAW_WINNERS = 50
+
+# Приемник обновлений в режиме webhook (None в режиме polling)
+webhook_receiver = None
+
+# Пулы обработчиков участников и администратора (None в режиме sync)
+worker_lanes = None
+
+# HTTP-сервер метрик (None, если метрики выключены)
+metrics_server = None
+
+# Сводка ошибок для администратора (создается в main)
+error_digest = None
+
+# Названия состояний диалога регистрации для метрик
+CONVERSATION_STATE_NAMES = {
+    WAITING_FOR_NUMBER: 'waiting_for_number',
+    WAITING_FOR_PHONE: 'waiting_for_phone',
+}
 
 def start(update: Update, context: CallbackContext) -> int:
     """Обработка команды /start - начало регистрации"""
@@ -80,19 +100,7 @@ def start(update: Update, context: CallbackContext) -> int:
         if context.user_data:
             context.user_data.clear()
         
-        # Создаем клавиатуру с кнопкой /start
-        keyboard = [[KeyboardButton("/start")]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
-        
-        update.message.reply_text(
-            f"Привет, {user.first_name}! ✨\n\n"
-            "Я бот «7 канала Красноярск» для участия в\n"
-            "розыгрыше призов от НЕТАЙНОГО САНТЫ!\n\n"
-            "Для участия в розыгрыше:\n"
-            "1. Отправь кодовое слово из эфира «7 канал Красноярск».\n"
-            "2. Поделись своим контактным номером.\n",
-            reply_markup=reply_markup
-        )
+        reply(update, 'welcome', first_name=user.first_name)
         return WAITING_FOR_NUMBER
         
     except Exception as e:
@@ -119,15 +127,7 @@ def handle_start_button(update: Update, context: CallbackContext) -> int:
         # Очищаем предыдущие данные пользователя
         context.user_data.clear()
         
-        # Создаем клавиатуру с кнопкой /start
-        keyboard = [[KeyboardButton("/start")]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
-        
-        update.message.reply_text(
-            f"Начнем заново! ✨\n\n"
-            "Введите кодовое слово из эфира:\n",
-            reply_markup=reply_markup
-        )
+        reply(update, 'restart')
         return WAITING_FOR_NUMBER
         
     except Exception as e:
@@ -136,206 +136,70 @@ def handle_start_button(update: Update, context: CallbackContext) -> int:
             update.message.reply_text("⚠️ Произошла ошибка. Попробуйте позже.")
         return ConversationHandler.END
 
-def is_valid_kode_slovo(s: str) -> bool:
-    """
-    Проверяет, что кодовое слово содержит только безопасные символы.
-    Разрешены: буквы (кириллица/латиница), цифры, пробелы (но они будут удалены).
-    """
-    if not s:
-        return False
-    
-    # Проверяем, что строка состоит только из разрешенных символов
-    allowed_pattern = re.compile(r'^[a-zA-Zа-яА-ЯёЁ0-9\s\-_.,!?()@#%&*+=]+$')
-    return bool(allowed_pattern.match(s))
+# Шаблоны ответов на отклоненный ввод
+KODE_SLOVO_ERRORS = {
+    TOO_LONG: 'code_too_long',
+    FORBIDDEN: 'code_forbidden',
+    WORD_TOO_LONG: 'code_word_too_long',
+    EMPTY: 'code_empty',
+}
+
+PHONE_ERRORS = {
+    TOO_LONG: 'phone_too_long',
+    EMPTY: 'phone_empty',
+    INVALID: 'phone_invalid',
+}
 
 def handle_lottery_number(update: Update, context: CallbackContext) -> int:
     """Обработка введенного кодового слова"""
     try:
         if not update.message or not update.message.text:
             logger.error("Получено пустое сообщение")
-            
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            update.message.reply_text(
-                "❌ Получено пустое сообщение.\n"
-                "Попробуйте еще раз или нажмите /start для начала:",
-                reply_markup=reply_markup
-            )
+            reply(update, 'empty_message')
             return WAITING_FOR_NUMBER
         
         user = update.effective_user
-        raw_text = update.message.text.strip()
-        
-        # 1. Проверка длины (защита от слишком длинных сообщений)
-        if len(raw_text) > MAX_INPUT_LENGTH:
-            logger.warning(f"Пользователь {user.id} отправил слишком длинное сообщение: {len(raw_text)} символов")
-            
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            update.message.reply_text(
-                "❌ Сообщение слишком длинное.\n"
-                f"Максимальная длина: {MAX_INPUT_LENGTH} символов.\n"
-                "Попробуйте еще раз или нажмите /start для начала:",
-                reply_markup=reply_markup
-            )
-            return WAITING_FOR_NUMBER
         
-        # 2. Очистка текста от потенциально опасных символов
-        cleaned_text = sanitize_text(raw_text)
+        # Проверка и очистка ввода (длина, /start, запрещенные фрагменты, пробелы)
+        verdict = validate_kode_slovo(update.message.text)
         
-        # 3. Проверяем, если пользователь нажал кнопку /start
-        if cleaned_text == "/start":
+        if verdict.status == START:
             return handle_start_button(update, context)
         
-        # 4. Дополнительная проверка на SQL-инъекции и другие атаки
-        # Проверяем наличие подозрительных последовательностей
-        sql_keywords = ['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'DROP', 'UNION', 'OR', 'AND']
-        suspicious_patterns = ['--', ';', '/*', '*/', "'", '"', '`']
-        
-        upper_text = raw_text.upper()
-        for keyword in sql_keywords:
-            if keyword in upper_text:
-                logger.warning(f"Пользователь {user.id} отправил подозрительный запрос с ключевым словом: {keyword}")
-                
-                # Создаем клавиатуру с кнопкой /start
-                keyboard = [[KeyboardButton("/start")]]
-                reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-                
-                update.message.reply_text(
-                    "❌ Недопустимый ввод.\n"
-                    "Попробуйте еще раз или нажмите /start для начала:",
-                    reply_markup=reply_markup
-                )
-                return WAITING_FOR_NUMBER
-        
-        for pattern in suspicious_patterns:
-            if pattern in raw_text:
-                logger.warning(f"Пользователь {user.id} отправил подозрительный запрос с символом: {pattern}")
-                
-                # Создаем клавиатуру с кнопкой /start
-                keyboard = [[KeyboardButton("/start")]]
-                reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-                
-                update.message.reply_text(
-                    "❌ Недопустимый ввод.\n"
-                    "Попробуйте еще раз или нажмите /start для начала:",
-                    reply_markup=reply_markup
-                )
-                return WAITING_FOR_NUMBER
-        
-        kode_slovo = cleaned_text
-        
-        # 5. Удаляем все пробелы, табуляции, переносы строк (но сохраняем для проверки длины)
-        kode_slovo_without_spaces = re.sub(r'\s+', '', kode_slovo)
-        
-        # 6. Проверяем, что введено от 1 до 16 символов
-        if len(kode_slovo_without_spaces) == 0:
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        if verdict.status != OK:
+            if verdict.status == TOO_LONG:
+                logger.warning(f"Пользователь {user.id} отправил слишком длинное сообщение: {verdict.detail} символов")
+            elif verdict.status == FORBIDDEN:
+                logger.warning(f"Пользователь {user.id} отправил подозрительный запрос: {verdict.detail}")
             
-            update.message.reply_text(
-                "❌ Кодовое слово не может быть пустым.\n"
-                "Попробуйте еще раз или нажмите /start для начала:",
-                reply_markup=reply_markup
-            )
-            return WAITING_FOR_NUMBER
-        
-        if len(kode_slovo_without_spaces) > 16:
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            # Безопасно показываем длину (убираем escape)
-            safe_length = str(len(kode_slovo_without_spaces))
-            error_msg = f"❌ Кодовое слово должно содержать не более 16 символов (без учета пробелов). Вы ввели {safe_length} символов.\n"
-            
-            update.message.reply_text(
-                f"{error_msg}"
-                "Попробуйте еще раз или нажмите /start для начала:",
-                reply_markup=reply_markup
-            )
+            reply(update, KODE_SLOVO_ERRORS[verdict.status], length=verdict.detail)
             return WAITING_FOR_NUMBER
         
-        # 7. Проверяем, что в строке есть хотя бы один печатный символ
-        # (не только пробелы/табуляции)
-        if not kode_slovo_without_spaces:
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            update.message.reply_text(
-                "❌ Кодовое слово должно содержать хотя бы один символ (буквы или цифры).\n"
-                "Попробуйте еще раз или нажмите /start для начала:",
-                reply_markup=reply_markup
-            )
-            return WAITING_FOR_NUMBER
+        kode_slovo_without_spaces = verdict.value
         
         logger.info(f"Пользователь {user.id} ввел кодовое слово: {kode_slovo_without_spaces}")
         
-        # 8. Сохраняем кодовое слово в контексте пользователя
-        context.user_data['kode_slovo'] = kode_slovo_without_spaces
-        
-        # 9. Создаем кнопки для отправки телефона и /start
-        keyboard = [
-            [KeyboardButton("📱 Отправить мой номер телефона", request_contact=True)],
-            [KeyboardButton("/start")]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
+        # Повторную попытку отклоняем сразу, не запрашивая телефон (проверка по индексу в памяти)
+        if not db.can_user_participate_today(user.id):
+            reply(update, 'already_participated')
+            return ConversationHandler.END
         
-        # 10. Выводим кодовое слово пользователю (убираем escape)
-        safe_display_kode = kode_slovo_without_spaces[:50]  # Ограничиваем длину для безопасности
+        # Сохраняем кодовое слово в контексте пользователя
+        context.user_data['kode_slovo'] = kode_slovo_without_spaces
         
-        update.message.reply_text(
-            f"Принимая участие в розыгрыше, вы подтверждаете свое ознакомление и согласие с условиями розыгрыша «Нетайный Санта», размещенными на сайте https://trk7.ru\n"
-            "Победитель (получатель приза) идентифицируется по номеру телефона в сообщении с кодовым словом.\n\n"
-            "Теперь поделитесь номером телефона, чтобы мы смогли связаться с вами в случае вашего выигрыша.\n"
-            "Вы можете:\n"
-            "1. Нажать кнопку '📱 Отправить мой номер телефона'\n"
-            "2. Ввести номер вручную (например: +79123456789 или 89123456789)",
-            reply_markup=reply_markup
-        )
+        # Просим телефон (кнопка отправки контакта и /start)
+        reply(update, 'phone_request')
         
         return WAITING_FOR_PHONE
         
     except Exception as e:
         logger.error(f"Ошибка обработки кодового слова: {e}\n{traceback.format_exc()}")
         try:
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            update.message.reply_text(
-                "⚠️ Ошибка обработки кодового слова. Нажмите /start для начала заново:",
-                reply_markup=reply_markup
-            )
+            reply(update, 'code_error')
         except:
             pass
         return ConversationHandler.END
 
-def sanitize_phone(phone: str) -> str:
-    """
-    Очистка номера телефона.
-    Оставляет только цифры и символ + в начале.
-    """
-    if not phone:
-        return ""
-    
-    # Удаляем все символы, кроме цифр и +
-    cleaned = re.sub(r'[^\d+]', '', phone)
-    
-    # Если есть +, оставляем только один в начале
-    if '+' in cleaned:
-        # Удаляем все +, потом добавляем один в начало
-        digits = cleaned.replace('+', '')
-        cleaned = '+' + digits
-    
-    return cleaned
-
 def handle_phone(update: Update, context: CallbackContext) -> int:
     """Обработка номера телефона с защитой"""
     try:
@@ -344,20 +208,11 @@ def handle_phone(update: Update, context: CallbackContext) -> int:
         if not user:
             logger.error("Пользователь не определен при обработке телефона")
             try:
-                update.message.reply_text(
-                    "❌ Не удалось определить пользователя. Нажмите /start для начала заново."
-                )
+                reply(update, 'user_unknown')
             except:
                 pass
             return ConversationHandler.END
         
-        # Проверяем, если пользователь отправил /start
-        if update.message.text:
-            raw_text = update.message.text.strip()
-            cleaned_text = sanitize_text(raw_text)
-            if cleaned_text == "/start":
-                return handle_start_button(update, context)
-        
         # Получаем номер телефона
         phone = None
         if update.message.contact:
@@ -365,77 +220,21 @@ def handle_phone(update: Update, context: CallbackContext) -> int:
             phone = update.message.contact.phone_number
             logger.info(f"Пользователь {user.id} отправил контакт")
         elif update.message.text:
-            phone_input = update.message.text.strip()
-            
-            # Проверка длины
-            if len(phone_input) > 30:
-                # Создаем кнопки
-                keyboard = [
-                    [KeyboardButton("📱 Отправить мой номер телефона", request_contact=True)],
-                    [KeyboardButton("/start")]
-                ]
-                reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-                
-                update.message.reply_text(
-                    "❌ Номер телефона слишком длинный.\n"
-                    "Попробуйте еще раз или нажмите /start для начала заново:",
-                    reply_markup=reply_markup
-                )
-                return WAITING_FOR_PHONE
-            
-            # Очистка ввода
-            safe_phone_input = sanitize_text(phone_input)
-            
-            if not safe_phone_input:
-                # Создаем кнопки
-                keyboard = [
-                    [KeyboardButton("📱 Отправить мой номер телефона", request_contact=True)],
-                    [KeyboardButton("/start")]
-                ]
-                reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-                
-                update.message.reply_text(
-                    "❌ Номер телефона не может быть пустым.\n"
-                    "Попробуйте еще раз или нажмите /start для начала заново:",
-                    reply_markup=reply_markup
-                )
-                return WAITING_FOR_PHONE
+            # Проверка и нормализация ввода (/start, длина, только цифры и +)
+            verdict = validate_phone(update.message.text)
             
-            # Нормализация телефона
-            phone = sanitize_phone(safe_phone_input)
+            if verdict.status == START:
+                return handle_start_button(update, context)
             
-            # Проверяем, что после очистки номер валиден
-            if not phone or len(phone) < 11:
-                # Создаем кнопки
-                keyboard = [
-                    [KeyboardButton("📱 Отправить мой номер телефона", request_contact=True)],
-                    [KeyboardButton("/start")]
-                ]
-                reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-                
-                update.message.reply_text(
-                    "❌ Номер телефона слишком короткий или неверный.\n"
-                    "Примеры: +79123456789, 89123456789\n\n"
-                    "Попробуйте еще раз или нажмите /start для начала заново:",
-                    reply_markup=reply_markup
-                )
+            if verdict.status != OK:
+                reply(update, PHONE_ERRORS[verdict.status])
                 return WAITING_FOR_PHONE
             
+            phone = verdict.value
             logger.info(f"Пользователь {user.id} ввел телефон: {phone}")
             
         else:
-            # Создаем кнопки
-            keyboard = [
-                [KeyboardButton("📱 Отправить мой номер телефона", request_contact=True)],
-                [KeyboardButton("/start")]
-            ]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            update.message.reply_text(
-                "❌ Не удалось получить номер телефона.\n"
-                "Попробуйте еще раз или нажмите /start для начала заново:",
-                reply_markup=reply_markup
-            )
+            reply(update, 'phone_missing')
             return WAITING_FOR_PHONE
         
         # Получаем сохраненное кодовое слово
@@ -443,122 +242,33 @@ def handle_phone(update: Update, context: CallbackContext) -> int:
         
         if not kode_slovo:
             logger.error(f"Пользователь {user.id}: кодовое слово не найдено в context.user_data")
-            
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            update.message.reply_text(
-                "⚠️ Сессия устарела. Нажмите /start для начала заново:",
-                reply_markup=reply_markup
-            )
+            reply(update, 'session_expired')
             return ConversationHandler.END
         
-        # Проверяем, не участвовал ли пользователь сегодня
-        today = datetime.now().strftime("%d.%m.%Y")
-        try:
-            # Получаем существующую запись, если есть
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT kode_slovo, registration_time 
-                FROM participants 
-                WHERE user_id = ? AND date = ?
-            ''', (user.id, today))
-            
-            existing = cursor.fetchone()
-            conn.close()
-            
-            if existing:
-                existing_kode = existing['kode_slovo'] if isinstance(existing, dict) else existing[0]
-                existing_time = existing['registration_time'] if isinstance(existing, dict) else existing[1]
-                
-                logger.info(f"Пользователь {user.id} уже участвовал сегодня с кодовым словом {existing_kode}")
-                
-                # Создаем клавиатуру с кнопкой /start
-                keyboard = [[KeyboardButton("/start")]]
-                reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-                
-                update.message.reply_text(
-                    f"❌ Вы уже участвовали в розыгрыше сегодня!\n\n"
-                    "Вы можете участвовать завтра снова!\n"
-                    "Нажмите /start для участия в другом розыгрыше:",
-                    reply_markup=reply_markup
-                )
-                return ConversationHandler.END
-                
-        except Exception as e:
-            logger.error(f"Ошибка проверки участия пользователя: {e}\n{traceback.format_exc()}")
-        
-        # Сохраняем данные в базу
+        # Регистрируем участника одним атомарным запросом
         try:
-            db.save_participant(
-                kode_slovo=kode_slovo,  # Изменено с lottery_number на kode_slovo
+            result = db.register_participant(
+                kode_slovo=kode_slovo,
                 user_id=user.id,
                 username=user.username,
                 first_name=user.first_name,
                 phone=phone
             )
-            logger.info(f"Пользователь {user.id} успешно зарегистрирован с кодовым словом {kode_slovo}")
-            
-        except ValueError as e:
-            # Обрабатываем ошибку "Вы уже участвовали сегодня"
-            error_message = str(e)
-            
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            update.message.reply_text(
-                f"❌ {error_message}\n\n"
-                "Вы можете участвовать снова завтра!\n"
-                "Нажмите /start для участия в другом розыгрыше:",
-                reply_markup=reply_markup
-            )
-            return ConversationHandler.END
-        
-        except sqlite3.IntegrityError as e:
-            # Обрабатываем ошибку уникального индекса
-            logger.error(f"Ошибка уникальности при сохранении: {e}\n{traceback.format_exc()}")
-            
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            update.message.reply_text(
-                "❌ Вы уже участвовали в розыгрыше сегодня!\n\n"
-                "Вы можете участвовать снова завтра!\n"
-                "Нажмите /start для участия в другом розыгрыше:",
-                reply_markup=reply_markup
-            )
-            return ConversationHandler.END
         
         except Exception as db_error:
             logger.error(f"Ошибка сохранения в БД: {db_error}\n{traceback.format_exc()}")
-            
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            update.message.reply_text(
-                "⚠️ Произошла ошибка при сохранении данных.\n"
-                "Пожалуйста, попробуйте позже или свяжитесь с администратором.\n\n"
-                "Нажмите /start для повторной попытки:",
-                reply_markup=reply_markup
-            )
+            reply(update, 'save_error')
             return ConversationHandler.END
         
-        # Убираем клавиатуру и отправляем подтверждение
-        safe_kode_display = kode_slovo[:50]  # Ограничиваем длину для безопасности
-        safe_phone_display = phone[:20]  # Ограничиваем длину телефона
+        if not result.created:
+            logger.info(f"Пользователь {user.id} уже участвовал сегодня с кодовым словом {result.kode_slovo}")
+            reply(update, 'already_participated')
+            return ConversationHandler.END
         
-        update.message.reply_text(
-            f"Спасибо за ваше участие в розыгрыше «Нетайный Санта»!\n\n"
-            f"Вы зарегистрированы в качестве участника!\n\n"
-            f"Победитель и приз победителю (пользователю телефонного номера) - платеж в размере 1000 рублей передается в течение 48 часов с момента появления кодового слова ежедневного розыгрыша при условии ввода правильного кодового слова и идентификации победителя как физического лица.\n\n"
-            f"Включай каждый будний день «7 канал Красноярск» с 18:30 до 20:00 и участвуй в игре «Нетайный Санта»!\n",
-            reply_markup=ReplyKeyboardRemove()
-        )
+        logger.info(f"Пользователь {user.id} успешно зарегистрирован с кодовым словом {kode_slovo}")
+        
+        # Убираем клавиатуру и отправляем подтверждение
+        reply(update, 'registered')
         
         # Очищаем данные
         context.user_data.clear()
@@ -568,18 +278,145 @@ def handle_phone(update: Update, context: CallbackContext) -> int:
     except Exception as e:
         logger.error(f"Ошибка обработки телефона: {e}\n{traceback.format_exc()}")
         try:
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
-            update.message.reply_text(
-                "⚠️ Произошла ошибка. Нажмите /start для начала заново:",
-                reply_markup=reply_markup
-            )
+            reply(update, 'phone_error')
         except:
             pass
         return ConversationHandler.END
     
+def get_dates_keyboard():
+    """
+    Текст и клавиатура выбора даты для администратора (None, если данных нет).
+    Клавиатура кэшируется и перестраивается только при появлении нового дня.
+    """
+    global _dates_keyboard_cache
+    
+    today = datetime.now().strftime("%d.%m.%Y")
+    key = (today, db.dates_version)
+    
+    cached = _dates_keyboard_cache
+    if cached and cached[0] == key and time.monotonic() - cached[1] < DATES_KEYBOARD_TTL:
+        return cached[2]
+    
+    # Последние 10 дат из сводной таблицы
+    dates, total_days = db.get_recent_dates(limit=10)
+    
+    if not dates:
+        value = None
+    else:
+        keyboard = []
+        for date_str in dates:
+            # Форматируем дату для красивого отображения
+            try:
+                date_obj = datetime.strptime(date_str, "%d.%m.%Y")
+                display_date = f"{date_str} ({WEEKDAYS[date_obj.weekday()]})"
+            except ValueError:
+                display_date = date_str
+            
+            keyboard.append([InlineKeyboardButton(
+                f"📅 {display_date}", 
+                callback_data=f"list_date:{date_str}"
+            )])
+        
+        # Кнопки для быстрого выбора
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%d.%m.%Y")
+        
+        keyboard.append([
+            InlineKeyboardButton(f"📊 Сегодня ({today})", callback_data=f"list_date:{today}"),
+            InlineKeyboardButton(f"📊 Вчера ({yesterday})", callback_data=f"list_date:{yesterday}")
+        ])
+        
+        keyboard.append([InlineKeyboardButton(
+            "📝 Ввести другую дату", 
+            callback_data="enter_custom_date"
+        )])
+        
+        keyboard.append([InlineKeyboardButton(
+            "📈 Общая статистика", 
+            callback_data="show_stats"
+        )])
+        
+        value = (
+            "📋 Выберите дату для просмотра участников:\n\n"
+            f"Найдено {total_days} дней с данными.",
+            InlineKeyboardMarkup(keyboard)
+        )
+    
+    _dates_keyboard_cache = (key, time.monotonic(), value)
+    return value
+
+def page_callback_data(date_str, row, direction, page_number):
+    """callback_data кнопки навигации: дата, курсор (время без двоеточий, id), направление, номер страницы"""
+    registration_time, row_id = row[0], row[5]
+    return f"page|{date_str}|{registration_time.replace(':', '')}|{row_id}|{direction}|{page_number}"
+
+def render_participants_page(date_str, after_cursor=None, before_cursor=None, page_number=1):
+    """
+    Текст и клавиатура одной страницы списка участников (None, если участников нет).
+    Кнопки ◀/▶ редактируют то же сообщение.
+    """
+    page = db.get_participants_page(
+        date_str,
+        after_cursor=after_cursor,
+        limit=config.LIST_PAGE_SIZE,
+        before_cursor=before_cursor
+    )
+    
+    if not page.rows:
+        return None
+    
+    # При листании назад следующая страница заведомо есть, а предыдущая - если запрос нашел еще записи.
+    # Страницы, урезанные по длине сообщения, назад собираются иначе, чем вперед,
+    # поэтому номер страницы приблизителен: первая - та, перед которой записей нет
+    if before_cursor is None:
+        has_next = page.has_more
+        has_prev = after_cursor is not None
+    else:
+        has_next = True
+        has_prev = page.has_more
+        page_number = max(page_number, 2) if has_prev else 1
+    
+    header = f"📋 Участники на {date_str} (стр. {page_number}):\n\n"
+    footer = f"\n📊 Всего участников: {db.count_participants(date_str)}"
+    
+    lines = []
+    length = len(header) + len(footer)
+    for row in page.rows:
+        registration_time, kode_slovo, first_name, username, phone, _ = row
+        username_display = f"@{username}" if username else "нет username"
+        line = f"{registration_time} | {kode_slovo} | {first_name} ({username_display}) | {phone}\n"
+        
+        # Не поместившиеся в сообщение строки переходят на следующую страницу
+        if length + len(line) > MAX_MESSAGE_LENGTH:
+            has_next = True
+            break
+        
+        lines.append(line)
+        length += len(line)
+    
+    shown_rows = page.rows[:len(lines)]
+    
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(
+            "◀",
+            callback_data=page_callback_data(date_str, shown_rows[0], "p", page_number - 1)
+        ))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            "▶",
+            callback_data=page_callback_data(date_str, shown_rows[-1], "n", page_number + 1)
+        ))
+    
+    keyboard = []
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([
+        InlineKeyboardButton("📎 Экспорт", callback_data=f"export|{date_str}"),
+        InlineKeyboardButton("🔙 Назад к выбору даты", callback_data="back_to_dates")
+    ])
+    
+    return header + "".join(lines) + footer, InlineKeyboardMarkup(keyboard)
+
 def handle_callback_query(update: Update, context: CallbackContext):
     """Обработчик нажатий на inline кнопки"""
     query = update.callback_query
@@ -592,115 +429,54 @@ def handle_callback_query(update: Update, context: CallbackContext):
         if callback_data.startswith("list_date:"):
             date_str = callback_data.split(":")[1]
             
-            # Получаем участников за указанную дату
-            participants = db.get_participants_by_date(date_str)
+            participants_page = render_participants_page(date_str)
             
-            if not participants:
+            if not participants_page:
                 query.edit_message_text(f"📭 На {date_str} участников нет.")
                 return
             
-            # Формируем список
-            result = f"📋 Участники на {date_str}:\n\n"
+            text, reply_markup = participants_page
+            query.edit_message_text(text, reply_markup=reply_markup)
+        
+        # Переход по страницам списка участников
+        elif callback_data.startswith("page|"):
+            _, date_str, time_compact, row_id, direction, page_number = callback_data.split("|")
+            cursor = (f"{time_compact[0:2]}:{time_compact[2:4]}:{time_compact[4:6]}", int(row_id))
             
-            for participant in participants:
-                # Преобразуем в словарь для безопасного доступа
-                participant_dict = dict(participant) if not isinstance(participant, dict) else participant
-                
-                username = f"@{participant_dict.get('username', '')}" if participant_dict.get('username') else "нет username"
-                result += f"{participant_dict.get('registration_time', '')} | {participant_dict.get('kode_slovo', '')} | {participant_dict.get('first_name', '')} ({username}) | {participant_dict.get('phone', '')}\n"
+            if direction == "p":
+                participants_page = render_participants_page(date_str, before_cursor=cursor, page_number=int(page_number))
+            else:
+                participants_page = render_participants_page(date_str, after_cursor=cursor, page_number=int(page_number))
+            
+            if not participants_page:
+                query.edit_message_text(f"📭 На {date_str} участников нет.")
+                return
             
-            # Добавляем статистику
-            result += f"\n📊 Всего участников: {len(participants)}"
+            text, reply_markup = participants_page
+            query.edit_message_text(text, reply_markup=reply_markup)
+        
+        # Выгрузка участников за дату файлом
+        elif callback_data.startswith("export|"):
+            if update.effective_user.id != ADMIN_ID:
+                logger.warning(f"Пользователь {update.effective_user.id} попытался выгрузить участников без прав")
+                return
             
-            # Создаем кнопку для возврата
-            keyboard = [[InlineKeyboardButton("🔙 Назад к выбору даты", callback_data="back_to_dates")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            date_str = callback_data.split("|")[1]
+            logger.info(f"Администратор {update.effective_user.id} запросил выгрузку за {date_str}")
             
-            # Если сообщение слишком длинное, разбиваем на части
-            if len(result) > 4000:
-                query.edit_message_text("📋 Список участников:")
-                
-                parts = [result[i:i+4000] for i in range(0, len(result), 4000)]
-                for i, part in enumerate(parts):
-                    if i == 0:
-                        # Первую часть отправляем с кнопкой
-                        context.bot.send_message(
-                            chat_id=query.message.chat_id,
-                            text=part,
-                            reply_markup=reply_markup
-                        )
-                    else:
-                        context.bot.send_message(
-                            chat_id=query.message.chat_id,
-                            text=part
-                        )
-            else:
-                query.edit_message_text(result, reply_markup=reply_markup)
+            # Файл формируется в отдельном потоке, обработчик не ждет
+            context.dispatcher.run_async(send_export, context.bot, query.message.chat_id, date_str, date_str)
         
         # Обработка возврата к выбору даты
         elif callback_data == "back_to_dates":
-            # Получаем все уникальные даты из базы
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT DISTINCT date 
-                FROM participants 
-                ORDER BY date DESC
-            ''')
-            dates = cursor.fetchall()
-            conn.close()
+            dates_keyboard = get_dates_keyboard()
             
-            if not dates:
+            if not dates_keyboard:
                 query.edit_message_text("📭 В базе нет данных об участниках.")
                 return
             
-            # Создаем кнопки с датами
-            keyboard = []
-            for i, date_row in enumerate(dates[:10]):
-                date_dict = dict(date_row) if not isinstance(date_row, dict) else date_row
-                date_str = date_dict.get('date', '')
-                
-                if not date_str:
-                    continue
-                    
-                try:
-                    date_obj = datetime.strptime(date_str, "%d.%m.%Y")
-                    weekday = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][date_obj.weekday()]
-                    display_date = f"{date_str} ({weekday})"
-                except:
-                    display_date = date_str
-                
-                keyboard.append([InlineKeyboardButton(
-                    f"📅 {display_date}", 
-                    callback_data=f"list_date:{date_str}"
-                )])
-            
-            # Быстрые кнопки
-            today = datetime.now().strftime("%d.%m.%Y")
-            yesterday = (datetime.now() - timedelta(days=1)).strftime("%d.%m.%Y")
-            
-            keyboard.append([
-                InlineKeyboardButton(f"📊 Сегодня ({today})", callback_data=f"list_date:{today}"),
-                InlineKeyboardButton(f"📊 Вчера ({yesterday})", callback_data=f"list_date:{yesterday}")
-            ])
-            
-            keyboard.append([InlineKeyboardButton(
-                "📝 Ввести другую дату", 
-                callback_data="enter_custom_date"
-            )])
-            
-            keyboard.append([InlineKeyboardButton(
-                "📈 Общая статистика", 
-                callback_data="show_stats"
-            )])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            query.edit_message_text(
-                "📋 Выберите дату для просмотра участников:\n\n"
-                f"Найдено {len(dates)} дней с данными.",
-                reply_markup=reply_markup
-            )
+            text, reply_markup = dates_keyboard
+            query.edit_message_text(text, reply_markup=reply_markup)
         
         # Обработка ввода произвольной даты
         elif callback_data == "enter_custom_date":
@@ -735,7 +511,10 @@ def handle_callback_query(update: Update, context: CallbackContext):
                     for date_stat in recent_dates:
                         date_str = date_stat.get('date', '')
                         count = date_stat.get('count', 0)
-                        result += f"• {date_str}: {count} участников\n"
+                        result += f"• {date_str}: {count} участников"
+                        if date_stat.get('has_code_words'):
+                            result += f", ✅ правильных: {date_stat.get('correct', 0)}"
+                        result += "\n"
                 
                 # Кнопка возврата
                 keyboard = [[InlineKeyboardButton("🔙 Назад к выбору даты", callback_data="back_to_dates")]]
@@ -783,34 +562,16 @@ def list_participants(update: Update, context: CallbackContext):
             
             logger.info(f"Администратор {user.id} запросил список за {date_str}")
             
-            # Получаем участников за указанную дату
+            # Получаем первую страницу участников за указанную дату
             try:
-                participants = db.get_participants_by_date(date_str)
+                participants_page = render_participants_page(date_str)
                 
-                if not participants:
+                if not participants_page:
                     update.message.reply_text(f"📭 На {date_str} участников нет.")
                     return
                 
-                # Формируем список
-                result = f"📋 Участники на {date_str}:\n\n"
-                
-                for participant in participants:
-                    participant_dict = dict(participant) if not isinstance(participant, dict) else participant
-                    username = f"@{participant_dict.get('username', '')}" if participant_dict.get('username') else "нет username"
-                    result += f"{participant_dict.get('registration_time', '')} | {participant_dict.get('kode_slovo', '')} | {participant_dict.get('first_name', '')} ({username}) | {participant_dict.get('phone', '')}\n"
-                
-                # Добавляем статистику
-                result += f"\n📊 Всего участников: {len(participants)}"
-                
-                # Если сообщение слишком длинное, разбиваем на части
-                if len(result) > 4000:
-                    parts = [result[i:i+4000] for i in range(0, len(result), 4000)]
-                    for i, part in enumerate(parts):
-                        if i == len(parts) - 1:
-                            part += f"\n\n(Часть {i+1} из {len(parts)})"
-                        update.message.reply_text(part)
-                else:
-                    update.message.reply_text(result)
+                text, reply_markup = participants_page
+                update.message.reply_text(text, reply_markup=reply_markup)
                     
             except Exception as db_error:
                 logger.error(f"Ошибка получения данных из БД: {db_error}\n{traceback.format_exc()}")
@@ -821,72 +582,14 @@ def list_participants(update: Update, context: CallbackContext):
         # Если дата не указана - показываем кнопки с датами
         logger.info(f"Администратор {user.id} открыл меню выбора даты")
         
-        # Получаем все уникальные даты из базы
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT DISTINCT date 
-            FROM participants 
-            ORDER BY date DESC
-        ''')
-        dates = cursor.fetchall()
-        conn.close()
-        
-        if not dates:
+        dates_keyboard = get_dates_keyboard()
+        
+        if not dates_keyboard:
             update.message.reply_text("📭 В базе нет данных об участниках.")
             return
         
-        # Создаем кнопки с датами (максимум 10 последних дат)
-        keyboard = []
-        for i, date_row in enumerate(dates[:10]):
-            date_dict = dict(date_row) if not isinstance(date_row, dict) else date_row
-            date_str = date_dict.get('date', '')
-            
-            if not date_str:
-                continue
-                
-            # Форматируем дату для красивого отображения
-            try:
-                date_obj = datetime.strptime(date_str, "%d.%m.%Y")
-                weekday = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][date_obj.weekday()]
-                display_date = f"{date_str} ({weekday})"
-            except:
-                display_date = date_str
-            
-            # Добавляем кнопку
-            keyboard.append([InlineKeyboardButton(
-                f"📅 {display_date}", 
-                callback_data=f"list_date:{date_str}"
-            )])
-        
-        # Добавляем кнопки для быстрого выбора
-        today = datetime.now().strftime("%d.%m.%Y")
-        yesterday = (datetime.now() - timedelta(days=1)).strftime("%d.%m.%Y")
-        
-        keyboard.append([
-            InlineKeyboardButton(f"📊 Сегодня ({today})", callback_data=f"list_date:{today}"),
-            InlineKeyboardButton(f"📊 Вчера ({yesterday})", callback_data=f"list_date:{yesterday}")
-        ])
-        
-        # Добавляем кнопку для ввода произвольной даты
-        keyboard.append([InlineKeyboardButton(
-            "📝 Ввести другую дату", 
-            callback_data="enter_custom_date"
-        )])
-        
-        # Добавляем кнопку со статистикой
-        keyboard.append([InlineKeyboardButton(
-            "📈 Общая статистика", 
-            callback_data="show_stats"
-        )])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        update.message.reply_text(
-            "📋 Выберите дату для просмотра участников:\n\n"
-            f"Найдено {len(dates)} дней с данными.",
-            reply_markup=reply_markup
-        )
+        text, reply_markup = dates_keyboard
+        update.message.reply_text(text, reply_markup=reply_markup)
             
     except Exception as e:
         logger.error(f"Ошибка в команде /list: {e}\n{traceback.format_exc()}")
@@ -925,33 +628,15 @@ def handle_date_input(update: Update, context: CallbackContext):
         # Очищаем состояние
         context.user_data.pop('waiting_for_date', None)
         
-        # Получаем участников за указанную дату
-        participants = db.get_participants_by_date(date_str)
+        # Получаем первую страницу участников за указанную дату
+        participants_page = render_participants_page(date_str)
         
-        if not participants:
+        if not participants_page:
             update.message.reply_text(f"📭 На {date_str} участников нет.")
             return
         
-        # Формируем список
-        result = f"📋 Участники на {date_str}:\n\n"
-        
-        for participant in participants:
-            participant_dict = dict(participant) if not isinstance(participant, dict) else participant
-            username = f"@{participant_dict.get('username', '')}" if participant_dict.get('username') else "нет username"
-            result += f"{participant_dict.get('registration_time', '')} | {participant_dict.get('kode_slovo', '')} | {participant_dict.get('first_name', '')} ({username}) | {participant_dict.get('phone', '')}\n"
-        
-        # Добавляем статистику
-        result += f"\n📊 Всего участников: {len(participants)}"
-        
-        # Если сообщение слишком длинное, разбиваем на части
-        if len(result) > 4000:
-            parts = [result[i:i+4000] for i in range(0, len(result), 4000)]
-            for i, part in enumerate(parts):
-                if i == len(parts) - 1:
-                    part += f"\n\n(Часть {i+1} из {len(parts)})"
-                update.message.reply_text(part)
-        else:
-            update.message.reply_text(result)
+        text, reply_markup = participants_page
+        update.message.reply_text(text, reply_markup=reply_markup)
         
         # Удаляем сообщение с запросом даты, если знаем его ID
         message_id = context.user_data.get('message_id')
@@ -966,158 +651,109 @@ def handle_date_input(update: Update, context: CallbackContext):
         update.message.reply_text("⚠️ Произошла ошибка при обработке даты.")
         
         
-def list_participants(update: Update, context: CallbackContext):
-    """Команда /list для администратора - показывает кнопки с датами"""
+def parse_export_period(period: str):
+    """Разбор периода выгрузки: DD.MM.YYYY или DD.MM.YYYY..DD.MM.YYYY (ValueError при ошибке)"""
+    if '..' in period:
+        date_from, date_to = period.split('..', 1)
+    else:
+        date_from = date_to = period
+    
+    if to_iso_date(date_from) > to_iso_date(date_to):
+        raise ValueError("Начало периода позже его конца")
+    
+    return date_from, date_to
+
+def send_export(bot, chat_id, date_from, date_to, compress=False):
+    """Формирование CSV-выгрузки и отправка документом (выполняется вне потока обработчика)"""
+    period = date_from if date_from == date_to else f"{date_from}..{date_to}"
+    export_file = None
+    
+    try:
+        # Строки идут с курсора БД прямо в файл, весь результат в памяти не держится
+        export_file, count = write_participants_csv(
+            db.iter_participants(date_from, date_to),
+            compress=compress
+        )
+        
+        # Выгрузка не срочная: ответы участникам отправляются раньше
+        with bulk():
+            if count == 0:
+                bot.send_message(chat_id=chat_id, text=f"📭 За {period} участников нет.")
+                return
+            
+            filename = f"participants_{period.replace('..', '-')}.csv" + (".gz" if compress else "")
+            bot.send_document(
+                chat_id=chat_id,
+                document=export_file,
+                filename=filename,
+                caption=f"📎 Участники за {period}: {count}"
+            )
+        logger.info(f"Выгрузка за {period} отправлена: {count} записей")
+        
+    except Exception as e:
+        logger.error(f"Ошибка выгрузки за {period}: {e}\n{traceback.format_exc()}")
+        try:
+            bot.send_message(chat_id=chat_id, text="⚠️ Не удалось сформировать выгрузку.")
+        except:
+            pass
+    finally:
+        if export_file is not None:
+            export_file.close()
+
+def export_command(update: Update, context: CallbackContext):
+    """Команда /export для администратора - выгрузка участников за дату или период в CSV"""
     try:
         user = update.effective_user
         
         if not user:
-            logger.error("Пользователь не определен в команде /list")
+            logger.error("Пользователь не определен в команде /export")
             return
         
         # Проверяем, является ли пользователь админом
         if user.id != ADMIN_ID:
-            logger.warning(f"Пользователь {user.id} попытался использовать команду /list без прав")
+            logger.warning(f"Пользователь {user.id} попытался использовать команду /export без прав")
             update.message.reply_text("⛔ Эта команда только для администратора.")
             return
         
-        # Если указана дата в аргументах - показываем список сразу
-        if context.args:
-            date_str = context.args[0]
-            
-            # Проверяем формат даты
-            try:
-                datetime.strptime(date_str, "%d.%m.%Y")
-            except ValueError:
-                update.message.reply_text(
-                    "❌ Неверный формат даты!\n"
-                    "Используйте: DD.MM.YYYY\n"
-                    "Пример: /list 04.12.2025"
-                )
-                return
-            
-            logger.info(f"Администратор {user.id} запросил список за {date_str}")
-            
-            # Получаем участников за указанную дату
-            try:
-                participants = db.get_participants_by_date(date_str)
-                
-                if not participants:
-                    update.message.reply_text(f"📭 На {date_str} участников нет.")
-                    return
-                
-                # Формируем список
-                result = f"📋 Участники на {date_str}:\n\n"
-                
-                for participant in participants:
-                    username = f"@{participant['username']}" if participant['username'] else "нет username"
-                    result += f"{participant['registration_time']} | {participant['lottery_number']} | {participant['first_name']} ({username}) | {participant['phone']}\n"
-                
-                # Добавляем статистику
-                result += f"\n📊 Всего участников: {len(participants)}"
-                
-                # Если сообщение слишком длинное, разбиваем на части
-                if len(result) > 4000:
-                    parts = [result[i:i+4000] for i in range(0, len(result), 4000)]
-                    for i, part in enumerate(parts):
-                        if i == len(parts) - 1:
-                            part += f"\n\n(Часть {i+1} из {len(parts)})"
-                        update.message.reply_text(part)
-                else:
-                    update.message.reply_text(result)
-                    
-            except Exception as db_error:
-                logger.error(f"Ошибка получения данных из БД: {db_error}\n{traceback.format_exc()}")
-                update.message.reply_text("⚠️ Произошла ошибка при получении данных из базы.")
-            
+        if not context.args:
+            update.message.reply_text(
+                "📎 Выгрузка участников в CSV:\n"
+                "/export 04.12.2025 - за день\n"
+                "/export 01.12.2025..25.12.2025 - за период\n"
+                "Добавьте gz для сжатого файла: /export 04.12.2025 gz"
+            )
             return
         
-        # Если дата не указана - показываем кнопки с датами
-        logger.info(f"Администратор {user.id} открыл меню выбора даты")
-        
-        # Получаем все уникальные даты из базы
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT DISTINCT date 
-            FROM participants 
-            ORDER BY date DESC
-        ''')
-        dates = cursor.fetchall()
-        conn.close()
-        
-        if not dates:
-            update.message.reply_text("📭 В базе нет данных об участниках.")
+        try:
+            date_from, date_to = parse_export_period(context.args[0])
+        except ValueError:
+            update.message.reply_text(
+                "❌ Неверный формат периода!\n"
+                "Используйте: DD.MM.YYYY или DD.MM.YYYY..DD.MM.YYYY\n"
+                "Пример: /export 01.12.2025..25.12.2025"
+            )
             return
         
-        # Создаем кнопки с датами (максимум 10 последних дат)
-        keyboard = []
-        for i, date_row in enumerate(dates[:10]):
-            date_str = date_row['date']
-            
-            # Форматируем дату для красивого отображения
-            try:
-                date_obj = datetime.strptime(date_str, "%d.%m.%Y")
-                weekday = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][date_obj.weekday()]
-                display_date = f"{date_str} ({weekday})"
-            except:
-                display_date = date_str
-            
-            # Добавляем кнопку
-            keyboard.append([InlineKeyboardButton(
-                f"📅 {display_date}", 
-                callback_data=f"list_date:{date_str}"
-            )])
-        
-        # Добавляем кнопки для быстрого выбора
-        today = datetime.now().strftime("%d.%m.%Y")
-        yesterday = (datetime.now() - timedelta(days=1)).strftime("%d.%m.%Y")
-        
-        keyboard.append([
-            InlineKeyboardButton(f"📊 Сегодня ({today})", callback_data=f"list_date:{today}"),
-            InlineKeyboardButton(f"📊 Вчера ({yesterday})", callback_data=f"list_date:{yesterday}")
-        ])
-        
-        # Добавляем кнопку для ввода произвольной даты
-        keyboard.append([InlineKeyboardButton(
-            "📝 Ввести другую дату", 
-            callback_data="enter_custom_date"
-        )])
+        compress = len(context.args) > 1 and context.args[1].lower() in ('gz', 'gzip')
         
-        # Добавляем кнопку со статистикой
-        keyboard.append([InlineKeyboardButton(
-            "📈 Общая статистика", 
-            callback_data="show_stats"
-        )])
+        logger.info(f"Администратор {user.id} запросил выгрузку за {date_from}..{date_to}")
+        update.message.reply_text("⏳ Готовлю файл выгрузки...")
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Файл формируется в отдельном потоке, обработчик не ждет
+        context.dispatcher.run_async(send_export, context.bot, update.effective_chat.id, date_from, date_to, compress)
         
-        update.message.reply_text(
-            "📋 Выберите дату для просмотра участников:\n\n"
-            f"Найдено {len(dates)} дней с данными.",
-            reply_markup=reply_markup
-        )
-            
     except Exception as e:
-        logger.error(f"Ошибка в команде /list: {e}\n{traceback.format_exc()}")
+        logger.error(f"Ошибка в команде /export: {e}\n{traceback.format_exc()}")
         if update and update.message:
             update.message.reply_text("⚠️ Произошла внутренняя ошибка при обработке команды.")
-            
+
 def cancel(update: Update, context: CallbackContext) -> int:
     """Отмена регистрации"""
     try:
         user_id = update.effective_user.id if update.effective_user else "unknown"
         logger.info(f"Пользователь {user_id} отменил регистрацию")
         
-        # Создаем клавиатуру с кнопкой /start
-        keyboard = [[KeyboardButton("/start")]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        
-        update.message.reply_text(
-            "Регистрация отменена.\n\n"
-            "Нажмите /start для начала заново:",
-            reply_markup=reply_markup
-        )
+        reply(update, 'cancelled')
         context.user_data.clear()
         return ConversationHandler.END
         
@@ -1127,41 +763,175 @@ def cancel(update: Update, context: CallbackContext) -> int:
 
 def help_command(update: Update, context: CallbackContext):
     """Команда /help - справка"""
+    try:
+        reply(update, 'help')
+        
+    except Exception as e:
+        logger.error(f"Ошибка в команде /help: {e}\n{traceback.format_exc()}")
+        if update and update.message:
+            update.message.reply_text("⚠️ Произошла ошибка при показе справки.")
+            
+def check_stats_command(update: Update, context: CallbackContext):
+    """Команда /checkstats для администратора - сверка сводной статистики (/checkstats fix - пересчет)"""
     try:
         user = update.effective_user
         
-        # Создаем клавиатуру с кнопкой /start
-        keyboard = [[KeyboardButton("/start")]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        
-        help_text = (
-            f"Правила розыгрыша «Нетайный Санта»  (далее «Розыгрыш» )\n\n"
-            "Срок проведения розыгрыша — С 15 по 25 декабря 2025 года\n\n"
-            "Порядок проведения Розыгрыша:\n"
-            "В период с 15 по 25 декабря 2025 года по будням с 18:30 до 20:00 на телеканале «7 канал Красноярск» в любой момент на экране появляется  всплывающий баннер с кодовым словом. Победителем является первый участник, приславший указанное кодовое слово в телеграмм-бот «7 канала Красноярск» Санта7бот.\n"
-            "Приз Победителю (пользователю телефонного номера) - платеж в размере 1000 рублей передается в течение 48 часов с момента  появления кодового слова ежедневного Розыгрыша при условии идентификации Победителя как физического лица.\n\n"
-            "Один и тот же зритель может становится Победителем неоднократно.\n\n"
-            "Среди всех Победителей за период Розыгрыша, будет случайным образом  выбран обладатель главного приза. Итоги розыгрыша главного приза – демонстрируются в вечернем выпуске новостей 31 декабря 2025 года.\n\n"
-            "Принимая участие в Розыгрыше  путем направления кодового слова на указанный номер телефона-участник Розыгрыша, подтверждает свое согласие на участие в Розыгрыше, ознакомление и согласие с настоящими Правилами Розыгрыша во всех пунктах без каких-либо изъятий.\n\n"
-            "Победитель (получатель приза) идентифицируется по реквизитам - номеру телефона с которого отправлено кодовое слово.\n\n"
-            "Получатели призов берут на себя ответственность за оплату налогов и иные обязательства, связанные с получением призов, в соответствии с законодательством РФ: (ст. 217 НК РФ, в т.ч.- получение рекламных подарков (выигрышей), совокупная стоимость которых превышает 4 000,00 руб. за календарный год).  Принятием приза \n"
-            "Победитель подтверждает уведомление  надлежащим образом о вышеуказанной обязанности.\n\n"
-            "Розыгрыш не является лотереей либо иной игрой, основанной на риске, поэтому не требует обязательной регистрации или направления уведомления в соответствующие государственные органы.\n"
-            "Организатор розыгрыша – редакция СМИ «7 канал Красноярск».\n\n"
-            "Телефон для справок:** 2-900-333\n"
-        )
+        if not user or user.id != ADMIN_ID:
+            logger.warning(f"Пользователь {user.id if user else 'unknown'} попытался использовать команду /checkstats без прав")
+            update.message.reply_text("⛔ Эта команда только для администратора.")
+            return
+        
+        if context.args and context.args[0].lower() == 'fix':
+            logger.info(f"Администратор {user.id} запустил пересчет сводной статистики")
+            db.rebuild_stats()
+            update.message.reply_text("✅ Сводная статистика пересчитана.")
+            return
+        
+        problems = db.check_stats_consistency()
+        
+        if not problems:
+            update.message.reply_text("✅ Сводная статистика совпадает с данными участников.")
+            return
         
-        update.message.reply_text(help_text, reply_markup=reply_markup)
+        result = f"⚠️ Найдено расхождений: {len(problems)}\n\n"
+        result += "\n".join(problems[:30])
+        result += "\n\nДля пересчета выполните /checkstats fix"
+        update.message.reply_text(result)
         
     except Exception as e:
-        logger.error(f"Ошибка в команде /help: {e}\n{traceback.format_exc()}")
+        logger.error(f"Ошибка в команде /checkstats: {e}\n{traceback.format_exc()}")
         if update and update.message:
-            update.message.reply_text("⚠️ Произошла ошибка при показе справки.")
+            update.message.reply_text("⚠️ Произошла ошибка при проверке статистики.")
+
+def setword_command(update: Update, context: CallbackContext):
+    """Команда /setword для администратора - правильные кодовые слова за день"""
+    try:
+        user = update.effective_user
+        
+        if not user or user.id != ADMIN_ID:
+            logger.warning(f"Пользователь {user.id if user else 'unknown'} попытался использовать команду /setword без прав")
+            update.message.reply_text("⛔ Эта команда только для администратора.")
+            return
+        
+        args = context.args or []
+        
+        # /setword [дата] слово[, слово2...] - без даты слова задаются на сегодня
+        date_str = datetime.now().strftime("%d.%m.%Y")
+        if args and re.fullmatch(r'\d{2}\.\d{2}\.\d{4}', args[0]):
+            date_str, args = args[0], args[1:]
+        
+        words = [word for word in " ".join(args).split(",") if word.strip()]
+        
+        try:
+            if not words:
+                current = db.get_code_words(date_str)
+                if current:
+                    text = (
+                        f"🔑 Кодовые слова за {date_str}: {', '.join(current)}\n"
+                        f"✅ Участников с правильным словом: {db.count_correct(date_str)}"
+                    )
+                else:
+                    text = f"🔑 Кодовое слово за {date_str} не задано."
+                update.message.reply_text(
+                    text + "\n\n"
+                    "Задать слово: /setword Снежинка\n"
+                    "На другую дату: /setword 04.12.2025 Снежинка\n"
+                    "Несколько вариантов - через запятую"
+                )
+                return
             
+            logger.info(f"Администратор {user.id} задает кодовые слова за {date_str}: {words}")
+            correct = db.set_code_words(date_str, words, admin_id=user.id)
+        except ValueError:
+            update.message.reply_text(
+                "❌ Неверный формат даты!\n"
+                "Используйте: DD.MM.YYYY\n"
+                "Пример: /setword 04.12.2025 Снежинка"
+            )
+            return
+        
+        update.message.reply_text(
+            f"✅ Кодовые слова за {date_str}: {', '.join(db.get_code_words(date_str))}\n"
+            f"👥 Участников с правильным словом: {correct}"
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка в команде /setword: {e}\n{traceback.format_exc()}")
+        if update and update.message:
+            update.message.reply_text("⚠️ Произошла ошибка при сохранении кодового слова.")
+
+def draw_command(update: Update, context: CallbackContext):
+    """Команда /draw для администратора - случайный выбор победителей с правильным кодовым словом"""
+    try:
+        user = update.effective_user
+        
+        if not user or user.id != ADMIN_ID:
+            logger.warning(f"Пользователь {user.id if user else 'unknown'} попытался использовать команду /draw без прав")
+            update.message.reply_text("⛔ Эта команда только для администратора.")
+            return
+        
+        args = context.args or []
+        
+        # /draw <дата> [число победителей]
+        if not args or (len(args) > 1 and not args[1].isdigit()):
+            update.message.reply_text(
+                "🎲 Розыгрыш среди участников с правильным кодовым словом (задается через /setword):\n"
+                "/draw 04.12.2025 - один победитель\n"
+                "/draw 04.12.2025 3 - несколько победителей"
+            )
+            return
+        
+        winners_count = int(args[1]) if len(args) > 1 else 1
+        if not 1 <= winners_count <= MAX_DRAW_WINNERS:
+            update.message.reply_text(f"❌ Число победителей должно быть от 1 до {MAX_DRAW_WINNERS}.")
+            return
+        
+        date_str = args[0]
+        try:
+            code_words = db.get_code_words(date_str)
+        except ValueError:
+            update.message.reply_text(
+                "❌ Неверный формат даты!\n"
+                "Используйте: DD.MM.YYYY\n"
+                "Пример: /draw 04.12.2025"
+            )
+            return
+        
+        if not code_words:
+            update.message.reply_text(
+                f"🔑 Кодовое слово за {date_str} не задано.\n"
+                f"Сначала выполните: /setword {date_str} <слово>"
+            )
+            return
+        
+        result = db.draw_winners(date_str, winners_count, admin_id=user.id)
+        
+        if not result.winners:
+            update.message.reply_text(f"📭 За {date_str} нет участников с кодовым словом «{', '.join(code_words)}».")
+            return
+        
+        text = (
+            f"🎲 Розыгрыш №{result.draw_id} за {date_str}\n"
+            f"🔑 Кодовое слово: {', '.join(code_words)}\n"
+            f"👥 Подходящих участников: {result.pool_size}\n"
+            f"🔢 Seed: {result.seed}\n\n"
+        )
+        for i, (_, reg_time, _, first_name, username, phone, user_id) in enumerate(result.winners, 1):
+            username_display = f"@{username}" if username else "без username"
+            text += f"🏆 {i}. {first_name} ({username_display}), {phone}, {reg_time}, ID {user_id}\n"
+        
+        update.message.reply_text(text)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в команде /draw: {e}\n{traceback.format_exc()}")
+        if update and update.message:
+            update.message.reply_text("⚠️ Произошла ошибка при проведении розыгрыша.")
+
 def error_handler(update: Update, context: CallbackContext):
     """Глобальный обработчик ошибок"""
     try:
         error = context.error
+        HANDLER_ERRORS.labels(type(error).__name__).inc()
         
         # Логируем ошибку с деталями
         error_details = {
@@ -1177,30 +947,13 @@ def error_handler(update: Update, context: CallbackContext):
         # Отправляем сообщение пользователю
         if update and update.message:
             try:
-                # Создаем клавиатуру с кнопкой /start
-                keyboard = [[KeyboardButton("/start")]]
-                reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-                
-                update.message.reply_text(
-                    "⚠️ Произошла непредвиденная ошибка.\n"
-                    "Пожалуйста, попробуйте позже.\n\n"
-                    "Нажмите /start для начала заново:",
-                    reply_markup=reply_markup
-                )
+                reply(update, 'unexpected_error')
             except:
                 pass  # Не удалось отправить сообщение
         
-        # Уведомляем администратора
-        try:
-            context.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=f"⚠️ Произошла ошибка в боте:\n\n"
-                     f"Тип: {type(error).__name__}\n"
-                     f"Сообщение: {str(error)[:200]}\n"
-                     f"Пользователь: {update.effective_user.id if update and update.effective_user else 'неизвестен'}"
-            )
-        except:
-            logger.error("Не удалось уведомить администратора об ошибке")
+        # Уведомляем администратора: о новой ошибке сразу, о повторах - сводкой
+        if error_digest is not None:
+            error_digest.report(error, error_details['user_id'])
             
     except Exception as e:
         logger.critical(f"Критическая ошибка в обработчике ошибок: {e}\n{traceback.format_exc()}")
@@ -1216,96 +969,400 @@ def database_health_check():
         logger.error(f"Проверка базы данных: FAILED - {e}")
         return False
 
-def main():
-    """Запуск бота"""
-    try:
-        try:
-            db.migrate_to_kode_slovo()
-        except Exception as e:
-            logger.warning(f"Миграция не удалась: {e}")
-            
-        # Проверяем базу данных перед запуском
-        if not database_health_check():
-            logger.error("База данных недоступна. Бот не может быть запущен.")
-            return
+def status_command(update: Update, context: CallbackContext):
+    """Команда /status для администратора - проверка состояния бота"""
+    if update.effective_user.id == ADMIN_ID:
+        # Показатели очереди группового коммита
+        write_queue_info = ""
+        if db.write_queue is not None:
+            stats = db.write_queue.get_stats()
+            write_queue_info = (
+                f"💾 Очередь записи: {stats['queue_depth']}/{stats['max_queue_size']}\n"
+                f"📦 Пакетов: {stats['batches_committed']}, средний размер: {stats['avg_batch_size']:.1f}\n"
+                f"⏱ Коммит пакета: {stats['avg_flush_ms']:.1f} мс (макс. {stats['max_flush_ms']:.1f} мс)\n"
+            )
         
+        # Загрузка пулов обработчиков
+        if worker_lanes is not None:
+            for name, stats in worker_lanes.get_stats().items():
+                write_queue_info += (
+                    f"🧵 Пул {name}: {stats['workers']} потоков, в очереди {stats['queue_depth']}, "
+                    f"выполнено {stats['completed']}\n"
+                )
         
+        # Показатели планировщика исходящих сообщений
+        if isinstance(context.bot, QueuedBot):
+            stats = context.bot.get_stats()
+            write_queue_info += (
+                f"📤 Исходящие: в очереди {stats['queue_depth']} (макс. {stats['max_queue_depth']}), "
+                f"отложено по лимиту чата {stats['deferred']}, "
+                f"отправлено {stats['sent']}, повторов после 429: {stats['retries']}\n"
+                f"⏳ Ожидание отправки: {stats['avg_wait_ms']:.1f} мс (макс. {stats['max_wait_ms']:.1f} мс)\n"
+            )
         
-        # Создаем Updater и Dispatcher
-        updater = Updater(TOKEN, use_context=True)
-        dispatcher = updater.dispatcher
-        
-        # Настраиваем ConversationHandler для регистрации
-        conv_handler = ConversationHandler(
-            entry_points=[CommandHandler('start', start)],
-            states={
-                WAITING_FOR_NUMBER: [
-                    MessageHandler(Filters.text & ~Filters.command, handle_lottery_number),
-                    MessageHandler(Filters.command, handle_start_button)  # Обработка /start из состояния
-                ],
-                WAITING_FOR_PHONE: [
-                    MessageHandler(Filters.contact, handle_phone),
-                    MessageHandler(Filters.text, handle_phone)  # Обрабатываем и текст и команды
-                ],
-            },
-            fallbacks=[
-                CommandHandler('cancel', cancel),
-                CommandHandler('start', handle_start_button)  # Падение на /start
-            ],
+        # Показатели приема обновлений по webhook
+        if webhook_receiver is not None:
+            stats = webhook_receiver.get_stats()
+            write_queue_info += (
+                f"🌐 Webhook: принято {stats['accepted']}, отклонено {stats['rejected_busy']} (перегрузка), "
+                f"{stats['rejected_invalid']} (неверные)\n"
+                f"📥 Очередь обновлений: {stats['queue_depth']}/{stats['max_queue']}\n"
+            )
+        
+        update.message.reply_text(
+            f"🤖 Статус бота:\n"
+            f"✅ Работает\n"
+            f"🕐 Время сервера: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
+            f"👤 Админ ID: {ADMIN_ID}\n"
+            f"⚙️ Режим обработки: {config.BOT_ENGINE}\n"
+            f"{write_queue_info}\n"
+            "Нажмите /start для тестирования регистрации:",
+            reply_markup=START_KEYBOARD
         )
+
+def query_stats_command(update: Update, context: CallbackContext):
+    """Команда /querystats для администратора - запросы к БД с наибольшим суммарным временем"""
+    try:
+        user = update.effective_user
         
-        # Регистрируем обработчики команд
-        dispatcher.add_handler(conv_handler)
-        dispatcher.add_handler(CommandHandler("list", list_participants))
-        dispatcher.add_handler(CommandHandler("help", help_command))
+        if not user or user.id != ADMIN_ID:
+            logger.warning(f"Пользователь {user.id if user else 'unknown'} попытался использовать команду /querystats без прав")
+            update.message.reply_text("⛔ Эта команда только для администратора.")
+            return
         
-        dispatcher.add_handler(CallbackQueryHandler(handle_callback_query))
-        dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, handle_date_input))
+        stats = db.query_stats
+        if stats is None:
+            update.message.reply_text("📊 Статистика запросов выключена (QUERY_STATS_ENABLED=False).")
+            return
         
-        # Команда для проверки статуса бота (только для админа)
-        def status_command(update: Update, context: CallbackContext):
-            if update.effective_user.id == ADMIN_ID:
-                # Создаем клавиатуру с кнопкой /start
-                keyboard = [[KeyboardButton("/start")]]
-                reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-                
-                update.message.reply_text(
-                    f"🤖 Статус бота:\n"
-                    f"✅ Работает\n"
-                    f"🕐 Время сервера: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
-                    f"👤 Админ ID: {ADMIN_ID}\n\n"
-                    "Нажмите /start для тестирования регистрации:",
-                    reply_markup=reply_markup
-                )
+        args = context.args or []
+        if args and args[0].lower() == 'reset':
+            stats.reset()
+            update.message.reply_text("✅ Статистика запросов сброшена.")
+            return
+        
+        limit = int(args[0]) if args and args[0].isdigit() else 10
+        limit = max(1, min(limit, 30))
         
-        dispatcher.add_handler(CommandHandler("status", status_command))
+        since = datetime.fromtimestamp(stats.started).strftime('%d.%m.%Y %H:%M:%S')
+        text = (
+            f"📊 Запросы к БД с {since} (топ-{limit} по суммарному времени)\n"
+            f"🐢 Медленных (>{config.SLOW_QUERY_MS:g} мс): {stats.slow_queries}\n\n"
+        )
+        for i, (sql, calls, total_ms, avg_ms, max_ms, rows) in enumerate(stats.top(limit), 1):
+            line = (
+                f"{i}. {sql[:150]}\n"
+                f"   вызовов {calls}, всего {total_ms:.1f} мс, среднее {avg_ms:.2f} мс, "
+                f"макс. {max_ms:.1f} мс, строк {rows}\n"
+            )
+            if len(text) + len(line) > MAX_MESSAGE_LENGTH:
+                break
+            text += line
+        
+        update.message.reply_text(text)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в команде /querystats: {e}\n{traceback.format_exc()}")
+        if update and update.message:
+            update.message.reply_text("⚠️ Произошла ошибка при получении статистики запросов.")
+
+def handle_busy(update: Update, context: CallbackContext):
+    """Сообщение пришло, пока предыдущее сообщение этого диалога еще обрабатывается"""
+    try:
+        if update.message:
+            # Ответ уходит из пула воркеров, поток диспетчера не блокируется
+            context.dispatcher.run_async(reply, update, 'busy')
+    except Exception as e:
+        logger.error(f"Ошибка в handle_busy: {e}")
+
+def register_handlers(dispatcher, lanes=None):
+    """
+    Регистрация всех обработчиков бота.
+    Если переданы пулы lanes (режим async), обработчики участников и администратора
+    выполняются в отдельных пулах потоков, а обновления одного пользователя -
+    строго по очереди. Без lanes обработчики выполняются в потоке диспетчера.
+    """
+    if lanes is not None:
+        run_user, run_admin = lanes.user, lanes.admin
+    else:
+        run_user = run_admin = lambda callback: callback
+    
+    # Время выполнения каждого обработчика попадает в метрики
+    def user_lane(callback):
+        return run_user(track_handler(callback))
+    
+    def admin_lane(callback):
+        return run_admin(track_handler(callback))
+    
+    # Настраиваем ConversationHandler для регистрации
+    # (при включенном хранении состояние диалога переживает перезапуск бота)
+    conv_handler = ConversationHandler(
+        name='registration',
+        persistent=dispatcher.persistence is not None,
+        entry_points=[CommandHandler('start', user_lane(start))],
+        states={
+            WAITING_FOR_NUMBER: [
+                MessageHandler(Filters.text & ~Filters.command, user_lane(handle_lottery_number)),
+                MessageHandler(Filters.command, user_lane(handle_start_button))  # Обработка /start из состояния
+            ],
+            WAITING_FOR_PHONE: [
+                MessageHandler(Filters.contact, user_lane(handle_phone)),
+                MessageHandler(Filters.text, user_lane(handle_phone))  # Обрабатываем и текст и команды
+            ],
+            # Предыдущее сообщение диалога еще обрабатывается в пуле (только в режиме async).
+            # Обработчик синхронный: асинхронный заменил бы ожидаемое состояние диалога
+            ConversationHandler.WAITING: [
+                MessageHandler(Filters.all, handle_busy)
+            ],
+        },
+        fallbacks=[
+            CommandHandler('cancel', user_lane(cancel)),
+            CommandHandler('start', user_lane(handle_start_button))  # Падение на /start
+        ],
+    )
+    
+    # Регистрируем обработчики команд
+    dispatcher.add_handler(conv_handler)
+    dispatcher.add_handler(CommandHandler("list", admin_lane(list_participants)))
+    dispatcher.add_handler(CommandHandler("export", admin_lane(export_command)))
+    dispatcher.add_handler(CommandHandler("help", user_lane(help_command)))
+    dispatcher.add_handler(CommandHandler("checkstats", admin_lane(check_stats_command)))
+    dispatcher.add_handler(CommandHandler("setword", admin_lane(setword_command)))
+    dispatcher.add_handler(CommandHandler("draw", admin_lane(draw_command)))
+    
+    # Кнопки и ввод даты используются только в админских сценариях
+    dispatcher.add_handler(CallbackQueryHandler(admin_lane(handle_callback_query)))
+    dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, admin_lane(handle_date_input)))
+    
+    # Команда для проверки статуса бота (только для админа)
+    dispatcher.add_handler(CommandHandler("status", admin_lane(status_command)))
+    dispatcher.add_handler(CommandHandler("querystats", admin_lane(query_stats_command)))
+    
+    # Обработчик для команды /start вне ConversationHandler
+    dispatcher.add_handler(CommandHandler("start", user_lane(handle_start_button)))
+    
+    register_gauges(dispatcher, conv_handler, lanes)
+
+def conversation_states(conv_handler):
+    """Число диалогов регистрации в памяти по состояниям"""
+    counts = {(name,): 0 for name in CONVERSATION_STATE_NAMES.values()}
+    counts[('processing',)] = 0
+    
+    # Копия значений: словарь меняется потоками обработчиков
+    for state in list(conv_handler.conversations.values()):
+        # Кортеж (прежнее состояние, Promise): ConversationHandler заменяет его
+        # результатом только при следующем сообщении пользователя
+        if isinstance(state, tuple):
+            old_state, promise = state
+            if not promise.done.is_set():
+                counts[('processing',)] += 1
+                continue
+            new_state = promise.result(timeout=0)
+            state = old_state if new_state is None else new_state
+        
+        if state == ConversationHandler.END:
+            continue
+        name = CONVERSATION_STATE_NAMES.get(state, str(state))
+        counts[(name,)] = counts.get((name,), 0) + 1
+    return counts
+
+def register_gauges(dispatcher, conv_handler, lanes=None):
+    """Показатели, которые вычисляются при запросе метрик"""
+    GaugeCallback(
+        'lottery_conversations',
+        'Диалоги регистрации в памяти по состояниям',
+        lambda: conversation_states(conv_handler),
+        ['state']
+    )
+    GaugeCallback(
+        'lottery_dispatcher_queue_depth',
+        'Обновления в очереди диспетчера',
+        dispatcher.update_queue.qsize
+    )
+    GaugeCallback(
+        'lottery_write_queue_depth',
+        'Заявки в очереди группового коммита',
+        lambda: db.write_queue.get_stats()['queue_depth'] if db.write_queue is not None else 0
+    )
+    if lanes is not None:
+        GaugeCallback(
+            'lottery_lane_queue_depth',
+            'Задачи в очереди пулов обработчиков',
+            lambda: {(name,): stats['queue_depth'] for name, stats in lanes.get_stats().items()},
+            ['lane']
+        )
+    if isinstance(dispatcher.bot, QueuedBot):
+        GaugeCallback(
+            'lottery_outbound_queue_depth',
+            'Исходящие сообщения, ожидающие отправки',
+            lambda: sum(dispatcher.bot.get_stats()[key] for key in ('queue_depth', 'deferred'))
+        )
+
+def create_bot(global_rate=None):
+    """
+    Bot для обращений к Bot API. При включенном планировщике исходящие сообщения
+    идут с лимитами Telegram; global_rate - общий лимит этого процесса (сообщений в секунду).
+    """
+    request = MeteredRequest(con_pool_size=config.CON_POOL_SIZE)
+    if not config.OUTBOUND_LIMIT_ENABLED:
+        return Bot(TOKEN, request=request)
+    
+    # Все исходящие сообщения проходят через планировщик с лимитами Telegram
+    limiter = OutboundLimiter(
+        global_rate=global_rate or config.OUTBOUND_GLOBAL_RATE,
+        chat_rate=config.OUTBOUND_CHAT_RATE,
+        chat_burst=config.OUTBOUND_CHAT_BURST
+    )
+    return QueuedBot(TOKEN, request=request, limiter=limiter, max_retries=config.OUTBOUND_MAX_RETRIES)
+
+def setup_updater(bot):
+    """
+    Updater с обработчиками, хранением состояний диалогов, пулами обработчиков
+    (режим async) и сводкой ошибок для администратора.
+    Возвращает (updater, persistence); persistence - None, если хранение выключено.
+    """
+    global worker_lanes, error_digest
+    
+    # Состояния диалогов и user_data в базе: после перезапуска участник продолжает с того же шага
+    persistence = None
+    if config.PERSISTENCE_ENABLED:
+        persistence = SQLitePersistence(db, flush_interval=config.PERSISTENCE_FLUSH_INTERVAL)
+    
+    updater = Updater(bot=bot, persistence=persistence, use_context=True, workers=config.BOT_WORKERS)
+    dispatcher = updater.dispatcher
+    
+    # В режиме async обработчики выполняются в раздельных пулах участников и администратора
+    if config.BOT_ENGINE == 'async':
+        worker_lanes = WorkerLanes(config.USER_LANE_WORKERS, config.ADMIN_LANE_WORKERS)
+        worker_lanes.start()
+    
+    # Регистрируем обработчики
+    register_handlers(dispatcher, lanes=worker_lanes)
+    
+    # Глобальный обработчик ошибок
+    dispatcher.add_error_handler(error_handler)
+    
+    # Уведомления об ошибках отправляются отдельным потоком с низким приоритетом
+    def send_to_admin(text):
+        with bulk():
+            bot.send_message(chat_id=ADMIN_ID, text=text)
+    
+    error_digest = ErrorDigest(
+        send_to_admin,
+        interval=config.ERROR_DIGEST_INTERVAL,
+        alert_limit=config.ERROR_ALERT_LIMIT
+    )
+    error_digest.start()
+    
+    return updater, persistence
+
+def start_dispatcher(updater):
+    """Запуск диспетчера и очереди задач без получения обновлений самим Updater"""
+    updater.job_queue.start()
+    dispatcher_ready = threading.Event()
+    threading.Thread(
+        target=updater.dispatcher.start,
+        kwargs={'ready': dispatcher_ready},
+        name='dispatcher',
+        daemon=True
+    ).start()
+    dispatcher_ready.wait()
+    
+    # Без этого флага Updater.idle() по сигналу завершает процесс через os._exit, не останавливая диспетчер
+    updater.running = True
+
+def stop_services(persistence, bot=None):
+    """Остановка всего, что работает после диспетчера, и закрытие базы"""
+    # Диспетчер уже остановлен, webhook-сервер до остановки отвечает 503
+    if webhook_receiver is not None:
+        webhook_receiver.stop()
+    
+    # Дорабатываем уже принятые обновления
+    if worker_lanes is not None:
+        worker_lanes.stop()
+    
+    # Записываем последние изменения состояний диалогов
+    if persistence is not None:
+        persistence.close()
+    
+    if metrics_server is not None:
+        metrics_server.stop()
+    
+    # Последняя сводка ошибок
+    if error_digest is not None:
+        error_digest.stop()
+    
+    # Отложенные по лимиту чата сообщения
+    if isinstance(bot, QueuedBot):
+        bot.stop()
+    
+    # Updater остановлен - закрываем пул соединений с БД
+    db.close()
+
+def start_webhook(updater):
+    """Прием обновлений через webhook встроенным HTTP-сервером вместо long polling"""
+    global webhook_receiver
+    
+    # Диспетчер и очередь задач запускаем сами: Updater в этом режиме не участвует
+    start_dispatcher(updater)
+    
+    webhook_receiver = WebhookReceiver(
+        updater.dispatcher,
+        listen=config.WEBHOOK_LISTEN,
+        port=config.WEBHOOK_PORT,
+        path=config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET_TOKEN,
+        max_queue=config.WEBHOOK_MAX_QUEUE
+    )
+    webhook_receiver.start()
+    register_webhook(updater.bot)
+
+def main():
+    """Запуск бота"""
+    global metrics_server
+    
+    try:
+        # Проверяем настройки: опечатка в BOT_ENGINE не должна молча включать режим sync
+        try:
+            config.validate()
+        except ValueError as e:
+            logger.error(f"{e}. Бот не может быть запущен.")
+            return
         
-        # Обработчик для команды /start вне ConversationHandler
-        dispatcher.add_handler(CommandHandler("start", handle_start_button))
+        # Проверяем базу данных перед запуском
+        if not database_health_check():
+            logger.error("База данных недоступна. Бот не может быть запущен.")
+            return
+        # Создаем Updater и Dispatcher
+        updater, persistence = setup_updater(create_bot())
         
-        # Глобальный обработчик ошибок
-        dispatcher.add_error_handler(error_handler)
+        # Метрики для Prometheus на локальном порту
+        if config.METRICS_ENABLED:
+            metrics_server = MetricsServer(listen=config.METRICS_LISTEN, port=config.METRICS_PORT)
+            metrics_server.start()
         
         # Запускаем бота
-        updater.start_polling()
-        logger.info("✅ Бот успешно запущен!")
+        if config.UPDATE_MODE == 'webhook':
+            start_webhook(updater)
+        else:
+            updater.start_polling()
+        logger.info(f"✅ Бот успешно запущен! Получение обновлений: {config.UPDATE_MODE}, "
+                    f"режим обработки: {config.BOT_ENGINE}")
         
         # Отправляем уведомление администратору о запуске
         try:
-            # Создаем клавиатуру с кнопкой /start
-            keyboard = [[KeyboardButton("/start")]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            
             updater.bot.send_message(
                 chat_id=ADMIN_ID,
                 text=f"Нажмите /start для запуска регистрации:",
-                reply_markup=reply_markup
+                reply_markup=START_KEYBOARD
             )
         except:
             logger.warning("Не удалось отправить уведомление администратору")
         
         updater.idle()
         
+        stop_services(persistence, updater.bot)
+    
     except Exception as e:
         logger.critical(f"Критическая ошибка при запуске бота: {e}\n{traceback.format_exc()}")
         
@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+"""
+Многопроцессный режим бота.
+
+Один процесс Python упирается в GIL: проверка кодовых слов, форматирование
+ответов и работа python-telegram-bot идут на одном ядре. В этом режиме:
+
+- входной процесс получает обновления (long polling или webhook) и раскладывает
+  их по CLUSTER_WORKERS процессам-воркерам по хешу user_id - все обновления
+  пользователя, а значит и его диалог ConversationHandler, попадают в один воркер;
+- воркеры выполняют обработчики bot.py, записи участников они передают
+  процессу-писателю через multiprocessing.connection;
+- процесс-писатель единственным пишет участников в SQLite (групповой коммит).
+
+Состояния диалогов (persistence) и редкие команды администратора воркеры
+по-прежнему пишут в базу сами: ключи у воркеров не пересекаются, SQLite
+упорядочивает такие записи через busy_timeout.
+
+Журналы всех процессов пишет входной процесс. Метрики (METRICS_ENABLED)
+у каждого процесса свои: воркер N на порту METRICS_PORT + N, писатель -
+METRICS_PORT + CLUSTER_WORKERS.
+
+Запуск:
+    CLUSTER_WORKERS=4 BOT_ENGINE=async python cluster.py
+"""
+
+import itertools
+import logging
+import multiprocessing
+import queue
+import secrets
+import signal
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+from telegram import Bot, Update
+from telegram.error import InvalidToken, RetryAfter, TelegramError, TimedOut, Unauthorized
+
+from config import config
+from database import Database, RegistrationResult
+from logging_setup import setup_logging, forward_logging, listen_queue
+from metrics import MetricsServer
+from outbound import MeteredRequest
+from templates import START_KEYBOARD
+from webhook import WebhookReceiver, register_webhook
+
+logger = logging.getLogger('cluster')
+
+# Поля обновления, в которых Telegram передает пользователя (from или user)
+UPDATE_FIELDS = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post', 'callback_query',
+    'inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+    'poll_answer', 'my_chat_member', 'chat_member', 'chat_join_request',
+)
+
+# Long polling во входном процессе, секунды
+POLL_TIMEOUT = 10
+
+# Предел паузы между повторами после ошибок getUpdates, секунды (как в Updater)
+POLL_MAX_RETRY_INTERVAL = 30
+
+# Сколько ждать запуска писателя и завершения процессов при остановке, секунды
+WRITER_START_TIMEOUT = 60
+STOP_TIMEOUT = 30
+
+
+def update_user_id(data):
+    """Ключ распределения обновления (JSON от Telegram): пользователь, иначе чат - как update_key в workers.py"""
+    for field in UPDATE_FIELDS:
+        payload = data.get(field)
+        if not isinstance(payload, dict):
+            continue
+        user = payload.get('from') or payload.get('user')
+        if user:
+            return user.get('id', 0)
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat:
+            return chat.get('id', 0)
+    return 0
+
+
+class ShardRouter:
+    """Очереди воркеров: обновление попадает к воркеру user_id % число воркеров"""
+
+    def __init__(self, queues):
+        self.queues = queues
+
+    def shard_for(self, data):
+        return update_user_id(data) % len(self.queues)
+
+    def route(self, data, timeout=0):
+        """Передача обновления воркеру; False, если его очередь так и не освободилась"""
+        worker_queue = self.queues[self.shard_for(data)]
+        try:
+            if timeout:
+                worker_queue.put(data, timeout=timeout)
+            else:
+                worker_queue.put_nowait(data)
+        except queue.Full:
+            return False
+        return True
+
+    def queue_depth(self):
+        try:
+            return sum(q.qsize() for q in self.queues)
+        except NotImplementedError:  # macOS
+            return None
+
+
+class ShardedWebhookReceiver(WebhookReceiver):
+    """Webhook-сервер входного процесса: обновления не разбираются, а раскладываются по воркерам"""
+
+    def __init__(self, router, **kwargs):
+        super().__init__(None, **kwargs)
+        self.router = router
+
+    def _queue_depth(self):
+        return self.router.queue_depth()
+
+    def _is_busy(self):
+        # Заполненность проверяется по очереди конкретного воркера в _enqueue
+        return False
+
+    def _enqueue(self, data):
+        return self.router.route(data)
+
+
+class PendingCall:
+    """Запрос воркера к писателю, ожидающий ответа"""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WriterClient:
+    """
+    Связь воркера с процессом-писателем. Интерфейс как у ParticipantWriteQueue
+    (submit, get_stats, stop), подключается через Database.attach_writer.
+    Обработчики воркера отправляют запросы по одному соединению,
+    ответы разбирает отдельный поток. Ответ ждется, пока соединение живо:
+    писатель отвечает на каждую принятую заявку, и ошибка по таймауту
+    означала бы ответ "не сохранено" для записанной регистрации.
+    """
+
+    def __init__(self, address, authkey, slow_warning=30):
+        self.slow_warning = slow_warning
+        self._conn = Client(address, authkey=authkey)
+        self._send_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._closed = False
+        self._reader = threading.Thread(target=self._read, name='writer-client', daemon=True)
+        self._reader.start()
+
+    def submit(self, row):
+        """Запись заявки процессом-писателем; возвращает RegistrationResult"""
+        return RegistrationResult(*self._call('register', row))
+
+    def get_stats(self):
+        """Показатели группового коммита процесса-писателя"""
+        return self._call('stats', None)
+
+    def stop(self):
+        """Закрытие соединения (заявки в процессе записи писатель допишет сам)"""
+        with self._pending_lock:
+            self._closed = True
+        try:
+            self._conn.close()
+        except OSError:
+            pass
+        self._reader.join(1)
+
+    def _call(self, kind, payload):
+        call = PendingCall()
+        request_id = next(self._ids)
+        with self._pending_lock:
+            if self._closed:
+                raise Exception("Нет связи с процессом записи в базу данных")
+            self._pending[request_id] = call
+
+        try:
+            with self._send_lock:
+                self._conn.send((kind, request_id, payload))
+        except (OSError, ValueError) as e:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            raise Exception(f"Нет связи с процессом записи в базу данных: {e}")
+
+        if not call.done.wait(self.slow_warning):
+            logger.warning(f"Ответ процесса записи в базу ждем дольше {self.slow_warning} с")
+            call.done.wait()
+
+        if call.error is not None:
+            raise Exception(call.error)
+        return call.result
+
+    def _read(self):
+        while True:
+            try:
+                request_id, result, error = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._pending_lock:
+                call = self._pending.pop(request_id, None)
+            if call is not None:
+                call.result = result
+                call.error = error
+                call.done.set()
+
+        # Соединение закрыто: ожидающие обработчики получают ошибку сразу
+        with self._pending_lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+        for call in pending.values():
+            call.error = "Соединение с процессом записи в базу данных закрыто"
+            call.done.set()
+
+
+class WriterServer:
+    """
+    Процесс-писатель: принимает заявки воркеров и записывает их через
+    Database.write_participant. Заявки выполняются пулом потоков, чтобы
+    одновременные регистрации попадали в один пакет группового коммита.
+    """
+
+    def __init__(self, db, authkey, threads=64):
+        self.db = db
+        self._listener = Listener(authkey=authkey)
+        self.address = self._listener.address
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='writer')
+        self._connections = []
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept, name='writer-accept', daemon=True)
+        self._thread.start()
+        logger.info(f"✅ Процесс записи в базу слушает {self.address}")
+
+    def stop(self):
+        """Остановка: новые заявки не принимаются, начатые дописываются"""
+        self._listener.close()
+        self._executor.shutdown(wait=True)
+        for conn in self._connections:
+            conn.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                break  # Listener закрыт
+            except Exception as e:
+                # Например, неверный authkey
+                logger.warning(f"Отклонено подключение к процессу записи: {e}")
+                continue
+            self._connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), name='writer-connection', daemon=True).start()
+
+    def _serve(self, conn):
+        send_lock = threading.Lock()
+        while True:
+            try:
+                kind, request_id, payload = conn.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                self._executor.submit(self._handle, conn, send_lock, kind, request_id, payload)
+            except RuntimeError:
+                break  # Пул остановлен
+
+    def _handle(self, conn, send_lock, kind, request_id, payload):
+        result = error = None
+        try:
+            if kind == 'register':
+                result = tuple(self.db.write_participant(payload))
+            elif kind == 'stats':
+                result = self.db.write_queue.get_stats() if self.db.write_queue is not None else {}
+            else:
+                error = f"Неизвестный запрос: {kind}"
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи заявки воркера: {e}\n{traceback.format_exc()}")
+            error = str(e)
+
+        try:
+            with send_lock:
+                conn.send((request_id, result, error))
+        except (OSError, ValueError):
+            pass  # Воркер уже отключился
+
+
+def ignore_stop_signals():
+    """
+    Дочерний процесс останавливается только входным процессом: SIGINT и SIGTERM,
+    отправленные всей группе процессов (Ctrl+C, systemd, docker stop), игнорируются
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def run_writer(log_queue, authkey, control, shards):
+    """
+    Процесс-писатель: единственный, кто записывает участников в SQLite.
+    По control сообщает адрес для воркеров и ждет команды остановки
+    (или закрытия канала - если входной процесс завершился).
+    """
+    ignore_stop_signals()
+    forward_logging(log_queue)
+
+    db = Database(batch_writes=True)
+    server = WriterServer(db, authkey, threads=config.CLUSTER_WRITER_THREADS)
+    server.start()
+
+    metrics_server = None
+    if config.METRICS_ENABLED:
+        metrics_server = MetricsServer(listen=config.METRICS_LISTEN, port=config.METRICS_PORT + shards)
+        metrics_server.start()
+
+    control.send(server.address)
+    try:
+        control.recv()
+    except EOFError:
+        pass
+
+    server.stop()
+    if metrics_server is not None:
+        metrics_server.stop()
+    db.close()
+
+
+def run_worker(index, shards, updates, log_queue, writer_address, authkey):
+    """Процесс-воркер: обработчики bot.py для своей доли пользователей"""
+    ignore_stop_signals()
+    forward_logging(log_queue)
+
+    # bot при импорте открывает базу и настраивает журнал - только после forward_logging
+    import bot as bot_module
+
+    try:
+        bot_module.db.attach_writer(WriterClient(writer_address, authkey))
+
+        # Лимит Telegram на весь бот делится между воркерами
+        bot = bot_module.create_bot(global_rate=config.OUTBOUND_GLOBAL_RATE / shards)
+        updater, persistence = bot_module.setup_updater(bot)
+
+        if config.METRICS_ENABLED:
+            bot_module.metrics_server = MetricsServer(listen=config.METRICS_LISTEN, port=config.METRICS_PORT + index)
+            bot_module.metrics_server.start()
+
+        bot_module.start_dispatcher(updater)
+        logger.info(f"✅ Воркер {index + 1}/{shards} запущен")
+
+        update_queue = updater.dispatcher.update_queue
+        parent = multiprocessing.parent_process()
+        while True:
+            try:
+                data = updates.get(timeout=1)
+            except queue.Empty:
+                # Входной процесс завершился, не остановив воркер
+                if not parent.is_alive():
+                    logger.error(f"Воркер {index + 1}: входной процесс завершился, останавливаемся")
+                    break
+                continue
+            if data is None:
+                break
+            try:
+                update_queue.put(Update.de_json(data, bot))
+            except Exception as e:
+                logger.warning(f"Воркер {index + 1}: не удалось разобрать обновление: {e}")
+
+        # Дожидаемся разбора уже принятых обновлений
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while update_queue.qsize() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        updater.stop()
+        bot_module.stop_services(persistence, bot)
+        logger.info(f"Воркер {index + 1}/{shards} остановлен")
+
+    except Exception as e:
+        logger.critical(f"Критическая ошибка воркера {index + 1}: {e}\n{traceback.format_exc()}")
+        sys.exit(1)
+
+
+def poll_updates(bot, router, stopping, check_processes):
+    """
+    Long polling во входном процессе до остановки. Ошибки getUpdates
+    обрабатываются как в Updater: RetryAfter - пауза, указанная Telegram,
+    остальные - повтор с растущей паузой; останавливает только неверный токен.
+    """
+    bot.delete_webhook()
+    offset = None
+    retry_interval = 0
+
+    while not stopping.is_set() and check_processes():
+        try:
+            updates = bot.get_updates(offset=offset, timeout=POLL_TIMEOUT)
+        except RetryAfter as e:
+            logger.warning(f"Telegram просит повторить получение обновлений через {e.retry_after} с")
+            stopping.wait(0.5 + e.retry_after)
+            continue
+        except TimedOut:
+            continue
+        except (Unauthorized, InvalidToken):
+            raise
+        except TelegramError as e:
+            # Например, Conflict: при выкладке еще работает старый экземпляр бота
+            retry_interval = min(retry_interval * 1.5 or 1, POLL_MAX_RETRY_INTERVAL)
+            logger.error(f"Ошибка получения обновлений: {e}, повтор через {retry_interval:.0f} с")
+            stopping.wait(retry_interval)
+            continue
+        retry_interval = 0
+
+        for update in updates:
+            data = update.to_dict()
+            # Очередь воркера полна - ждем, пока он разберет свои обновления
+            while not router.route(data, timeout=1):
+                if stopping.is_set() or not check_processes():
+                    return offset
+            offset = update.update_id + 1
+
+    return offset
+
+
+def main():
+    """Запуск входного процесса, писателя и воркеров"""
+    setup_logging()
+    try:
+        config.validate()
+    except ValueError as e:
+        logger.critical(f"{e}. Бот не может быть запущен.")
+        return 1
+    shards = config.CLUSTER_WORKERS
+
+    context = multiprocessing.get_context('spawn')
+    log_queue = context.Queue()
+    log_listener = listen_queue(log_queue)
+
+    # Ключ подключения к писателю знают только процессы этого запуска
+    authkey = secrets.token_bytes(32)
+
+    writer_control, control = context.Pipe()
+    writer = context.Process(
+        target=run_writer,
+        args=(log_queue, authkey, control, shards),
+        name='lottery-writer'
+    )
+    writer.start()
+    control.close()
+
+    try:
+        if not writer_control.poll(WRITER_START_TIMEOUT):
+            raise EOFError
+        writer_address = writer_control.recv()
+    except EOFError:
+        logger.critical("Процесс записи в базу не запустился")
+        writer.kill()
+        log_listener.stop()
+        return 1
+
+    queues = [context.Queue(config.CLUSTER_QUEUE_SIZE) for _ in range(shards)]
+    workers = [
+        context.Process(
+            target=run_worker,
+            args=(index, shards, queues[index], log_queue, writer_address, authkey),
+            name=f'lottery-worker-{index + 1}'
+        )
+        for index in range(shards)
+    ]
+    for worker in workers:
+        worker.start()
+
+    processes = [writer] + workers
+
+    def check_processes():
+        dead = [process.name for process in processes if not process.is_alive()]
+        if dead:
+            logger.critical(f"Процессы завершились: {', '.join(dead)}. Останавливаем бота")
+            return False
+        return True
+
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stopping.set())
+
+    router = ShardRouter(queues)
+    bot = Bot(config.BOT_TOKEN, request=MeteredRequest(con_pool_size=4))
+    exit_code = 0
+
+    try:
+        logger.info(f"✅ Бот запущен: воркеров {shards}, получение обновлений: {config.UPDATE_MODE}, "
+                    f"режим обработки: {config.BOT_ENGINE}")
+
+        try:
+            bot.send_message(
+                chat_id=config.ADMIN_ID,
+                text="Нажмите /start для запуска регистрации:",
+                reply_markup=START_KEYBOARD
+            )
+        except:
+            logger.warning("Не удалось отправить уведомление администратору")
+
+        if config.UPDATE_MODE == 'webhook':
+            receiver = ShardedWebhookReceiver(
+                router,
+                listen=config.WEBHOOK_LISTEN,
+                port=config.WEBHOOK_PORT,
+                path=config.WEBHOOK_PATH,
+                secret_token=config.WEBHOOK_SECRET_TOKEN,
+                max_queue=config.CLUSTER_QUEUE_SIZE
+            )
+            receiver.start()
+            register_webhook(bot)
+            while not stopping.wait(1) and check_processes():
+                pass
+            receiver.stop()
+        else:
+            offset = poll_updates(bot, router, stopping, check_processes)
+            # Подтверждаем Telegram переданные воркерам обновления, чтобы они не пришли повторно
+            if offset is not None:
+                bot.get_updates(offset=offset, timeout=0, limit=1)
+
+        if not stopping.is_set():
+            exit_code = 1  # Остановка из-за упавшего процесса
+
+    except Exception as e:
+        logger.critical(f"Критическая ошибка входного процесса: {e}\n{traceback.format_exc()}")
+        exit_code = 1
+
+    finally:
+        # Воркеры дорабатывают принятые обновления, затем писатель дописывает заявки
+        for worker_queue in queues:
+            try:
+                worker_queue.put(None, timeout=STOP_TIMEOUT)
+            except queue.Full:
+                pass  # Воркер не разбирает очередь - будет остановлен принудительно (SIGKILL)
+        for worker in workers:
+            worker.join(STOP_TIMEOUT)
+            if worker.is_alive():
+                logger.error(f"{worker.name} не остановился за {STOP_TIMEOUT} с")
+                worker.kill()
+
+        try:
+            writer_control.send('stop')
+        except OSError:
+            pass  # Писатель уже завершился
+        writer.join(STOP_TIMEOUT)
+        if writer.is_alive():
+            logger.error(f"{writer.name} не остановился за {STOP_TIMEOUT} с")
+            writer.kill()
+
+        logger.info("👋 Бот остановлен")
+        log_listener.stop()
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
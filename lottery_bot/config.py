@@ -15,8 +15,83 @@ class Config:
     # Путь к базе данных
     DATABASE_PATH = os.getenv('DATABASE_PATH', 'lottery.db')
     
+    # Настройки SQLite (PRAGMA для каждого соединения пула)
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -16000))  # Отрицательное значение - размер в КБ
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 268435456))
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # Миллисекунды
+    
+    # Режим обработки обновлений: sync - обработчики выполняются по одному в потоке диспетчера,
+    # async - в раздельных пулах потоков для участников и администратора
+    BOT_ENGINE = os.getenv('BOT_ENGINE', 'sync').lower()
+    BOT_WORKERS = int(os.getenv('BOT_WORKERS', 4))  # Пул диспетчера для фоновых задач (выгрузки)
+    USER_LANE_WORKERS = int(os.getenv('USER_LANE_WORKERS', 16))
+    ADMIN_LANE_WORKERS = int(os.getenv('ADMIN_LANE_WORKERS', 2))
+    # HTTP-соединения к Bot API: по одному на каждый поток, который может слать запросы
+    CON_POOL_SIZE = int(os.getenv('CON_POOL_SIZE', BOT_WORKERS + USER_LANE_WORKERS + ADMIN_LANE_WORKERS + 4))
+    
+    # Ограничение скорости исходящих сообщений (лимиты Telegram: ~30 в секунду всего, ~1 в секунду в чат)
+    OUTBOUND_LIMIT_ENABLED = os.getenv('OUTBOUND_LIMIT_ENABLED', 'True').lower() == 'true'
+    OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))
+    OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', 1))
+    OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', 3))
+    OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 3))  # Повторы после ответа 429
+    
+    # Получение обновлений: polling (getUpdates) или webhook (встроенный HTTP-сервер)
+    UPDATE_MODE = os.getenv('UPDATE_MODE', 'polling').lower()
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Внешний адрес, например https://example.com/webhook
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+    WEBHOOK_MAX_QUEUE = int(os.getenv('WEBHOOK_MAX_QUEUE', 1000))  # Очередь диспетчера, сверх которой отвечаем 503
+    
+    # Групповой коммит регистраций (очередь отложенной записи); в режиме async включен по умолчанию
+    DB_WRITE_QUEUE_ENABLED = os.getenv('DB_WRITE_QUEUE_ENABLED', str(BOT_ENGINE == 'async')).lower() == 'true'
+    DB_WRITE_QUEUE_SIZE = int(os.getenv('DB_WRITE_QUEUE_SIZE', 10000))
+    DB_WRITE_BATCH_SIZE = int(os.getenv('DB_WRITE_BATCH_SIZE', 200))
+    DB_WRITE_FLUSH_MS = int(os.getenv('DB_WRITE_FLUSH_MS', 20))
+    
+    # Сохранение состояний диалогов и user_data в базе (запись пакетами раз в интервал, секунды)
+    PERSISTENCE_ENABLED = os.getenv('PERSISTENCE_ENABLED', 'True').lower() == 'true'
+    PERSISTENCE_FLUSH_INTERVAL = float(os.getenv('PERSISTENCE_FLUSH_INTERVAL', 1.0))
+    
+    # Число участников на одной странице списка для администратора
+    LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', 40))
+    
+    # Статистика запросов к БД (/querystats) и журнал запросов дольше SLOW_QUERY_MS с планом выполнения
+    QUERY_STATS_ENABLED = os.getenv('QUERY_STATS_ENABLED', 'True').lower() == 'true'
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+    SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'slow_queries.log')  # Пустое значение - только в общий журнал
+    
+    # Метрики в формате Prometheus (GET /metrics); по умолчанию доступны только локально
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+    METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+    
+    # Уведомления администратора об ошибках: о новой ошибке сразу (не больше ERROR_ALERT_LIMIT
+    # за интервал), о повторах - одной сводкой раз в ERROR_DIGEST_INTERVAL секунд
+    ERROR_DIGEST_INTERVAL = float(os.getenv('ERROR_DIGEST_INTERVAL', 300))
+    ERROR_ALERT_LIMIT = int(os.getenv('ERROR_ALERT_LIMIT', 5))
+    
+    # Многопроцессный режим (cluster.py): число воркеров, очередь обновлений каждого воркера,
+    # потоки процесса записи в базу (одновременные заявки, попадающие в один пакет)
+    CLUSTER_WORKERS = int(os.getenv('CLUSTER_WORKERS', os.cpu_count() or 2))
+    CLUSTER_QUEUE_SIZE = int(os.getenv('CLUSTER_QUEUE_SIZE', 1000))
+    CLUSTER_WRITER_THREADS = int(os.getenv('CLUSTER_WRITER_THREADS', 64))
+    
     # Настройки логирования
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FILE = os.getenv('LOG_FILE', 'bot_errors.log')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # text или json (одна строка JSON на запись)
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+    LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')  # Например, midnight - ротация по времени вместо размера
+    # INFO с одного места в коде: не больше LOG_RATE_LIMIT записей в секунду (0 - без ограничения),
+    # сверх лимита сохраняется доля LOG_SAMPLE_RATE; WARNING и ошибки пишутся всегда
+    LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 20))
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.01))
     DEBUG_MODE = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
     
     @classmethod
@@ -30,6 +105,14 @@ class Config:
         if not cls.ADMIN_ID or cls.ADMIN_ID == 0:
             errors.append("ADMIN_ID не настроен в .env файле")
         
+        if cls.BOT_ENGINE not in ('sync', 'async'):
+            errors.append("BOT_ENGINE должен быть sync или async")
+        
+        if cls.UPDATE_MODE not in ('polling', 'webhook'):
+            errors.append("UPDATE_MODE должен быть polling или webhook")
+        elif cls.UPDATE_MODE == 'webhook' and not cls.WEBHOOK_URL:
+            errors.append("WEBHOOK_URL не настроен в .env файле")
+        
         if errors:
             raise ValueError(f"Ошибки конфигурации: {', '.join(errors)}")
         
@@ -1,61 +1,229 @@
 # lottery_bot/database.py
 import sqlite3
+import json
 import logging
+import random
+import secrets
+import threading
+from collections import namedtuple
 from datetime import datetime
 import traceback
 from config import config
+from migrations import rebuild_daily_stats, run_migrations
+from metrics import timed, DB_QUERY_DURATION, REGISTRATIONS
+from query_stats import QueryStats, InstrumentedConnection
+from write_queue import ParticipantWriteQueue
 logger = logging.getLogger(__name__)
 
+# Допустимые значения PRAGMA synchronous
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+# Результат регистрации: created=False, если пользователь уже участвовал сегодня
+RegistrationResult = namedtuple('RegistrationResult', ['created', 'kode_slovo', 'registration_time'])
+
+# Страница списка участников: rows - кортежи
+# (registration_time, kode_slovo, first_name, username, phone, id),
+# has_more - есть ли еще записи в направлении чтения
+ParticipantsPage = namedtuple('ParticipantsPage', ['rows', 'has_more'])
+
+# Результат розыгрыша: winners - кортежи
+# (id, registration_time, kode_slovo, first_name, username, phone, user_id) в порядке выбора
+DrawResult = namedtuple('DrawResult', ['draw_id', 'seed', 'pool_size', 'winners'])
+
+# Формат даты для пользователей и администратора
+DISPLAY_DATE_FORMAT = "%d.%m.%Y"
+
+# Формат хранения даты в базе (сортируется как строка, позволяет запросы по диапазону)
+ISO_DATE_FORMAT = "%Y-%m-%d"
+
+def to_iso_date(date_str):
+    """Перевод даты DD.MM.YYYY в формат хранения YYYY-MM-DD"""
+    try:
+        return datetime.strptime(date_str, DISPLAY_DATE_FORMAT).strftime(ISO_DATE_FORMAT)
+    except (TypeError, ValueError):
+        raise ValueError("Неверный формат даты")
+
+def to_display_date(iso_date):
+    """Перевод даты из формата хранения в DD.MM.YYYY"""
+    if not iso_date:
+        return iso_date
+    return f"{iso_date[8:10]}.{iso_date[5:7]}.{iso_date[0:4]}"
+
+def normalize_kode_slovo(kode_slovo):
+    """Нормализованная форма кодового слова для сравнения: без пробелов, без учета регистра, ё = е"""
+    if kode_slovo is None:
+        return None
+    return ''.join(kode_slovo.split()).casefold().replace('ё', 'е')
+
+# Вставка участника с проверкой кодового слова по таблице code_words (один раз, при записи)
+INSERT_PARTICIPANT_SQL = '''
+    INSERT INTO participants 
+    (date, kode_slovo, user_id, username, first_name, phone, registration_time, is_correct)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, EXISTS (
+        SELECT 1 FROM code_words WHERE date = ?1 AND word = normalize_kode_slovo(?2)
+    ))
+'''
+
+# Сколько строк переоценивать одной транзакцией при смене кодового слова
+REGRADE_BATCH_SIZE = 5000
+
+# Сколько user_id проверять одним запросом при пакетной записи (лимит параметров SQLite)
+BATCH_LOOKUP_CHUNK = 500
+
+class TodayParticipants:
+    """
+    Множество user_id, участвовавших сегодня.
+    Прогревается из БД при старте и при смене даты в полночь,
+    пополняется после каждой успешной записи.
+    """
+    
+    def __init__(self, loader):
+        self._loader = loader  # loader(iso_date) -> user_id участников за дату
+        self._lock = threading.Lock()
+        self._date = None
+        self._user_ids = set()
+    
+    def _current(self):
+        """Множество за сегодня (при смене даты перечитывается из БД)"""
+        today = datetime.now().strftime(ISO_DATE_FORMAT)
+        if today != self._date:
+            with self._lock:
+                if today != self._date:
+                    self._user_ids = set(self._loader(today))
+                    self._date = today
+                    logger.info(f"Индекс участников за {to_display_date(today)}: {len(self._user_ids)} пользователей")
+        return today, self._user_ids
+    
+    def warm(self):
+        """Загрузка индекса за сегодня"""
+        self._current()
+    
+    def contains(self, user_id):
+        """Участвовал ли пользователь сегодня"""
+        return user_id in self._current()[1]
+    
+    def add(self, iso_date, user_id):
+        """Отметка об участии (записи за прошедшие даты игнорируются)"""
+        today, user_ids = self._current()
+        if iso_date == today:
+            user_ids.add(user_id)
+    
+    def __len__(self):
+        return len(self._current()[1])
+
 class Database:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, batch_writes=None):
         self.db_path = db_path or config.DATABASE_PATH
+        
+        # Пул соединений: одно долгоживущее соединение на поток
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        
+        # Статистика всех запросов и журнал медленных (общая для всех соединений пула)
+        self.query_stats = QueryStats(config.SLOW_QUERY_MS) if config.QUERY_STATS_ENABLED else None
+        
         self.init_db()
+        
+        # Меняется при появлении нового дня с участниками (для кэшей списка дат)
+        self.dates_version = 0
+        
+        # Индекс в памяти: кто уже участвовал сегодня
+        self.today_participants = TodayParticipants(self._load_user_ids_for_date)
+        self.today_participants.warm()
+        
+        # Групповой коммит регистраций (включается в конфигурации)
+        if batch_writes is None:
+            batch_writes = config.DB_WRITE_QUEUE_ENABLED
+        self.write_queue = None
+        if batch_writes:
+            self.write_queue = ParticipantWriteQueue(
+                self,
+                max_queue_size=config.DB_WRITE_QUEUE_SIZE,
+                max_batch_size=config.DB_WRITE_BATCH_SIZE,
+                flush_interval_ms=config.DB_WRITE_FLUSH_MS
+            )
+            self.write_queue.start()
+    
+    def _create_connection(self):
+        """Открытие нового соединения и настройка PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=config.SQLITE_BUSY_TIMEOUT / 1000,
+            check_same_thread=False,  # Соединение закрывается из главного потока при остановке
+            factory=InstrumentedConnection if self.query_stats is not None else sqlite3.Connection
+        )
+        if self.query_stats is not None:
+            conn.query_stats = self.query_stats
+        conn.row_factory = sqlite3.Row
+        
+        synchronous = config.SQLITE_SYNCHRONOUS.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            logger.warning(f"Неизвестный режим synchronous '{synchronous}', используется NORMAL")
+            synchronous = 'NORMAL'
+        
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA cache_size={int(config.SQLITE_CACHE_SIZE)}")
+        cursor.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT)}")
+        cursor.close()
+        
+        # Встроенная lower() SQLite меняет регистр только у латиницы - сравнение кодовых слов через Python
+        conn.create_function('normalize_kode_slovo', 1, normalize_kode_slovo, deterministic=True)
+        
+        return conn
     
     def get_connection(self):
-        """Создание соединения с базой данных с обработкой ошибок"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
+        """Получение соединения текущего потока (создается при первом обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
             return conn
+        
+        try:
+            conn = self._create_connection()
         except sqlite3.Error as e:
             logger.error(f"Ошибка подключения к БД: {e}\n{traceback.format_exc()}")
             raise
+        
+        self._local.conn = conn
+        with self._connections_lock:
+            self._connections.append(conn)
+        
+        logger.debug(f"Открыто соединение с БД для потока {threading.current_thread().name}")
+        return conn
+    
+    def close(self):
+        """Закрытие всех соединений пула"""
+        # Сначала дописываем заявки, оставшиеся в очереди
+        if self.write_queue is not None:
+            self.write_queue.stop()
+            self.write_queue = None
+        
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Ошибка при закрытии соединения с БД: {e}")
+        
+        # Сбрасываем ссылки потоков на закрытые соединения
+        self._local = threading.local()
+        logger.info(f"🔌 Пул соединений с БД закрыт ({len(connections)} соединений)")
     
     def init_db(self):
         """Инициализация базы данных"""
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
             
-            # Таблица участников
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS participants (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date TEXT NOT NULL,                    -- Дата в формате DD.MM.YYYY
-                    kode_slovo TEXT NOT NULL,             -- Кодовое слово (до 16 символов)
-                    user_id INTEGER NOT NULL,              -- ID пользователя Telegram
-                    username TEXT,                         -- Username пользователя
-                    first_name TEXT NOT NULL,              -- Имя пользователя
-                    phone TEXT NOT NULL,                   -- Номер телефона
-                    registration_time TEXT NOT NULL,       -- Время регистрации HH:MM:SS
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            # Создание и обновление схемы по версиям (PRAGMA user_version)
+            version = run_migrations(conn)
+            logger.info(f"✅ База данных успешно инициализирована (версия схемы {version})")
             
-            # Индекс для быстрого поиска по дате
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_date 
-                ON participants(date)
-            ''')
-            
-            # Индекс для проверки уникальности (пользователь может участвовать только 1 раз в день)
-            cursor.execute('''
-                CREATE UNIQUE INDEX IF NOT EXISTS idx_user_date_unique 
-                ON participants(user_id, date)
-            ''')
-            
-            conn.commit()
-            logger.info("✅ База данных успешно инициализирована")
+            cursor = conn.cursor()
             
             # Проверяем существующие данные
             cursor.execute('SELECT COUNT(*) as count FROM participants')
@@ -73,90 +241,182 @@ class Database:
         except Exception as e:
             logger.error(f"❌ Неизвестная ошибка при инициализации БД: {e}\n{traceback.format_exc()}")
             raise
-        finally:
-            if 'conn' in locals():
-                conn.close()
     
-    def save_participant(self, kode_slovo, user_id, username, first_name, phone):
-        """Сохранение участника в базу данных"""
+    def register_participant(self, kode_slovo, user_id, username, first_name, phone):
+        """
+        Атомарная регистрация участника.
+        Вставляет запись одним запросом; если пользователь уже участвовал сегодня,
+        возвращает данные существующей записи.
+        """
+        now = datetime.now()
+        
+        # Повторная попытка не доходит до записи: по индексу в памяти читается существующая запись
+        if self.today_participants.contains(user_id):
+            existing = self._get_registration(user_id, now.strftime(ISO_DATE_FORMAT))
+            if existing is not None:
+                logger.warning(f"Пользователь {user_id} уже участвовал сегодня")
+                return RegistrationResult(False, *existing)
+        
+        row = (now.strftime(ISO_DATE_FORMAT), kode_slovo, user_id, username, first_name, phone, now.strftime("%H:%M:%S"))
+        
+        result = self.write_participant(row)
+        
+        if result.created:
+            REGISTRATIONS.inc()
+            
+            # Первая запись за день - в списке дат появился новый день
+            if len(self.today_participants) == 0:
+                self.dates_version += 1
+        
+        # И новая, и найденная существующая запись означают участие за эту дату
+        self.today_participants.add(row[0], user_id)
+        return result
+    
+    def write_participant(self, row):
+        """
+        Запись заявки (row - кортеж в порядке колонок INSERT) без проверки индекса за сегодня:
+        через групповой коммит, процесс-писатель (см. attach_writer) или напрямую.
+        """
+        result = None
+        
+        # В режиме группового коммита заявка записывается потоком-писателем
+        if self.write_queue is not None:
+            result = self.write_queue.submit(row)
+            if result is None:
+                logger.warning(f"Очередь записи переполнена, пользователь {row[2]} сохраняется напрямую")
+        
+        if result is None:
+            result = self._insert_participant(row)
+        
+        return result
+    
+    def attach_writer(self, writer):
+        """
+        Запись участников через внешний писатель вместо своей очереди.
+        writer.submit(row) возвращает RegistrationResult, writer.stop() вызывается в close().
+        """
+        if self.write_queue is not None:
+            self.write_queue.stop()
+        self.write_queue = writer
+    
+    @timed(DB_QUERY_DURATION, 'insert_participant')
+    def _insert_participant(self, row):
+        """Вставка одной записи участника (row - кортеж в порядке колонок INSERT)"""
+        current_date, kode_slovo, user_id = row[0], row[1], row[2]
+        current_time = row[6]
+        
         conn = None
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
-
-            current_date = datetime.now().strftime("%d.%m.%Y")
-            current_time = datetime.now().strftime("%H:%M:%S")
-
-            # Проверяем, не участвовал ли пользователь сегодня
+            
+            # Уникальный индекс (user_id, date) сам решает, кто успел первым
+            cursor.execute(f'''
+                {INSERT_PARTICIPANT_SQL}
+                ON CONFLICT(user_id, date) DO NOTHING
+                RETURNING kode_slovo, registration_time
+            ''', row)
+            
+            inserted = cursor.fetchall()
+            conn.commit()
+            
+            if inserted:
+                logger.info(f"✅ Участник сохранен: {user_id}, кодовое слово: {kode_slovo}, время: {current_time}")
+                return RegistrationResult(True, inserted[0]['kode_slovo'], inserted[0]['registration_time'])
+            
+            # Конфликт: запись уже есть, читаем ее (только на этом редком пути)
             cursor.execute('''
-                SELECT id, kode_slovo, registration_time 
+                SELECT kode_slovo, registration_time 
                 FROM participants 
                 WHERE user_id = ? AND date = ?
             ''', (user_id, current_date))
-
             existing = cursor.fetchone()
-
+            
             if existing:
                 logger.warning(f"Пользователь {user_id} уже участвовал сегодня "
                               f"(кодовое слово: {existing['kode_slovo']}, время: {existing['registration_time']})")
-                raise ValueError(f"Вы уже участвовали в розыгрыше сегодня в {existing['registration_time']} с кодовым словом {existing['kode_slovo']}. Попробуйте завтра!")
-
-            # Сохраняем участника
-            cursor.execute('''
-                INSERT INTO participants 
-                (date, kode_slovo, user_id, username, first_name, phone, registration_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (current_date, kode_slovo, user_id, username, first_name, phone, current_time))
-
-            conn.commit()
-            logger.info(f"✅ Участник сохранен: {user_id}, кодовое слово: {kode_slovo}, время: {current_time}")
-
-            return True
-
-        except sqlite3.IntegrityError as e:
-            logger.error(f"❌ Ошибка целостности данных при сохранении: {e}")
+                return RegistrationResult(False, existing['kode_slovo'], existing['registration_time'])
+            
+            logger.warning(f"Пользователь {user_id} уже участвовал сегодня")
+            return RegistrationResult(False, None, None)
+            
+        except sqlite3.Error as e:
+            logger.error(f"❌ Ошибка при сохранении участника: {e}\n{traceback.format_exc()}")
             if conn:
                 conn.rollback()
-
-            # Проверяем, это из-за уникальности или другой причины
-            error_str = str(e)
-            if "UNIQUE constraint failed" in error_str:
-                # Пытаемся получить существующую запись
-                try:
-                    cursor.execute('''
-                        SELECT kode_slovo, registration_time 
+            raise Exception(f"Ошибка сохранения в базу данных: {str(e)}")
+    
+    @timed(DB_QUERY_DURATION, 'insert_participants_batch')
+    def insert_participants_batch(self, rows):
+        """
+        Запись пакета заявок одной транзакцией (групповой коммит).
+        Возвращает список RegistrationResult в порядке rows.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            # Берем блокировку записи сразу: до COMMIT никто не вставит конкурирующую запись
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            results = [None] * len(rows)
+            to_insert = []
+            
+            # Группируем по дате (пакет может пересечь полночь)
+            indexes_by_date = {}
+            for i, row in enumerate(rows):
+                indexes_by_date.setdefault(row[0], []).append(i)
+            
+            for current_date, indexes in indexes_by_date.items():
+                user_ids = list({rows[i][2] for i in indexes})
+                existing = {}
+                
+                for start in range(0, len(user_ids), BATCH_LOOKUP_CHUNK):
+                    chunk = user_ids[start:start + BATCH_LOOKUP_CHUNK]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor.execute(f'''
+                        SELECT user_id, kode_slovo, registration_time 
                         FROM participants 
-                        WHERE user_id = ? AND date = ?
-                    ''', (user_id, current_date))
-                    existing = cursor.fetchone()
-                    if existing:
-                        raise ValueError(f"Вы уже участвовали в розыгрыше сегодня в {existing['registration_time']} с кодовым словом {existing['kode_slovo']}")
+                        WHERE date = ? AND user_id IN ({placeholders})
+                    ''', [current_date] + chunk)
+                    for found in cursor.fetchall():
+                        existing[found['user_id']] = (found['kode_slovo'], found['registration_time'])
+                
+                for i in indexes:
+                    row = rows[i]
+                    user_id = row[2]
+                    if user_id in existing:
+                        # Уже участвовал сегодня (или повторная заявка в этом же пакете)
+                        results[i] = RegistrationResult(False, *existing[user_id])
                     else:
-                        raise ValueError("Вы уже участвовали в розыгрыше сегодня")
-                except:
-                    raise ValueError("Вы уже участвовали в розыгрыше сегодня")
-            else:
-                raise Exception(f"Ошибка сохранения в базу данных: {error_str}")
-
-        except ValueError as e:
-            # Пробрасываем уже обработанные ошибки
-            raise e
-
-        except Exception as e:
-            logger.error(f"❌ Ошибка при сохранении участника: {e}\n{traceback.format_exc()}")
+                        existing[user_id] = (row[1], row[6])
+                        to_insert.append(row)
+                        results[i] = RegistrationResult(True, row[1], row[6])
+            
+            cursor.executemany(INSERT_PARTICIPANT_SQL, to_insert)
+            
+            conn.commit()
+            return results
+            
+        except sqlite3.Error as e:
+            logger.error(f"❌ Ошибка при пакетной записи участников: {e}\n{traceback.format_exc()}")
             if conn:
                 conn.rollback()
-
-            # Проверяем, если это ошибка уникальности
-            if "UNIQUE constraint failed" in str(e):
-                raise ValueError("Вы уже участвовали в розыгрыше сегодня")
-            else:
-                raise Exception(f"Ошибка сохранения в базу данных: {str(e)}")
-
-        finally:
-            if conn:
-                conn.close()
+            raise Exception(f"Ошибка сохранения в базу данных: {str(e)}")
     
+    def save_participant(self, kode_slovo, user_id, username, first_name, phone):
+        """Сохранение участника в базу данных (ValueError, если пользователь уже участвовал сегодня)"""
+        result = self.register_participant(kode_slovo, user_id, username, first_name, phone)
+        
+        if not result.created:
+            if result.registration_time:
+                raise ValueError(f"Вы уже участвовали в розыгрыше сегодня в {result.registration_time} с кодовым словом {result.kode_slovo}. Попробуйте завтра!")
+            raise ValueError("Вы уже участвовали в розыгрыше сегодня")
+        
+        return True
+    
+    @timed(DB_QUERY_DURATION, 'get_participants_by_date')
     def get_participants_by_date(self, date):
         """Получение участников по дате"""
         conn = None
@@ -165,17 +425,14 @@ class Database:
             cursor = conn.cursor()
             
             # Проверяем формат даты
-            try:
-                datetime.strptime(date, "%d.%m.%Y")
-            except ValueError:
-                raise ValueError("Неверный формат даты")
+            iso_date = to_iso_date(date)
             
             cursor.execute('''
                 SELECT date, kode_slovo, first_name, username, phone, registration_time
                 FROM participants 
                 WHERE date = ?
                 ORDER BY registration_time
-            ''', (date,))
+            ''', (iso_date,))
             
             participants = cursor.fetchall()
             
@@ -191,26 +448,241 @@ class Database:
         except Exception as e:
             logger.error(f"❌ Неизвестная ошибка при чтении: {e}\n{traceback.format_exc()}")
             raise
+    
+    @timed(DB_QUERY_DURATION, 'get_participants_page')
+    def get_participants_page(self, date, after_cursor=None, limit=40, before_cursor=None):
+        """
+        Страница участников за дату (keyset-пагинация по индексу (date, registration_time, id)).
+        Курсор - пара (registration_time, id): after_cursor - записи после него,
+        before_cursor - записи перед ним (предыдущая страница).
+        """
+        iso_date = to_iso_date(date)
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.row_factory = None  # Обычные кортежи вместо sqlite3.Row
+        
+        if before_cursor is not None:
+            cursor.execute('''
+                SELECT registration_time, kode_slovo, first_name, username, phone, id
+                FROM participants 
+                WHERE date = ? AND (registration_time, id) < (?, ?)
+                ORDER BY registration_time DESC, id DESC
+                LIMIT ?
+            ''', (iso_date, before_cursor[0], before_cursor[1], limit + 1))
+            rows = cursor.fetchall()
+            return ParticipantsPage(rows[:limit][::-1], len(rows) > limit)
+        
+        if after_cursor is not None:
+            cursor.execute('''
+                SELECT registration_time, kode_slovo, first_name, username, phone, id
+                FROM participants 
+                WHERE date = ? AND (registration_time, id) > (?, ?)
+                ORDER BY registration_time, id
+                LIMIT ?
+            ''', (iso_date, after_cursor[0], after_cursor[1], limit + 1))
+        else:
+            cursor.execute('''
+                SELECT registration_time, kode_slovo, first_name, username, phone, id
+                FROM participants 
+                WHERE date = ?
+                ORDER BY registration_time, id
+                LIMIT ?
+            ''', (iso_date, limit + 1))
+        
+        rows = cursor.fetchall()
+        return ParticipantsPage(rows[:limit], len(rows) > limit)
+    
+    def iter_participants(self, date_from, date_to, batch_size=1000):
+        """
+        Потоковое чтение участников за период (даты DD.MM.YYYY включительно).
+        Строки читаются с курсора порциями и не накапливаются в памяти:
+        (date, registration_time, kode_slovo, first_name, username, phone, user_id)
+        """
+        iso_from = to_iso_date(date_from)
+        iso_to = to_iso_date(date_to)
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.arraysize = batch_size
+        
+        cursor.execute('''
+            SELECT date, registration_time, kode_slovo, first_name, username, phone, user_id
+            FROM participants 
+            WHERE date BETWEEN ? AND ?
+            ORDER BY date, registration_time, id
+        ''', (iso_from, iso_to))
+        
+        try:
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                for row in rows:
+                    yield (to_display_date(row[0]),) + row[1:]
         finally:
-            if conn:
-                conn.close()
+            cursor.close()
     
-    def can_user_participate_today(self, user_id):
-        """Проверка, может ли пользователь участвовать сегодня"""
+    @timed(DB_QUERY_DURATION, 'set_code_words')
+    def set_code_words(self, date, words, admin_id=None):
+        """
+        Правильные кодовые слова за дату (заменяют ранее заданные).
+        Уже записанные участники переоцениваются пакетами по диапазонам id:
+        новые регистрации после сохранения слов оцениваются при вставке.
+        Возвращает число участников с правильным словом.
+        """
+        iso_date = to_iso_date(date)
+        normalized = {}
+        for word in words:
+            key = normalize_kode_slovo(word)
+            if key:
+                normalized.setdefault(key, ''.join(word.split()))
+        
+        if not normalized:
+            raise ValueError("Не задано ни одного кодового слова")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute('DELETE FROM code_words WHERE date = ?', (iso_date,))
+            cursor.executemany('''
+                INSERT INTO code_words (date, word, original, admin_id)
+                VALUES (?, ?, ?, ?)
+            ''', [(iso_date, word, original, admin_id) for word, original in normalized.items()])
+            
+            # Граница переоценки: записи после нее уже оценены при вставке по новым словам
+            cursor.execute('SELECT MIN(id), MAX(id) FROM participants WHERE date = ?', (iso_date,))
+            min_id, max_id = cursor.fetchone()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        regraded = 0
+        if min_id is not None:
+            # Короткие транзакции, чтобы не задерживать регистрации на большой базе
+            for start in range(min_id - 1, max_id, REGRADE_BATCH_SIZE):
+                cursor.execute('''
+                    UPDATE participants
+                    SET is_correct = NOT is_correct
+                    WHERE date = ?1 AND id > ?2 AND id <= ?3
+                      AND is_correct != EXISTS (
+                          SELECT 1 FROM code_words
+                          WHERE date = ?1 AND word = normalize_kode_slovo(participants.kode_slovo)
+                      )
+                ''', (iso_date, start, min(start + REGRADE_BATCH_SIZE, max_id)))
+                regraded += cursor.rowcount
+                conn.commit()
+        
+        correct = self.count_correct(date)
+        logger.info(f"🔑 Кодовые слова за {date}: {', '.join(normalized.values())}; "
+                    f"переоценено записей: {regraded}, правильных: {correct}")
+        return correct
+    
+    @timed(DB_QUERY_DURATION, 'get_code_words')
+    def get_code_words(self, date):
+        """Правильные кодовые слова за дату в том виде, в каком их задал администратор"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT original FROM code_words
+            WHERE date = ?
+            ORDER BY created_at, word
+        ''', (to_iso_date(date),))
+        return [row[0] for row in cursor.fetchall()]
+    
+    @timed(DB_QUERY_DURATION, 'count_correct')
+    def count_correct(self, date):
+        """Число участников за дату с правильным кодовым словом (только по индексу)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT COUNT(*) FROM participants WHERE date = ? AND is_correct = 1',
+            (to_iso_date(date),)
+        )
+        return cursor.fetchone()[0]
+    
+    @timed(DB_QUERY_DURATION, 'draw_winners')
+    def draw_winners(self, date, winners_count=1, admin_id=None, seed=None):
+        """
+        Случайный выбор победителей среди участников за дату с правильным кодовым словом.
+        Число подходящих участников и каждый победитель читаются по индексу (date, is_correct)
+        через OFFSET, весь день в память не загружается. Seed и результат записываются
+        в таблицу draws: тот же seed на тех же данных дает тех же победителей.
+        """
+        iso_date = to_iso_date(date)
+        
+        if seed is None:
+            seed = secrets.randbits(63)
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        
+        # Подсчет, выбор и запись в журнал - одна транзакция (данные не меняются между шагами)
+        cursor.execute("BEGIN IMMEDIATE")
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            current_date = datetime.now().strftime("%d.%m.%Y")
-            
             cursor.execute('''
-                SELECT COUNT(*) as count 
-                FROM participants 
-                WHERE user_id = ? AND date = ?
-            ''', (user_id, current_date))
+                SELECT COUNT(*) FROM participants
+                WHERE date = ? AND is_correct = 1
+            ''', (iso_date,))
+            pool_size = cursor.fetchone()[0]
+            
+            # Равновероятный выбор позиций без повторов
+            offsets = random.Random(seed).sample(range(pool_size), min(winners_count, pool_size))
+            
+            winner_ids = []
+            for offset in offsets:
+                cursor.execute('''
+                    SELECT id FROM participants
+                    WHERE date = ? AND is_correct = 1
+                    ORDER BY id
+                    LIMIT 1 OFFSET ?
+                ''', (iso_date, offset))
+                winner_ids.append(cursor.fetchone()[0])
+            
+            cursor.execute('SELECT original FROM code_words WHERE date = ? ORDER BY word', (iso_date,))
+            kode_slovo = ', '.join(row[0] for row in cursor.fetchall())
             
-            result = cursor.fetchone()
-            can_participate = result['count'] == 0
+            cursor.execute('''
+                INSERT INTO draws (date, kode_slovo, winners_requested, seed, pool_size, winner_ids, admin_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (iso_date, kode_slovo, winners_count, seed, pool_size, json.dumps(winner_ids), admin_id))
+            draw_id = cursor.lastrowid
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        winners = []
+        if winner_ids:
+            cursor.execute(f'''
+                SELECT id, registration_time, kode_slovo, first_name, username, phone, user_id
+                FROM participants
+                WHERE id IN ({','.join('?' * len(winner_ids))})
+            ''', winner_ids)
+            rows = {row[0]: row for row in cursor.fetchall()}
+            winners = [rows[winner_id] for winner_id in winner_ids]
+        
+        logger.info(f"Розыгрыш #{draw_id} за {date}: {len(winners)} из {pool_size}, seed {seed}")
+        return DrawResult(draw_id, seed, pool_size, winners)
+    
+    @timed(DB_QUERY_DURATION, 'count_participants')
+    def count_participants(self, date):
+        """Число участников за дату (по сводной таблице)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT participants FROM daily_stats WHERE date = ?', (to_iso_date(date),))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    
+    def can_user_participate_today(self, user_id):
+        """Проверка, может ли пользователь участвовать сегодня (по индексу в памяти, без запроса к БД)"""
+        try:
+            can_participate = not self.today_participants.contains(user_id)
             
             if not can_participate:
                 logger.info(f"Пользователь {user_id} уже участвовал сегодня")
@@ -222,9 +694,31 @@ class Database:
         except Exception as e:
             logger.error(f"Ошибка проверки участия пользователя: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
+    
+    @timed(DB_QUERY_DURATION, 'get_registration')
+    def _get_registration(self, user_id, iso_date):
+        """(кодовое слово, время регистрации) участника за дату или None"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT kode_slovo, registration_time 
+            FROM participants 
+            WHERE user_id = ? AND date = ?
+        ''', (user_id, iso_date))
+        row = cursor.fetchone()
+        return (row['kode_slovo'], row['registration_time']) if row else None
+    
+    @timed(DB_QUERY_DURATION, 'load_user_ids_for_date')
+    def _load_user_ids_for_date(self, iso_date):
+        """user_id всех участников за дату (для прогрева индекса в памяти)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT user_id 
+            FROM participants 
+            WHERE date = ?
+        ''', (iso_date,))
+        return [row[0] for row in cursor.fetchall()]
     
     def check_database_integrity(self):
         """Проверка целостности базы данных"""
@@ -247,12 +741,10 @@ class Database:
         except Exception as e:
             logger.error(f"❌ Ошибка проверки целостности БД: {e}\n{traceback.format_exc()}")
             return False
-        finally:
-            if conn:
-                conn.close()
     
+    @timed(DB_QUERY_DURATION, 'get_database_stats')
     def get_database_stats(self):
-        """Получение статистики базы данных"""
+        """Получение статистики базы данных (по сводной таблице daily_stats)"""
         conn = None
         try:
             conn = self.get_connection()
@@ -261,12 +753,12 @@ class Database:
             # Общая статистика
             cursor.execute('''
                 SELECT 
-                    COUNT(*) as total_participants,
-                    COUNT(DISTINCT date) as unique_dates,
-                    COUNT(DISTINCT user_id) as unique_users,
+                    SUM(participants) as total_participants,
+                    COUNT(*) as unique_dates,
+                    SUM(new_users) as unique_users,
                     MIN(date) as first_date,
                     MAX(date) as last_date
-                FROM participants
+                FROM daily_stats
             ''')
             
             stats_row = cursor.fetchone()
@@ -278,13 +770,15 @@ class Database:
             stats = dict(stats_row)
             
             # Статистика по датам
+            # Правильные ответы считаются по индексу (date, is_correct), без чтения записей
             cursor.execute('''
                 SELECT 
                     date,
-                    COUNT(*) as count,
-                    GROUP_CONCAT(DISTINCT kode_slovo) as kode_slova
-                FROM participants
-                GROUP BY date
+                    participants as count,
+                    (SELECT COUNT(*) FROM participants p
+                     WHERE p.date = daily_stats.date AND p.is_correct = 1) as correct,
+                    EXISTS (SELECT 1 FROM code_words w WHERE w.date = daily_stats.date) as has_code_words
+                FROM daily_stats
                 ORDER BY date DESC
                 LIMIT 5
             ''')
@@ -293,58 +787,88 @@ class Database:
             recent_dates = []
             
             for row in recent_dates_rows:
-                recent_dates.append(dict(row))
+                date_stat = dict(row)
+                date_stat['date'] = to_display_date(date_stat['date'])
+                recent_dates.append(date_stat)
             
             return {
                 'total_participants': stats.get('total_participants', 0) or 0,
                 'unique_dates': stats.get('unique_dates', 0) or 0,
                 'unique_users': stats.get('unique_users', 0) or 0,
-                'first_date': stats.get('first_date', 'Нет данных') or 'Нет данных',
-                'last_date': stats.get('last_date', 'Нет данных') or 'Нет данных',
+                'first_date': to_display_date(stats.get('first_date')) or 'Нет данных',
+                'last_date': to_display_date(stats.get('last_date')) or 'Нет данных',
                 'recent_dates': recent_dates
             }
             
         except Exception as e:
             logger.error(f"❌ Ошибка получения статистики БД: {e}\n{traceback.format_exc()}")
             return None
-        finally:
-            if conn:
-                conn.close()
     
-    def migrate_to_kode_slovo(self):
-        """Миграция данных из старого формата (если нужно)"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Проверяем, существует ли колонка lottery_number
-            cursor.execute("PRAGMA table_info(participants)")
-            columns = [col[1] for col in cursor.fetchall()]
-            
-            if 'lottery_number' in columns and 'kode_slovo' not in columns:
-                logger.info("Начинаем миграцию данных из lottery_number в kode_slovo...")
-                
-                # Добавляем новую колонку
-                cursor.execute('ALTER TABLE participants ADD COLUMN kode_slovo TEXT')
-                
-                # Копируем данные из lottery_number в kode_slovo
-                cursor.execute('UPDATE participants SET kode_slovo = lottery_number')
-                
-                # Удаляем старую колонку (если нужно)
-                # cursor.execute('ALTER TABLE participants DROP COLUMN lottery_number')
-                
-                conn.commit()
-                logger.info("✅ Миграция данных завершена успешно")
-                return True
-            else:
-                logger.info("Миграция не требуется: колонка kode_slovo уже существует или lottery_number отсутствует")
-                return False
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка миграции данных: {e}\n{traceback.format_exc()}")
-            if conn:
-                conn.rollback()
-            return False
-        finally:
-            if conn:
-                conn.close()
\ No newline at end of file
+    @timed(DB_QUERY_DURATION, 'check_stats_consistency')
+    def check_stats_consistency(self):
+        """
+        Сверка сводной статистики с таблицей участников (полный проход по participants).
+        Возвращает список расхождений; пустой список - статистика корректна.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT date, COUNT(*) as participants
+            FROM participants
+            GROUP BY date
+        ''')
+        actual = {row['date']: row['participants'] for row in cursor.fetchall()}
+        
+        cursor.execute('SELECT date, participants FROM daily_stats')
+        stored = {row['date']: row['participants'] for row in cursor.fetchall()}
+        
+        problems = []
+        for date in sorted(set(actual) | set(stored)):
+            if actual.get(date, 0) != stored.get(date, 0):
+                problems.append(
+                    f"{to_display_date(date)}: в сводке {stored.get(date, 0)}, фактически {actual.get(date, 0)}"
+                )
+        
+        cursor.execute('''
+            SELECT 
+                (SELECT COUNT(DISTINCT user_id) FROM participants) as actual_users,
+                (SELECT COALESCE(SUM(new_users), 0) FROM daily_stats) as stored_users
+        ''')
+        users_row = cursor.fetchone()
+        if users_row['actual_users'] != users_row['stored_users']:
+            problems.append(
+                f"Уникальных пользователей: в сводке {users_row['stored_users']}, фактически {users_row['actual_users']}"
+            )
+        
+        if problems:
+            logger.warning(f"Расхождения в сводной статистике: {problems}")
+        else:
+            logger.info("✅ Сводная статистика совпадает с данными участников")
+        
+        return problems
+    
+    def rebuild_stats(self):
+        """Пересчет сводной статистики с нуля"""
+        rebuild_daily_stats(self.get_connection())
+        self.dates_version += 1
+        logger.info("✅ Сводная статистика пересчитана")
+    
+    @timed(DB_QUERY_DURATION, 'get_recent_dates')
+    def get_recent_dates(self, limit=10):
+        """Последние даты с участниками (DD.MM.YYYY, от новых к старым) и общее число дней"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT date 
+            FROM daily_stats 
+            ORDER BY date DESC
+            LIMIT ?
+        ''', (limit,))
+        dates = [to_display_date(row['date']) for row in cursor.fetchall()]
+        
+        cursor.execute('SELECT COUNT(*) FROM daily_stats')
+        total_days = cursor.fetchone()[0]
+        
+        return dates, total_days
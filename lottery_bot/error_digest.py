@@ -0,0 +1,167 @@
+# lottery_bot/error_digest.py
+import logging
+import os
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Файлы бота: место ошибки ищется сначала в них, а не в глубине библиотек
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Обертки (замеры, пулы потоков), которые не считаются местом ошибки
+WRAPPER_FILES = ('query_stats.py', 'metrics.py', 'outbound.py', 'workers.py')
+
+# Не больше стольких сигнатур в одной сводке (остальные - одной строкой)
+DIGEST_MAX_ITEMS = 10
+
+# Предел числа запоминаемых сигнатур (новые сверх него не вызывают мгновенных уведомлений)
+MAX_SIGNATURES = 1000
+
+# Лимит Telegram на длину сообщения - 4096 символов
+MAX_TEXT_LENGTH = 4000
+
+
+def error_location(error):
+    """Место ошибки: самый глубокий кадр в файлах бота, кроме оберток (или просто самый глубокий кадр)"""
+    frames = traceback.extract_tb(error.__traceback__) if error.__traceback__ else []
+    if not frames:
+        return 'неизвестно'
+    frames = [frame for frame in frames if os.path.basename(frame.filename) not in WRAPPER_FILES] or frames
+    own = [frame for frame in frames if os.path.abspath(frame.filename).startswith(BOT_DIR)]
+    frame = (own or frames)[-1]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+
+
+def format_duration(seconds):
+    """Длительность для сообщения: секунды до двух минут, дальше минуты"""
+    if seconds < 120:
+        return f"{seconds:.0f} с"
+    return f"{seconds / 60:.0f} мин"
+
+
+class SignatureStats:
+    """Ошибки одной сигнатуры (тип + место): всего с запуска и последний пример"""
+    __slots__ = ('error_type', 'location', 'total', 'last_message', 'last_user_id')
+
+    def __init__(self, error_type, location):
+        self.error_type = error_type
+        self.location = location
+        self.total = 0
+        self.last_message = ''
+        self.last_user_id = None
+
+
+class ErrorDigest:
+    """
+    Уведомления администратора об ошибках без лавины сообщений.
+    Ошибки группируются по типу и месту возникновения. О новой сигнатуре
+    администратор узнает сразу (не больше alert_limit раз за интервал),
+    повторы собираются в одну сводку раз в interval секунд.
+    Отправка идет в отдельном потоке, обработчики не ждут Bot API.
+    """
+
+    def __init__(self, send, interval=300, alert_limit=5):
+        self._send = send  # send(text) - отправка сообщения администратору
+        self.interval = interval
+        self.alert_limit = alert_limit
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._signatures = {}  # (тип, место) -> SignatureStats
+        self._window = {}  # (тип, место) -> повторов за текущий интервал, еще не отправленных
+        self._alerts = []  # тексты мгновенных уведомлений в очереди на отправку
+        self._alerts_in_window = 0
+        self._window_started = time.monotonic()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Запуск потока отправки"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='error-digest', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка: накопленные уведомления и сводка отправляются сразу"""
+        if self._thread is None:
+            return
+        self._running = False
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    def report(self, error, user_id=None):
+        """Учет ошибки (вызывается из обработчиков, не блокирует на отправке)"""
+        key = (type(error).__name__, error_location(error))
+        message = str(error)[:200]
+
+        with self._lock:
+            stats = self._signatures.get(key)
+            is_new = stats is None
+            if is_new:
+                if len(self._signatures) >= MAX_SIGNATURES:
+                    # Сигнатура сверх предела: только счетчик в сводке, без уведомления
+                    self._window[key] = self._window.get(key, 0) + 1
+                    return
+                stats = self._signatures[key] = SignatureStats(*key)
+            stats.total += 1
+            stats.last_message = message
+            stats.last_user_id = user_id
+
+            if is_new and self._alerts_in_window < self.alert_limit:
+                self._alerts_in_window += 1
+                self._alerts.append(self._format_alert(stats))
+                self._wakeup.set()
+            else:
+                self._window[key] = self._window.get(key, 0) + 1
+
+    def _run(self):
+        while self._running:
+            remaining = self._window_started + self.interval - time.monotonic()
+            self._wakeup.wait(max(remaining, 0))
+            self._wakeup.clear()
+            self._flush(final=False)
+        self._flush(final=True)
+
+    def _flush(self, final):
+        with self._lock:
+            alerts, self._alerts = self._alerts, []
+            window = None
+            elapsed = time.monotonic() - self._window_started
+            if final or elapsed >= self.interval:
+                window, self._window = self._window, {}
+                self._alerts_in_window = 0
+                self._window_started = time.monotonic()
+            digest = self._format_digest(window, elapsed) if window else None
+
+        for text in alerts + ([digest] if digest else []):
+            try:
+                self._send(text)
+            except Exception as e:
+                logger.error(f"Не удалось отправить уведомление об ошибках администратору: {e}")
+
+    def _format_alert(self, stats):
+        return (
+            f"⚠️ Новая ошибка в боте:\n\n"
+            f"Тип: {stats.error_type}\n"
+            f"Место: {stats.location}\n"
+            f"Сообщение: {stats.last_message}\n"
+            f"Пользователь: {stats.last_user_id or 'неизвестен'}\n\n"
+            f"Повторы попадут в сводку (раз в {format_duration(self.interval)})"
+        )
+
+    def _format_digest(self, window, elapsed):
+        items = sorted(window.items(), key=lambda item: item[1], reverse=True)
+        lines = [
+            f"📋 Ошибки за {format_duration(elapsed)}: {sum(window.values())} "
+            f"(видов: {len(window)})\n"
+        ]
+        for key, count in items[:DIGEST_MAX_ITEMS]:
+            stats = self._signatures.get(key)
+            line = f"• {key[0]} × {count}\n  {key[1]}"
+            lines.append(f"{line}\n  {stats.last_message}" if stats else line)
+        if len(items) > DIGEST_MAX_ITEMS:
+            rest = sum(count for _, count in items[DIGEST_MAX_ITEMS:])
+            lines.append(f"... и еще {len(items) - DIGEST_MAX_ITEMS} видов ({rest} ошибок)")
+        return '\n'.join(lines)[:MAX_TEXT_LENGTH]
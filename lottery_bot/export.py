@@ -0,0 +1,63 @@
+# lottery_bot/export.py
+import csv
+import gzip
+import io
+import re
+import tempfile
+
+# До этого размера файл выгрузки держится в памяти, дальше - на диске
+EXPORT_SPOOL_MAX_SIZE = 5 * 1024 * 1024
+
+EXPORT_HEADER = ['Дата', 'Время', 'Кодовое слово', 'Имя', 'Username', 'Телефон', 'User ID']
+
+# Начало ячейки, которое Excel воспринимает как формулу
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Числа и телефоны (+79...) формулой быть не могут и выгружаются как есть
+PLAIN_NUMBER = re.compile(r'\+?\d+')
+
+
+def escape_cell(value):
+    """Текст от пользователя, похожий на формулу, экранируется апострофом"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES) and not PLAIN_NUMBER.fullmatch(value):
+        return "'" + value
+    return value
+
+
+def write_participants_csv(rows, compress=False):
+    """
+    Запись строк участников в CSV во временный файл (при необходимости со сжатием gzip).
+    rows - итератор кортежей из Database.iter_participants.
+    Возвращает (файл, позиционированный на начало, число записей).
+    """
+    export_file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE, mode='w+b')
+    gzip_file = None
+
+    try:
+        target = export_file
+        if compress:
+            gzip_file = gzip.GzipFile(fileobj=export_file, mode='wb')
+            target = gzip_file
+
+        # utf-8-sig: Excel правильно открывает кириллицу
+        text_stream = io.TextIOWrapper(target, encoding='utf-8-sig', newline='')
+        writer = csv.writer(text_stream, delimiter=';')
+        writer.writerow(EXPORT_HEADER)
+
+        count = 0
+        for row in rows:
+            writer.writerow([escape_cell(value) for value in row])
+            count += 1
+
+        # Отсоединяем обертку, чтобы она не закрыла файл выгрузки
+        text_stream.flush()
+        text_stream.detach()
+        if gzip_file is not None:
+            gzip_file.close()
+
+        export_file.seek(0)
+        return export_file, count
+
+    except Exception:
+        export_file.close()
+        raise
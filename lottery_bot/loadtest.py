@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест регистрации без Telegram.
+
+Синтетические пользователи проходят сценарий /start -> кодовое слово -> контакт.
+Обновления идут через настоящий диспетчер и ConversationHandler бота, ответы
+принимает заглушка Bot API, участники записываются во временную базу.
+Каждый пользователь отправляет следующее сообщение только после ответа бота
+(плюс время на размышление), как в живом чате.
+
+Отчет: p50/p95/p99 времени ответа по шагам (от постановки обновления в очередь
+диспетчера до отправки ответа), скорость записи в БД, число ошибок.
+
+Запуск:
+    python loadtest.py --users 5000 --duration 60 --curve spike
+    python loadtest.py --users 20000 --duration 120 --engine async --json result.json
+
+Остальные настройки бота (USER_LANE_WORKERS, DB_WRITE_BATCH_SIZE, SQLITE_SYNCHRONOUS...)
+берутся из переменных окружения, как при обычном запуске.
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from queue import Queue
+
+# Каталог запуска: относительный путь --json считается от него (тест работает во временном каталоге)
+START_DIR = os.getcwd()
+
+# Синтетические пользователи не пересекаются с ID администратора
+USER_ID_BASE = 10 ** 9
+
+# Кодовые слова, которые отправляют пользователи (с опечатками и разным регистром)
+CODE_WORDS = ["Снежинка", "снежинка", "СНЕЖИНКА", "снеж инка", "Снежинко", "Ёлка", "елка", "Подарок"]
+
+# Шаги сценария
+STEP_START, STEP_CODE, STEP_CONTACT = range(3)
+STEP_NAMES = ['/start', 'кодовое слово', 'контакт']
+
+# Форма потока пользователей
+CURVES = ('constant', 'ramp', 'spike', 'poisson')
+
+
+def arrival_times(curve, users, duration, rng):
+    """Моменты прихода пользователей (секунды от начала теста) для заданной формы нагрузки"""
+    if curve == 'constant':
+        return [i * duration / users for i in range(users)]
+
+    if curve == 'ramp':
+        # Интенсивность растет линейно от нуля до максимума в конце теста
+        return [duration * math.sqrt(i / users) for i in range(users)]
+
+    if curve == 'spike':
+        # Кодовое слово показали в эфире: резкий всплеск и экспоненциальный спад
+        tau = duration / 5
+        scale = 1 - math.exp(-duration / tau)
+        return [-tau * math.log(1 - i / users * scale) for i in range(users)]
+
+    # poisson: независимые приходы с постоянной средней интенсивностью
+    rate = users / duration
+    times = []
+    t = 0.0
+    for _ in range(users):
+        t += rng.expovariate(rate)
+        times.append(t)
+    return times
+
+
+def percentile(sorted_values, p):
+    """Перцентиль по отсортированному списку (метод ближайшего ранга)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест регистрации участников")
+    parser.add_argument('--users', type=int, default=5000, help="число пользователей")
+    parser.add_argument('--duration', type=float, default=60, help="за сколько секунд приходят пользователи")
+    parser.add_argument('--curve', choices=CURVES, default='spike', help="форма потока пользователей")
+    parser.add_argument('--think', type=float, default=1.0,
+                        help="среднее время между ответом бота и следующим сообщением, секунды")
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help="задержка ответа заглушки Bot API, миллисекунды")
+    parser.add_argument('--engine', choices=('sync', 'async'), help="режим обработки (по умолчанию BOT_ENGINE)")
+    parser.add_argument('--outbound', action='store_true',
+                        help="отправлять ответы через планировщик с лимитами Telegram")
+    parser.add_argument('--timeout', type=float, default=60,
+                        help="сколько ждать завершения сценариев после прихода последнего пользователя")
+    parser.add_argument('--seed', type=int, default=1, help="seed генератора случайных чисел")
+    parser.add_argument('--json', metavar='PATH', help="сохранить результат в JSON")
+    parser.add_argument('--keep-db', action='store_true', help="не удалять временную базу")
+    return parser.parse_args()
+
+
+def prepare_environment(args):
+    """Временная база и настройки бота: задаются до импорта config"""
+    workdir = tempfile.mkdtemp(prefix='lottery_loadtest_')
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'loadtest.db')
+    os.environ.setdefault('BOT_TOKEN', '123456:LOADTEST')
+    os.environ.setdefault('ADMIN_ID', '1')
+    if args.engine:
+        os.environ['BOT_ENGINE'] = args.engine
+
+    # Модули бота лежат рядом со скриптом; bot_errors.log создается во временном каталоге
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    return workdir
+
+
+class LoadTest:
+    """Генератор сообщений пользователей и учет ответов бота"""
+
+    def __init__(self, args, bot_module, templates_module):
+        self.args = args
+        self.bot_module = bot_module
+        self.rng = random.Random(args.seed)
+
+        self.registered_text = templates_module.render('registered')[0]
+        self.busy_text = templates_module.render('busy')[0]
+        self.error_keys = {
+            templates_module.render(key)[0]: key
+            for key, template in templates_module.TEMPLATES.items()
+            if not template.dynamic and template.text.startswith(('❌', '⚠️'))
+        }
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._events = []      # (время отправки, user_id, шаг) - куча
+        self._pending = {}     # user_id -> (шаг, время постановки в очередь)
+        self._update_ids = itertools.count(1)
+
+        self.latencies = [[] for _ in STEP_NAMES]
+        self.registered_at = []
+        self.errors = Counter()
+        self.busy_retries = 0
+        self.finished = 0
+        self.dispatcher_errors = 0
+
+    # Ответы бота (вызывается из потоков обработчиков через заглушку Bot API)
+    def on_reply(self, chat_id, text):
+        now = time.perf_counter()
+        with self._lock:
+            pending = self._pending.pop(chat_id, None)
+            if pending is None:
+                return
+            step, sent_at = pending
+
+            if text == self.busy_text:
+                # Сообщение пришло, пока обрабатывалось предыдущее: пользователь повторит его
+                self.busy_retries += 1
+                self._schedule(now + self.rng.uniform(0.2, 0.5), chat_id, step)
+                return
+
+            self.latencies[step].append(now - sent_at)
+
+            if text.startswith(('❌', '⚠️')):
+                self.errors[self.error_keys.get(text, 'other')] += 1
+                self.finished += 1
+            elif step == STEP_CONTACT:
+                if text == self.registered_text:
+                    self.registered_at.append(now)
+                else:
+                    self.errors['unexpected_reply'] += 1
+                self.finished += 1
+            else:
+                self._schedule(now + self.rng.expovariate(1 / self.args.think) if self.args.think else now,
+                               chat_id, step + 1)
+
+    def on_dispatcher_error(self, update, context):
+        with self._lock:
+            self.dispatcher_errors += 1
+        logging.getLogger(__name__).error(f"Ошибка обработчика: {context.error}")
+
+    def _schedule(self, at, user_id, step):
+        heapq.heappush(self._events, (at, user_id, step))
+        self._wakeup.notify()
+
+    def _build_update(self, user_id, step):
+        message = {
+            'message_id': next(self._update_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id - USER_ID_BASE}',
+                     'username': f'user{user_id - USER_ID_BASE}'},
+        }
+        if step == STEP_START:
+            message['text'] = '/start'
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': 6}]
+        elif step == STEP_CODE:
+            message['text'] = self.rng.choice(CODE_WORDS)
+        else:
+            message['contact'] = {'phone_number': f'+79{user_id % 10 ** 9:09d}', 'first_name': 'User',
+                                  'user_id': user_id}
+        return self.bot_module.Update.de_json(
+            {'update_id': next(self._update_ids), 'message': message}, self.dispatcher.bot
+        )
+
+    def run(self, dispatcher):
+        """Подача сообщений по расписанию до завершения всех сценариев или таймаута"""
+        self.dispatcher = dispatcher
+        args = self.args
+
+        started = time.perf_counter()
+        with self._lock:
+            for i, offset in enumerate(arrival_times(args.curve, args.users, args.duration, self.rng)):
+                self._events.append((started + offset, USER_ID_BASE + i, STEP_START))
+            heapq.heapify(self._events)
+
+        deadline = started + args.duration + args.timeout
+        next_report = started + 5
+
+        while True:
+            with self._lock:
+                if self.finished >= args.users:
+                    break
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+
+                due = []
+                while self._events and self._events[0][0] <= now:
+                    due.append(heapq.heappop(self._events))
+
+                if not due:
+                    wait = (self._events[0][0] - now) if self._events else 0.1
+                    self._wakeup.wait(min(wait, 0.1))
+                    continue
+
+                for _, user_id, step in due:
+                    self._pending[user_id] = (step, time.perf_counter())
+
+            for _, user_id, step in due:
+                dispatcher.update_queue.put(self._build_update(user_id, step))
+
+            if now >= next_report:
+                next_report = now + 5
+                print(f"  {now - started:6.1f} с: завершено {self.finished}/{args.users}, "
+                      f"в очереди диспетчера {dispatcher.update_queue.qsize()}", flush=True)
+
+        self.elapsed = time.perf_counter() - started
+        self.started = started
+        with self._lock:
+            self.unfinished = args.users - self.finished
+
+    def report(self, db_rows, write_queue_stats):
+        """Сводка результатов (словарь для JSON)"""
+        result = {
+            'users': self.args.users,
+            'duration': self.args.duration,
+            'curve': self.args.curve,
+            'engine': os.environ.get('BOT_ENGINE', 'sync'),
+            'elapsed': round(self.elapsed, 3),
+            'latency_ms': {},
+            'registered': len(self.registered_at),
+            'db_rows': db_rows,
+            'errors': dict(self.errors),
+            'dispatcher_errors': self.dispatcher_errors,
+            'unfinished': self.unfinished,
+            'busy_retries': self.busy_retries,
+        }
+
+        for step, name in enumerate(STEP_NAMES):
+            values = sorted(self.latencies[step])
+            result['latency_ms'][name] = {
+                'count': len(values),
+                'p50': round(percentile(values, 50) * 1000, 2),
+                'p95': round(percentile(values, 95) * 1000, 2),
+                'p99': round(percentile(values, 99) * 1000, 2),
+                'max': round(values[-1] * 1000, 2) if values else 0.0,
+            }
+
+        # Скорость записи: в среднем за время регистраций и в самую нагруженную секунду
+        if self.registered_at:
+            span = max(self.registered_at[-1] - self.registered_at[0], 1e-9)
+            per_second = Counter(int(t - self.started) for t in self.registered_at)
+            result['commit_rate'] = {
+                'avg_per_sec': round(len(self.registered_at) / span, 1) if len(self.registered_at) > 1 else 0.0,
+                'peak_per_sec': max(per_second.values()),
+            }
+        else:
+            result['commit_rate'] = {'avg_per_sec': 0.0, 'peak_per_sec': 0}
+
+        if write_queue_stats:
+            result['write_queue'] = {
+                'transactions': write_queue_stats['batches_committed'],
+                'avg_batch_size': round(write_queue_stats['avg_batch_size'], 1),
+                'max_flush_ms': round(write_queue_stats['max_flush_ms'], 2),
+                'failed_batches': write_queue_stats['failed_batches'],
+            }
+
+        return result
+
+
+def print_report(result):
+    print(f"\n📊 Пользователей: {result['users']}, поток: {result['curve']} за {result['duration']} с, "
+          f"режим: {result['engine']}, тест шел {result['elapsed']} с\n")
+
+    print(f"{'шаг':<16}{'ответов':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for name, stats in result['latency_ms'].items():
+        print(f"{name:<16}{stats['count']:>9}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+
+    commit_rate = result['commit_rate']
+    print(f"\n💾 Зарегистрировано: {result['registered']} (записей в БД: {result['db_rows']})")
+    print(f"   Запись в БД: в среднем {commit_rate['avg_per_sec']}/с, пик {commit_rate['peak_per_sec']}/с")
+    if 'write_queue' in result:
+        write_queue = result['write_queue']
+        print(f"   Групповой коммит: транзакций {write_queue['transactions']}, "
+              f"в среднем {write_queue['avg_batch_size']} записей, максимум {write_queue['max_flush_ms']} мс")
+
+    errors_total = sum(result['errors'].values()) + result['dispatcher_errors'] + result['unfinished']
+    print(f"\n{'✅' if not errors_total else '⚠️'} Ошибок: {errors_total}")
+    for key, count in sorted(result['errors'].items()):
+        print(f"   {key}: {count}")
+    if result['dispatcher_errors']:
+        print(f"   ошибки обработчиков: {result['dispatcher_errors']}")
+    if result['unfinished']:
+        print(f"   не завершили сценарий до таймаута: {result['unfinished']}")
+    if result['busy_retries']:
+        print(f"   повторов после ответа «подождите»: {result['busy_retries']}")
+
+
+def main():
+    args = parse_args()
+    workdir = prepare_environment(args)
+
+    from telegram import Bot
+    from telegram.ext import Dispatcher
+    from telegram.utils.request import Request
+
+    import bot as bot_module
+    import templates
+    from config import config
+    from outbound import OutboundLimiter, QueuedBot
+    from persistence import SQLitePersistence
+    from workers import WorkerLanes
+
+    # Журнал бота на уровне INFO пишет строку на каждое сообщение - в тесте только предупреждения
+    logging.getLogger().setLevel(logging.WARNING)
+
+    test = LoadTest(args, bot_module, templates)
+    api_latency = args.api_latency / 1000
+
+    class StubRequest(Request):
+        """Заглушка Bot API: ответы передаются в тест вместо отправки в Telegram"""
+
+        message_ids = itertools.count(1)
+
+        def post(self, url, data=None, timeout=None):
+            method = url.rsplit('/', 1)[-1]
+            if api_latency:
+                time.sleep(api_latency)
+            if method == 'getMe':
+                return {'id': 123456, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'loadtest_bot'}
+            if method == 'sendMessage':
+                test.on_reply(data['chat_id'], data.get('text', ''))
+                return {
+                    'message_id': next(self.message_ids),
+                    'date': int(time.time()),
+                    'chat': {'id': data['chat_id'], 'type': 'private'},
+                    'text': data.get('text', ''),
+                }
+            return True
+
+    request = StubRequest(con_pool_size=config.CON_POOL_SIZE)
+    if args.outbound:
+        limiter = OutboundLimiter(
+            global_rate=config.OUTBOUND_GLOBAL_RATE,
+            chat_rate=config.OUTBOUND_CHAT_RATE,
+            chat_burst=config.OUTBOUND_CHAT_BURST
+        )
+        bot = QueuedBot(config.BOT_TOKEN, request=request, limiter=limiter, max_retries=config.OUTBOUND_MAX_RETRIES)
+    else:
+        bot = Bot(config.BOT_TOKEN, request=request)
+
+    persistence = None
+    if config.PERSISTENCE_ENABLED:
+        persistence = SQLitePersistence(bot_module.db, flush_interval=config.PERSISTENCE_FLUSH_INTERVAL)
+
+    dispatcher = Dispatcher(bot, Queue(), workers=config.BOT_WORKERS, persistence=persistence, use_context=True)
+
+    lanes = None
+    if config.BOT_ENGINE == 'async':
+        lanes = WorkerLanes(config.USER_LANE_WORKERS, config.ADMIN_LANE_WORKERS)
+        lanes.start()
+
+    bot_module.register_handlers(dispatcher, lanes=lanes)
+    dispatcher.add_error_handler(test.on_dispatcher_error)
+
+    ready = threading.Event()
+    threading.Thread(target=dispatcher.start, kwargs={'ready': ready}, name='dispatcher', daemon=True).start()
+    ready.wait()
+
+    print(f"🚀 {args.users} пользователей, поток {args.curve} за {args.duration} с, "
+          f"режим {config.BOT_ENGINE}, база {config.DATABASE_PATH}", flush=True)
+    try:
+        test.run(dispatcher)
+    finally:
+        dispatcher.stop()
+        if lanes is not None:
+            lanes.stop()
+        if isinstance(bot, QueuedBot):
+            bot.stop()
+        if persistence is not None:
+            persistence.close()
+
+    write_queue_stats = bot_module.db.write_queue.get_stats() if bot_module.db.write_queue else None
+    bot_module.db.close()
+
+    # Сверка с базой: каждая успешная регистрация должна быть записана
+    db_rows = bot_module.db.get_connection().execute('SELECT COUNT(*) FROM participants').fetchone()[0]
+    bot_module.db.close()
+
+    result = test.report(db_rows, write_queue_stats)
+    print_report(result)
+
+    if args.json:
+        with open(args.json if os.path.isabs(args.json) else os.path.join(START_DIR, args.json), 'w') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.keep_db:
+        print(f"\nБаза сохранена: {config.DATABASE_PATH}")
+    else:
+        os.chdir(START_DIR)
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+    return 0 if result['registered'] == db_rows and not result['unfinished'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
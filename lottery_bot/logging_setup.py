@@ -0,0 +1,172 @@
+# lottery_bot/logging_setup.py
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from datetime import datetime
+from config import config
+
+# Формат текстового журнала (как раньше у logging.basicConfig)
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+SLOW_QUERY_FORMAT = '%(asctime)s - %(message)s'
+
+# Журнал медленных запросов к БД (см. query_stats.py)
+SLOW_QUERY_LOGGER = 'slow_queries'
+
+# Обработчики файлов и консоли (задаются в setup_logging)
+_handlers = None
+
+# Процесс передает записи в очередь родителя (см. forward_logging)
+_forwarding = False
+
+
+class JsonFormatter(logging.Formatter):
+    """Компактная запись журнала одной строкой JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class HotPathFilter(logging.Filter):
+    """
+    Ограничение частоты INFO/DEBUG записей с одного места в коде.
+    С каждого места за секунду проходят rate_limit записей, сверх лимита -
+    доля sample_rate. Число пропущенных добавляется к следующей записи
+    с того же места. WARNING и выше проходят всегда.
+    Счетчики без блокировки: при гонке потоков лимит соблюдается приблизительно.
+    """
+
+    def __init__(self, rate_limit=10, sample_rate=0.0):
+        super().__init__()
+        self.rate_limit = rate_limit
+        self.sample_rate = sample_rate
+        self._sites = {}  # (файл, строка) -> [начало секунды, записей, пропущено]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate_limit <= 0:
+            return True
+
+        now = time.monotonic()
+        site = self._sites.get((record.pathname, record.lineno))
+        if site is None:
+            site = self._sites.setdefault((record.pathname, record.lineno), [now, 0, 0])
+
+        if now - site[0] >= 1.0:
+            site[0] = now
+            site[1] = 0
+
+        site[1] += 1
+        if site[1] > self.rate_limit and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            site[2] += 1
+            return False
+
+        if site[2]:
+            record.msg = f"{record.getMessage()} (пропущено похожих записей: {site[2]})"
+            record.args = None
+            site[2] = 0
+        return True
+
+
+class LoggerNameFilter(logging.Filter):
+    """Пропускает записи только указанного журнала (include=True) или все, кроме него"""
+
+    def __init__(self, name, include):
+        super().__init__()
+        self.logger_name = name
+        self.include = include
+
+    def filter(self, record):
+        return (record.name == self.logger_name) == self.include
+
+
+def _file_handler(path):
+    """Файл журнала с ротацией по размеру или по времени (LOG_ROTATE_WHEN)"""
+    if config.LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=config.LOG_ROTATE_WHEN, backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+
+
+def setup_logging():
+    """
+    Настройка журналов бота. Потоки обработчиков только кладут запись в очередь,
+    в файл и консоль пишет фоновый поток QueueListener.
+    Возвращает запущенный QueueListener (останавливается и при выходе из процесса).
+    В процессе, настроенном через forward_logging, ничего не делает и возвращает None.
+    """
+    global _handlers
+    if _forwarding:
+        return None
+
+    json_format = config.LOG_FORMAT == 'json'
+
+    main_file = _file_handler(config.LOG_FILE)
+    console = logging.StreamHandler(stream=sys.stdout)
+    handlers = [main_file, console]
+    for handler in handlers:
+        handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+
+    # Медленные запросы с планами - в отдельный файл, если он задан
+    if config.SLOW_QUERY_LOG:
+        slow_file = _file_handler(config.SLOW_QUERY_LOG)
+        slow_file.setFormatter(JsonFormatter() if json_format else logging.Formatter(SLOW_QUERY_FORMAT))
+        slow_file.addFilter(LoggerNameFilter(SLOW_QUERY_LOGGER, include=True))
+        main_file.addFilter(LoggerNameFilter(SLOW_QUERY_LOGGER, include=False))
+        console.addFilter(LoggerNameFilter(SLOW_QUERY_LOGGER, include=False))
+        handlers.append(slow_file)
+
+    _handlers = handlers
+    log_queue = queue.SimpleQueue()
+    _route_root_to(log_queue)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    # Записи, оставшиеся в очереди, дописываются при завершении процесса
+    atexit.register(listener.stop)
+    return listener
+
+
+def _route_root_to(log_queue):
+    """Все записи корневого журнала - в очередь (с ограничением частоты INFO)"""
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(HotPathFilter(config.LOG_RATE_LIMIT, config.LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, config.LOG_LEVEL.upper(), logging.INFO))
+
+
+def forward_logging(log_queue):
+    """
+    Журнал дочернего процесса (cluster.py): записи передаются в multiprocessing.Queue
+    родителя, в файлы пишет только он (ротация файла из нескольких процессов небезопасна).
+    Вызывается до импорта bot.
+    """
+    global _forwarding
+    _forwarding = True
+    _route_root_to(log_queue)
+
+
+def listen_queue(log_queue):
+    """Запись в файлы и консоль записей из очереди дочерних процессов (после setup_logging)"""
+    listener = logging.handlers.QueueListener(log_queue, *_handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,354 @@
+# lottery_bot/metrics.py
+import bisect
+import functools
+import logging
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм времени, секунды
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class ThreadShards:
+    """
+    Значения метрики по потокам: каждый поток пишет в свою копию без блокировок,
+    при чтении копии суммируются. Копии завершившихся потоков сворачиваются
+    в одну, чтобы не накапливаться.
+    """
+
+    def __init__(self, factory, merge):
+        self._factory = factory
+        self._merge = merge  # merge(target, shard) - прибавить shard к target
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []  # (поток, копия)
+        self._retired = factory()
+
+    def get(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._factory()
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def collect(self):
+        """Сумма по всем потокам"""
+        total = self._factory()
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = alive
+            self._merge(total, self._retired)
+            for _, shard in alive:
+                self._merge(total, shard)
+        return total
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Семейство метрик с метками; дочерняя метрика на каждый набор значений меток"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Дочерняя метрика для значений меток (создается при первом обращении)"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            lines.extend(self._expose_child(values, child))
+        return lines
+
+
+class CounterChild:
+    __slots__ = ('_shards',)
+
+    def __init__(self):
+        self._shards = ThreadShards(lambda: [0.0], CounterChild._merge)
+
+    @staticmethod
+    def _merge(target, shard):
+        target[0] += shard[0]
+
+    def inc(self, amount=1):
+        self._shards.get()[0] += amount
+
+    def value(self):
+        return self._shards.collect()[0]
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик (скорость в секунду считает Prometheus через rate())"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _expose_child(self, values, child):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value())}']
+
+
+class HistogramChild:
+    __slots__ = ('_buckets', '_shards')
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        size = len(buckets) + 2  # корзины, +Inf и сумма в последнем элементе
+        self._shards = ThreadShards(lambda: [0] * size, HistogramChild._merge)
+
+    @staticmethod
+    def _merge(target, shard):
+        for i, value in enumerate(shard):
+            target[i] += value
+
+    def observe(self, value):
+        shard = self._shards.get()
+        shard[bisect.bisect_left(self._buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        """Накопительные значения корзин, сумма и число наблюдений"""
+        shard = self._shards.collect()
+        cumulative = []
+        running = 0
+        for count in shard[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, shard[-1], running
+
+
+class Histogram(Metric):
+    """Гистограмма длительностей с фиксированными корзинами"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _expose_child(self, values, child):
+        cumulative, total, count = child.snapshot()
+        lines = []
+        for bound, value in zip(self.buckets + (float('inf'),), cumulative):
+            labels = _format_labels(self.labelnames, values, ('le', _format_value(bound)))
+            lines.append(f'{self.name}_bucket{labels} {value}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class GaugeCallback:
+    """
+    Показатель, который вычисляется при запросе метрик.
+    callback возвращает число или словарь {кортеж значений меток: число}.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        (registry or REGISTRY).register(self)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, label_values)} {_format_value(value)}')
+        return lines
+
+
+class Registry:
+    """Набор метрик для выдачи в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        # Повторная регистрация с тем же именем заменяет прежнюю (например, при пересоздании диспетчера)
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def expose(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.expose())
+            except Exception as e:
+                logger.error(f"Ошибка получения метрики {metric.name}: {e}\n{traceback.format_exc()}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def timed(histogram, label):
+    """Декоратор: время выполнения функции записывается в гистограмму с меткой label"""
+    child = histogram.labels(label)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+
+    return decorator
+
+
+# Метрики бота
+HANDLER_DURATION = Histogram(
+    'lottery_handler_duration_seconds',
+    'Время выполнения обработчика обновления',
+    ['handler']
+)
+HANDLER_ERRORS = Counter(
+    'lottery_handler_errors_total',
+    'Необработанные ошибки обработчиков (переданные в error_handler)',
+    ['error']
+)
+DB_QUERY_DURATION = Histogram(
+    'lottery_db_query_duration_seconds',
+    'Время выполнения операции с базой данных',
+    ['query']
+)
+REGISTRATIONS = Counter(
+    'lottery_registrations_total',
+    'Успешные регистрации участников'
+)
+BOT_API_DURATION = Histogram(
+    'lottery_bot_api_request_duration_seconds',
+    'Время запроса к Bot API',
+    ['method']
+)
+BOT_API_ERRORS = Counter(
+    'lottery_bot_api_errors_total',
+    'Ошибки запросов к Bot API',
+    ['method', 'error']
+)
+
+
+def track_handler(callback):
+    """Обработчик, время выполнения которого попадает в lottery_handler_duration_seconds"""
+    return timed(HANDLER_DURATION, getattr(callback, '__name__', 'handler'))(callback)
+
+
+class MetricsServer:
+    """HTTP-сервер, отдающий метрики по GET /metrics (для Prometheus)"""
+
+    def __init__(self, registry=None, listen='127.0.0.1', port=9108):
+        self.registry = registry or REGISTRY
+        self.listen = listen
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Запуск HTTP-сервера в отдельном потоке"""
+        registry = self.registry
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = registry.expose().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.listen, self.port), RequestHandler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        logger.info(f"✅ Метрики доступны на http://{self.listen}:{self.port}/metrics")
+
+    def stop(self):
+        """Остановка HTTP-сервера"""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
@@ -0,0 +1,273 @@
+# lottery_bot/migrations.py
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк обрабатывать одной транзакцией при переносе данных,
+# чтобы не держать блокировку записи на большой базе
+MIGRATION_BATCH_SIZE = 5000
+
+
+def migration_base_schema(conn):
+    """Базовая схема: таблица участников, индексы, перенос lottery_number в kode_slovo"""
+    cursor = conn.cursor()
+
+    # Таблица участников
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS participants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,                    -- Дата в формате YYYY-MM-DD
+            kode_slovo TEXT NOT NULL,             -- Кодовое слово (до 16 символов)
+            user_id INTEGER NOT NULL,              -- ID пользователя Telegram
+            username TEXT,                         -- Username пользователя
+            first_name TEXT NOT NULL,              -- Имя пользователя
+            phone TEXT NOT NULL,                   -- Номер телефона
+            registration_time TEXT NOT NULL,       -- Время регистрации HH:MM:SS
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Индекс для быстрого поиска по дате
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_date
+        ON participants(date)
+    ''')
+
+    # Индекс для проверки уникальности (пользователь может участвовать только 1 раз в день)
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_user_date_unique
+        ON participants(user_id, date)
+    ''')
+
+    # Старые базы хранили кодовое слово в колонке lottery_number
+    cursor.execute("PRAGMA table_info(participants)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    if 'lottery_number' in columns and 'kode_slovo' not in columns:
+        logger.info("Переносим данные из lottery_number в kode_slovo...")
+        cursor.execute('ALTER TABLE participants ADD COLUMN kode_slovo TEXT')
+        cursor.execute('UPDATE participants SET kode_slovo = lottery_number')
+
+    conn.commit()
+
+
+def migration_iso_dates(conn):
+    """Перевод participants.date из DD.MM.YYYY в YYYY-MM-DD пакетами по диапазонам rowid"""
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT MAX(rowid) FROM participants')
+    max_rowid = cursor.fetchone()[0] or 0
+    converted = 0
+
+    for start in range(0, max_rowid, MIGRATION_BATCH_SIZE):
+        # Каждый пакет - отдельная короткая транзакция; повторный запуск продолжит с места остановки
+        cursor.execute('''
+            UPDATE participants
+            SET date = substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2)
+            WHERE rowid > ? AND rowid <= ?
+              AND date GLOB '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9]'
+        ''', (start, start + MIGRATION_BATCH_SIZE))
+        converted += cursor.rowcount
+        conn.commit()
+
+    logger.info(f"Даты переведены в формат ISO-8601: {converted} записей")
+
+
+def rebuild_daily_stats(conn):
+    """Полный пересчет сводных таблиц статистики по participants (одной транзакцией)"""
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute('DELETE FROM users_first_seen')
+        cursor.execute('''
+            INSERT INTO users_first_seen (user_id, first_date)
+            SELECT user_id, MIN(date)
+            FROM participants
+            GROUP BY user_id
+        ''')
+
+        cursor.execute('DELETE FROM daily_stats')
+        cursor.execute('''
+            INSERT INTO daily_stats (date, participants, new_users)
+            SELECT p.date, COUNT(*), SUM(f.first_date = p.date)
+            FROM participants p
+            JOIN users_first_seen f ON f.user_id = p.user_id
+            GROUP BY p.date
+        ''')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def migration_daily_stats(conn):
+    """Сводные таблицы статистики, поддерживаемые триггером при вставке участника"""
+    cursor = conn.cursor()
+
+    # Число участников и новых пользователей по дням
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            date TEXT PRIMARY KEY,                 -- Дата в формате YYYY-MM-DD
+            participants INTEGER NOT NULL DEFAULT 0,
+            new_users INTEGER NOT NULL DEFAULT 0   -- Пользователи, впервые участвовавшие в этот день
+        ) WITHOUT ROWID
+    ''')
+
+    # Дата первого участия каждого пользователя
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users_first_seen (
+            user_id INTEGER PRIMARY KEY,
+            first_date TEXT NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_participants_daily_stats
+        AFTER INSERT ON participants
+        BEGIN
+            INSERT OR IGNORE INTO users_first_seen (user_id, first_date)
+            VALUES (NEW.user_id, NEW.date);
+
+            INSERT INTO daily_stats (date, participants, new_users)
+            VALUES (
+                NEW.date, 1,
+                (SELECT first_date = NEW.date FROM users_first_seen WHERE user_id = NEW.user_id)
+            )
+            ON CONFLICT(date) DO UPDATE SET
+                participants = participants + 1,
+                new_users = new_users + excluded.new_users;
+        END
+    ''')
+    conn.commit()
+
+    # Разовое заполнение по уже накопленным данным
+    rebuild_daily_stats(conn)
+    logger.info("Сводная статистика по дням заполнена")
+
+
+def migration_page_index(conn):
+    """Индекс для постраничного вывода участников за день (keyset-пагинация)"""
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_date_time_id
+        ON participants(date, registration_time, id)
+    ''')
+
+    # idx_date - префикс нового индекса и больше не нужен
+    cursor.execute('DROP INDEX IF EXISTS idx_date')
+    conn.commit()
+
+
+def migration_persistence(conn):
+    """Таблицы для сохранения состояний диалогов и user_data между перезапусками"""
+    cursor = conn.cursor()
+
+    # Состояние ConversationHandler: имя обработчика, ключ диалога (JSON-массив)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state INTEGER NOT NULL,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+    ''')
+
+    # context.user_data в формате JSON
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def migration_draws(conn):
+    """Журнал розыгрышей (индекс для выборки победителей создает миграция 7)"""
+    cursor = conn.cursor()
+
+    # Журнал розыгрышей: по seed и числу подходящих участников результат воспроизводится
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS draws (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,                    -- Дата розыгрыша в формате YYYY-MM-DD
+            kode_slovo TEXT NOT NULL,              -- Правильное кодовое слово
+            winners_requested INTEGER NOT NULL,
+            seed INTEGER NOT NULL,
+            pool_size INTEGER NOT NULL,            -- Число подходящих участников на момент розыгрыша
+            winner_ids TEXT NOT NULL,              -- JSON-массив participants.id в порядке выбора
+            admin_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def migration_code_words(conn):
+    """Правильные кодовые слова по дням и оценка каждой записи участника при вставке"""
+    cursor = conn.cursor()
+
+    # word - нормализованная форма (normalize_kode_slovo), original - как ввел администратор
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS code_words (
+            date TEXT NOT NULL,                    -- Дата в формате YYYY-MM-DD
+            word TEXT NOT NULL,
+            original TEXT NOT NULL,
+            admin_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (date, word)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute("PRAGMA table_info(participants)")
+    columns = [col[1] for col in cursor.fetchall()]
+    if 'is_correct' not in columns:
+        # Слова за прошедшие дни неизвестны: записи считаются неправильными до /setword
+        cursor.execute('ALTER TABLE participants ADD COLUMN is_correct INTEGER NOT NULL DEFAULT 0')
+
+    # Подсчет правильных ответов и розыгрыш читают только этот индекс
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_date_correct
+        ON participants(date, is_correct)
+    ''')
+
+    # Индекс (date, kode_slovo) создавали ранние версии миграции 6; розыгрыш его больше не использует
+    cursor.execute('DROP INDEX IF EXISTS idx_date_kode')
+    conn.commit()
+
+
+# Миграции по порядку: номер версии схемы (PRAGMA user_version), описание, функция
+MIGRATIONS = [
+    (1, "базовая схема", migration_base_schema),
+    (2, "даты в формате ISO-8601", migration_iso_dates),
+    (3, "сводная статистика по дням", migration_daily_stats),
+    (4, "индекс для постраничного вывода", migration_page_index),
+    (5, "хранение состояний диалогов", migration_persistence),
+    (6, "розыгрыш победителей", migration_draws),
+    (7, "справочник кодовых слов", migration_code_words),
+]
+
+
+def get_schema_version(conn):
+    """Текущая версия схемы базы данных"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def run_migrations(conn):
+    """Применение всех миграций новее текущей версии схемы"""
+    version = get_schema_version(conn)
+
+    for target_version, description, migration in MIGRATIONS:
+        if target_version <= version:
+            continue
+
+        logger.info(f"🔧 Применяется миграция {target_version}: {description}")
+        migration(conn)
+
+        # Версия фиксируется только после успешного завершения миграции
+        conn.execute(f'PRAGMA user_version = {int(target_version)}')
+        conn.commit()
+        version = target_version
+
+    return version
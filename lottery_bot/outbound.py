@@ -0,0 +1,361 @@
+# lottery_bot/outbound.py
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+from telegram.utils.request import Request
+from metrics import BOT_API_DURATION, BOT_API_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки: ответы в диалоге уходят раньше массовых рассылок и выгрузок
+PRIORITY_REPLY = 0
+PRIORITY_BULK = 1
+
+# Как часто удаляются корзины чатов, которые снова полны, секунды
+CHAT_BUCKET_CLEANUP_INTERVAL = 60
+
+# Приоритет текущего потока (см. bulk())
+_local = threading.local()
+
+
+@contextmanager
+def bulk():
+    """Все сообщения, отправленные внутри блока, идут с низким приоритетом"""
+    previous = getattr(_local, 'priority', PRIORITY_REPLY)
+    _local.priority = PRIORITY_BULK
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше burst в запасе"""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Через сколько секунд появится токен (после refill)"""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class OutboundLimiter:
+    """
+    Планировщик исходящих сообщений с ограничением скорости.
+    Общий лимит бота соблюдает поток, отправляющий сообщение: он ждет токена
+    в глобальной корзине, первым проходит тот, у кого выше приоритет (затем -
+    кто раньше встал в очередь). Лимит чата не блокирует: try_take_chat только
+    сообщает, можно ли писать в чат сейчас, сообщения сверх него откладывает QueuedBot.
+    """
+
+    # Интервал повторной проверки, пока очередь занята более приоритетным отправителем
+    RECHECK_INTERVAL = 0.05
+
+    # Общий лимит считается исчерпанным, если корзина пустела за последние столько секунд
+    SATURATION_WINDOW = 1.0
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+
+        self._cond = threading.Condition()
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._waiters = []  # (priority, seq), отсортирован
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._global_drained_at = None
+        self._last_cleanup = time.monotonic()
+
+        # Статистика
+        self.sent = 0
+        self.retries = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self, priority=PRIORITY_REPLY):
+        """Ожидание токена общего лимита для отправки одного сообщения"""
+        started = time.monotonic()
+
+        with self._cond:
+            waiter = (priority, next(self._seq))
+            self._insert_waiter(waiter)
+            try:
+                while True:
+                    now = time.monotonic()
+                    timeout = self._try_take(waiter, now)
+                    if timeout is None:
+                        break
+                    self._cond.wait(timeout)
+            finally:
+                self._waiters.remove(waiter)
+                self._cond.notify_all()
+
+            waited = time.monotonic() - started
+            self.sent += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def try_take_chat(self, chat_id):
+        """
+        Токен лимита чата без ожидания. Возвращает None, если токен взят,
+        иначе - через сколько секунд в чат можно будет отправить.
+        """
+        with self._cond:
+            now = time.monotonic()
+            bucket = self._chat_bucket(chat_id, now)
+            if bucket.tokens < 1:
+                return bucket.wait_time()
+            bucket.tokens -= 1
+            self._cleanup(now)
+            return None
+
+    def chat_wait(self, chat_id):
+        """Через сколько секунд в чат можно будет отправить (0 - сейчас), токен не берется"""
+        with self._cond:
+            return self._chat_bucket(chat_id, time.monotonic()).wait_time()
+
+    def backoff_chat(self, chat_id, seconds):
+        """Приостановка отправок в один чат (ответ 429 при неисчерпанном общем лимите)"""
+        with self._cond:
+            self.retries += 1
+            bucket = self._chat_bucket(chat_id, time.monotonic())
+            # Корзина уходит в минус так, чтобы следующий токен появился через seconds
+            bucket.tokens = min(bucket.tokens, 1 - seconds * bucket.rate)
+        logger.warning(f"⚠️ Превышен лимит Telegram для чата {chat_id}, отправка в него приостановлена на {seconds} с")
+
+    def pause(self, seconds):
+        """Приостановка всех отправок (ответ 429 при исчерпанном общем лимите)"""
+        with self._cond:
+            self.retries += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+        logger.warning(f"⚠️ Превышен лимит Telegram, отправка приостановлена на {seconds} с")
+
+    def global_saturated(self):
+        """Общий лимит исчерпывался недавно: 429 вызван общим потоком сообщений, а не одним чатом"""
+        with self._cond:
+            drained_at = self._global_drained_at
+            return drained_at is not None and time.monotonic() - drained_at < self.SATURATION_WINDOW
+
+    def get_stats(self):
+        """Текущие показатели планировщика"""
+        with self._cond:
+            return {
+                'queue_depth': len(self._waiters),
+                'max_queue_depth': self.max_queue_depth,
+                'sent': self.sent,
+                'retries': self.retries,
+                'avg_wait_ms': self.total_wait / self.sent * 1000 if self.sent else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+            }
+
+    def _insert_waiter(self, waiter):
+        # Список небольшой, вставка с сохранением порядка
+        index = len(self._waiters)
+        while index > 0 and self._waiters[index - 1] > waiter:
+            index -= 1
+        self._waiters.insert(index, waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        bucket.refill(now)
+        return bucket
+
+    def _try_take(self, waiter, now):
+        """
+        Попытка занять глобальный токен для waiter. Возвращает None при успехе,
+        иначе - сколько секунд подождать до следующей проверки.
+        """
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        self._global.refill(now)
+        if self._global.tokens < 1:
+            return self._global.wait_time()
+
+        # Сначала отправляет более приоритетный; он разбудит остальных
+        if self._waiters[0] is not waiter:
+            return self.RECHECK_INTERVAL
+
+        self._global.tokens -= 1
+        if self._global.tokens < 1:
+            self._global_drained_at = now
+        return None
+
+    def _cleanup(self, now):
+        """Удаление корзин чатов, которые снова полны (такая корзина не отличается от новой)"""
+        if now - self._last_cleanup < CHAT_BUCKET_CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        full = []
+        for chat_id, bucket in self._chats.items():
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                full.append(chat_id)
+        for chat_id in full:
+            del self._chats[chat_id]
+
+
+class QueuedBot(Bot):
+    """
+    Бот, все исходящие сообщения которого (send_message, reply_text,
+    edit_message_text, send_document и т.д.) проходят через OutboundLimiter.
+    Общий лимит соблюдает вызывающий поток. Сообщение в чат, исчерпавший свой
+    лимит, не задерживает обработчик: оно встает в очередь чата и уходит из потока
+    отложенной отправки, а вызов возвращает None. Ответ 429 приостанавливает этот
+    чат (или всю отправку, если исчерпан общий лимит), повтор идет через ту же очередь.
+    """
+
+    def __init__(self, *args, limiter=None, max_retries=3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter or OutboundLimiter()
+        self.max_retries = max_retries
+        self._deferred_cond = threading.Condition()
+        self._deferred = {}  # chat_id -> deque[(priority, seq, endpoint, data, args, kwargs, attempt)]
+        self._deferred_seq = itertools.count()
+        self._deferred_count = 0
+        self._sender = None
+        self._stopping = False
+
+    def stop(self, timeout=30):
+        """Остановка потока отложенной отправки: очереди чатов дописываются не дольше timeout"""
+        with self._deferred_cond:
+            self._stopping = True
+            self._deferred_cond.notify_all()
+            sender = self._sender
+        if sender is None:
+            return
+        sender.join(timeout)
+        if self._deferred_count:
+            logger.warning(f"Не отправлено отложенных сообщений: {self._deferred_count}")
+
+    def get_stats(self):
+        """Показатели планировщика и число отложенных сообщений"""
+        stats = self.limiter.get_stats()
+        with self._deferred_cond:
+            stats['deferred'] = self._deferred_count
+        return stats
+
+    def _message(self, endpoint, data, *args, **kwargs):
+        chat_id = data.get('chat_id', data.get('inline_message_id'))
+        priority = getattr(_local, 'priority', PRIORITY_REPLY)
+
+        with self._deferred_cond:
+            # Сообщения чата уходят по порядку: пока есть отложенные, новое встает за ними
+            if chat_id in self._deferred or self.limiter.try_take_chat(chat_id) is not None:
+                self._defer(chat_id, (priority, next(self._deferred_seq), endpoint, data, args, kwargs, 0))
+                return None
+
+        return self._send(chat_id, priority, endpoint, data, args, kwargs, 0)
+
+    def _send(self, chat_id, priority, endpoint, data, args, kwargs, attempt):
+        """Отправка с уже взятым токеном чата; после 429 сообщение уходит в очередь чата"""
+        self.limiter.acquire(priority)
+        try:
+            return super()._message(endpoint, data, *args, **kwargs)
+        except RetryAfter as e:
+            attempt += 1
+            if attempt > self.max_retries:
+                raise
+            if self.limiter.global_saturated():
+                self.limiter.pause(e.retry_after)
+            else:
+                self.limiter.backoff_chat(chat_id, e.retry_after)
+            with self._deferred_cond:
+                self._defer(chat_id, (priority, next(self._deferred_seq), endpoint, data, args, kwargs, attempt), first=True)
+            return None
+
+    def _defer(self, chat_id, item, first=False):
+        """Постановка в очередь чата (под _deferred_cond)"""
+        chat_queue = self._deferred.get(chat_id)
+        if chat_queue is None:
+            chat_queue = self._deferred[chat_id] = deque()
+        if first:
+            chat_queue.appendleft(item)
+        else:
+            chat_queue.append(item)
+        self._deferred_count += 1
+
+        if self._sender is None:
+            self._sender = threading.Thread(target=self._run_deferred, name='outbound-deferred', daemon=True)
+            self._sender.start()
+        self._deferred_cond.notify_all()
+
+    def _next_deferred(self):
+        """
+        Чат, в который можно отправить сейчас, с самым приоритетным первым сообщением
+        (под _deferred_cond). Возвращает (chat_id, None) или (None, секунд до ближайшего).
+        """
+        best = None
+        soonest = None
+        for chat_id, chat_queue in self._deferred.items():
+            wait = self.limiter.chat_wait(chat_id)
+            if wait > 0:
+                soonest = wait if soonest is None else min(soonest, wait)
+            elif best is None or chat_queue[0][:2] < self._deferred[best][0][:2]:
+                best = chat_id
+        if best is not None and self.limiter.try_take_chat(best) is None:
+            return best, None
+        return None, soonest or self.limiter.RECHECK_INTERVAL
+
+    def _run_deferred(self):
+        """Поток отложенной отправки"""
+        while True:
+            with self._deferred_cond:
+                while True:
+                    if not self._deferred:
+                        if self._stopping:
+                            self._sender = None
+                            return
+                        self._deferred_cond.wait()
+                        continue
+                    chat_id, wait = self._next_deferred()
+                    if chat_id is not None:
+                        break
+                    self._deferred_cond.wait(wait)
+
+                chat_queue = self._deferred[chat_id]
+                priority, _, endpoint, data, args, kwargs, attempt = chat_queue.popleft()
+                if not chat_queue:
+                    del self._deferred[chat_id]
+                self._deferred_count -= 1
+
+            try:
+                self._send(chat_id, priority, endpoint, data, args, kwargs, attempt)
+            except Exception as e:
+                logger.error(f"❌ Не удалось отправить отложенное сообщение в чат {chat_id}: {e}")
+
+
+class MeteredRequest(Request):
+    """Соединение с Bot API, которое записывает время и ошибки каждого запроса в метрики"""
+
+    def post(self, url, data, timeout=None):
+        method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            return super().post(url, data, timeout=timeout)
+        except TelegramError as e:
+            BOT_API_ERRORS.labels(method, type(e).__name__).inc()
+            raise
+        finally:
+            BOT_API_DURATION.labels(method).observe(time.perf_counter() - started)
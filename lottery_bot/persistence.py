@@ -0,0 +1,209 @@
+# lottery_bot/persistence.py
+import json
+import logging
+import threading
+import traceback
+from collections import defaultdict
+from telegram.ext import BasePersistence, ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+
+class LazyUserData(defaultdict):
+    """user_data, которые подгружаются из базы при первом обращении к пользователю"""
+
+    def __init__(self, loader):
+        super().__init__(dict)
+        self._loader = loader
+
+    def __missing__(self, user_id):
+        value = self._loader(user_id)
+        self[user_id] = value
+        return value
+
+
+class LazyConversations(dict):
+    """
+    Состояния диалогов, которые подгружаются из базы при первом обращении.
+    ConversationHandler читает состояние через get(), поэтому подгрузка - там.
+    """
+
+    def __init__(self, loader):
+        super().__init__()
+        self._loader = loader
+        self._checked = set()
+
+    def get(self, key, default=None):
+        if key not in self._checked:
+            self._checked.add(key)
+            if not super().__contains__(key):
+                state = self._loader(key)
+                if state is not None:
+                    self[key] = state
+        return super().get(key, default)
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Хранение состояний ConversationHandler и user_data в базе бота.
+    Изменения копятся в памяти и записываются одной транзакцией раз в
+    flush_interval секунд. Данные пользователя читаются из базы только
+    при первом его обращении после запуска.
+    Хранятся только JSON-совместимые данные (без объектов Bot).
+    """
+
+    def __init__(self, db, flush_interval=1.0):
+        super().__init__(store_user_data=True, store_chat_data=False, store_bot_data=False)
+        self.db = db
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._dirty_conversations = {}  # (name, key) -> состояние, None - удалить
+        self._dirty_user_data = {}      # user_id -> JSON, None - удалить
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='persistence-flush', daemon=True)
+        self._thread.start()
+
+    # user_data хранится как JSON и не содержит объектов Bot - копирование с заменой бота не нужно
+    def insert_bot(self, obj):
+        return obj
+
+    @classmethod
+    def replace_bot(cls, obj):
+        return obj
+
+    @staticmethod
+    def _conversation_key(key):
+        return json.dumps(list(key))
+
+    def _load_conversation(self, name, key):
+        try:
+            cursor = self.db.get_connection().cursor()
+            cursor.execute(
+                'SELECT state FROM conversations WHERE name = ? AND key = ?',
+                (name, self._conversation_key(key))
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Ошибка загрузки состояния диалога {key}: {e}")
+            return None
+
+    def _load_user_data(self, user_id):
+        try:
+            cursor = self.db.get_connection().cursor()
+            cursor.execute('SELECT data FROM user_data WHERE user_id = ?', (user_id,))
+            row = cursor.fetchone()
+            return json.loads(row[0]) if row else {}
+        except Exception as e:
+            logger.error(f"Ошибка загрузки user_data пользователя {user_id}: {e}")
+            return {}
+
+    def get_user_data(self):
+        return LazyUserData(self._load_user_data)
+
+    def get_chat_data(self):
+        return defaultdict(dict)
+
+    def get_bot_data(self):
+        return {}
+
+    def get_conversations(self, name):
+        return LazyConversations(lambda key: self._load_conversation(name, key))
+
+    def update_conversation(self, name, key, new_state):
+        # Обработчик еще выполняется в пуле: сохраняем состояние, которое он вернет
+        if isinstance(new_state, tuple):
+            promise = new_state[1]
+            promise.add_done_callback(
+                lambda result: result is not None and self.update_conversation(name, key, result)
+            )
+            return
+
+        # Завершенный диалог удаляется из базы
+        if new_state == ConversationHandler.END:
+            new_state = None
+
+        with self._lock:
+            self._dirty_conversations[(name, self._conversation_key(key))] = new_state
+
+    def update_user_data(self, user_id, data):
+        try:
+            snapshot = json.dumps(data, ensure_ascii=False) if data else None
+        except (TypeError, ValueError) as e:
+            logger.error(f"user_data пользователя {user_id} не сохранены: {e}")
+            return
+
+        with self._lock:
+            self._dirty_user_data[user_id] = snapshot
+
+    def update_chat_data(self, chat_id, data):
+        pass
+
+    def update_bot_data(self, data):
+        pass
+
+    def flush(self):
+        """Запись накопленных изменений одной транзакцией"""
+        with self._lock:
+            conversations, self._dirty_conversations = self._dirty_conversations, {}
+            user_data, self._dirty_user_data = self._dirty_user_data, {}
+
+        if not conversations and not user_data:
+            return
+
+        conn = None
+        try:
+            conn = self.db.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.executemany(
+                '''
+                INSERT INTO conversations (name, key, state) VALUES (?, ?, ?)
+                ON CONFLICT(name, key) DO UPDATE SET state = excluded.state
+                ''',
+                [(name, key, state) for (name, key), state in conversations.items() if state is not None]
+            )
+            cursor.executemany(
+                'DELETE FROM conversations WHERE name = ? AND key = ?',
+                [(name, key) for (name, key), state in conversations.items() if state is None]
+            )
+            cursor.executemany(
+                '''
+                INSERT INTO user_data (user_id, data) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET data = excluded.data
+                ''',
+                [(user_id, data) for user_id, data in user_data.items() if data is not None]
+            )
+            cursor.executemany(
+                'DELETE FROM user_data WHERE user_id = ?',
+                [(user_id,) for user_id, data in user_data.items() if data is None]
+            )
+            conn.commit()
+            logger.debug(f"Сохранено состояний диалогов: {len(conversations)}, user_data: {len(user_data)}")
+        except Exception as e:
+            if conn is not None:
+                conn.rollback()
+            logger.error(f"Ошибка сохранения состояний диалогов: {e}\n{traceback.format_exc()}")
+
+            # Возвращаем изменения в очередь, если их еще не перезаписали более новые
+            with self._lock:
+                for key, state in conversations.items():
+                    self._dirty_conversations.setdefault(key, state)
+                for user_id, data in user_data.items():
+                    self._dirty_user_data.setdefault(user_id, data)
+
+    def close(self):
+        """Остановка фоновой записи с сохранением оставшихся изменений"""
+        self._stop_event.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        """Периодическая запись изменений"""
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка в потоке сохранения состояний: {e}")
@@ -0,0 +1,232 @@
+# lottery_bot/query_stats.py
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Отдельный журнал медленных запросов (файл настраивается в logging_setup.py)
+slow_query_logger = logging.getLogger('slow_queries')
+
+# Списки параметров IN (?, ?, ...) разной длины считаются одним запросом
+PLACEHOLDER_LIST_PATTERN = re.compile(r'\?(\s*,\s*\?)+')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Предел кэша нормализованных текстов (запросы со списками IN дают много разных строк)
+MAX_CACHED_KEYS = 10000
+
+# Для каких запросов имеет смысл EXPLAIN QUERY PLAN
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+
+def normalize_sql(sql):
+    """Текст запроса без лишних пробелов и с одинаковой записью списков параметров"""
+    return PLACEHOLDER_LIST_PATTERN.sub('?, ...', WHITESPACE_PATTERN.sub(' ', sql).strip())
+
+
+class StatementStats:
+    """Накопленные показатели одного запроса"""
+    __slots__ = ('calls', 'total', 'max', 'rows')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+
+class Execution:
+    """Текущее выполнение запроса курсором: время execute и всех fetch до следующего execute"""
+    __slots__ = ('key', 'sql', 'parameters', 'stats', 'elapsed', 'slow_logged')
+
+    def __init__(self, key, sql, parameters, stats):
+        self.key = key
+        self.sql = sql
+        self.parameters = parameters
+        self.stats = stats
+        self.elapsed = 0.0
+        self.slow_logged = False
+
+
+class QueryStats:
+    """
+    Статистика по всем запросам к базе: число вызовов, суммарное и максимальное
+    время (execute вместе с чтением строк), число прочитанных строк.
+    Выполнение дольше slow_query_ms записывается в журнал slow_queries
+    вместе с планом запроса (EXPLAIN QUERY PLAN).
+    """
+
+    def __init__(self, slow_query_ms=100):
+        self.slow_threshold = slow_query_ms / 1000
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._plans = {}
+        self._keys = {}  # исходный текст -> нормализованный
+        self.slow_queries = 0
+        self.started = time.time()
+
+    def begin(self, sql, parameters):
+        key = self._keys.get(sql)
+        if key is None:
+            if len(self._keys) >= MAX_CACHED_KEYS:
+                self._keys = {}
+            key = self._keys[sql] = normalize_sql(sql)
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = StatementStats()
+            stats.calls += 1
+        return Execution(key, sql, parameters, stats)
+
+    def account(self, execution, connection, elapsed, rows):
+        """Учет времени и строк текущего выполнения"""
+        execution.elapsed += elapsed
+        stats = execution.stats
+        with self._lock:
+            stats.total += elapsed
+            stats.rows += rows
+            if execution.elapsed > stats.max:
+                stats.max = execution.elapsed
+
+        if not execution.slow_logged and execution.elapsed >= self.slow_threshold:
+            execution.slow_logged = True
+            self._log_slow(execution, connection)
+
+    def top(self, limit=10):
+        """Запросы с наибольшим суммарным временем: (запрос, вызовов, всего мс, среднее мс, макс. мс, строк)"""
+        with self._lock:
+            items = [
+                (key, stats.calls, stats.total * 1000, stats.total * 1000 / stats.calls if stats.calls else 0.0,
+                 stats.max * 1000, stats.rows)
+                for key, stats in self._statements.items()
+            ]
+        items.sort(key=lambda item: item[2], reverse=True)
+        return items[:limit]
+
+    def reset(self):
+        """Сброс накопленной статистики"""
+        with self._lock:
+            self._statements = {}
+            self.slow_queries = 0
+            self.started = time.time()
+
+    def explain(self, connection, sql, parameters):
+        """План запроса в виде дерева (кэшируется по тексту запроса)"""
+        key = normalize_sql(sql)
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+
+        if not key.upper().startswith(EXPLAINABLE):
+            return None
+
+        # Обычный курсор: сам EXPLAIN в статистику не попадает
+        cursor = sqlite3.Cursor(connection)
+        try:
+            rows = cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+        finally:
+            cursor.close()
+
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node_id] + detail)
+        plan = '\n'.join(lines)
+        self._plans[key] = plan
+        return plan
+
+    def _log_slow(self, execution, connection):
+        with self._lock:
+            self.slow_queries += 1
+
+        try:
+            plan = self.explain(connection, execution.sql, execution.parameters)
+        except sqlite3.Error as e:
+            plan = f'не удалось получить план: {e}'
+
+        message = f"Медленный запрос ({execution.elapsed * 1000:.1f} мс): {execution.key}"
+        if plan:
+            message += f"\n{plan}"
+        slow_query_logger.warning(message)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, время и строки которого учитываются в QueryStats соединения"""
+
+    _execution = None
+
+    def _begin(self, sql, parameters, elapsed):
+        stats = self.connection.query_stats
+        self._execution = stats.begin(sql, parameters)
+        stats.account(self._execution, self.connection, elapsed, 0)
+
+    def _account(self, elapsed, rows):
+        if self._execution is not None:
+            self.connection.query_stats.account(self._execution, self.connection, elapsed, rows)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        # Для плана запроса достаточно первого набора параметров
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, seq_of_parameters[0] if seq_of_parameters else (), time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._account(time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._account(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._account(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._account(time.perf_counter() - started, 0)
+            raise
+        self._account(time.perf_counter() - started, 1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Соединение, все запросы которого (cursor().execute и execute самого соединения)
+    проходят через InstrumentedCursor. query_stats задается после создания.
+    """
+
+    query_stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute создает курсор и выполняет запрос в обход переопределенного execute
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
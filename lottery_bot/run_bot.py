@@ -46,7 +46,9 @@ def check_database():
             print("✅ Целостность базы данных в порядке")
         else:
             print("⚠️  Возможны проблемы с целостностью базы данных")
-            
+
+        db.close()
+
         return True
     except Exception as e:
         print(f"❌ Проблема с базой данных: {e}")
@@ -0,0 +1,209 @@
+# lottery_bot/templates.py
+from collections import namedtuple
+from telegram import KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from validation import MAX_INPUT_LENGTH, MAX_KODE_SLOVO_LENGTH
+
+# text - готовый текст или шаблон str.format, reply_markup - клавиатура в виде JSON,
+# dynamic - нужно ли подставлять поля при отправке
+Template = namedtuple('Template', ['text', 'reply_markup', 'dynamic'])
+
+# Клавиатуры сериализуются один раз: Bot передает строку в reply_markup без повторного to_json()
+START_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton("/start")]], resize_keyboard=True).to_json()
+
+PHONE_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton("📱 Отправить мой номер телефона", request_contact=True)],
+        [KeyboardButton("/start")]
+    ],
+    resize_keyboard=True
+).to_json()
+
+REMOVE_KEYBOARD = ReplyKeyboardRemove().to_json()
+
+TEMPLATES = {}
+
+
+def register(key, text, reply_markup=None):
+    """Регистрация шаблона; поля в фигурных скобках подставляются при отправке"""
+    TEMPLATES[key] = Template(text, reply_markup, '{' in text)
+
+
+def render(key, **fields):
+    """Текст и клавиатура шаблона с подставленными полями"""
+    template = TEMPLATES[key]
+    text = template.text.format(**fields) if template.dynamic else template.text
+    return text, template.reply_markup
+
+
+def reply(update, key, **fields):
+    """Ответ на сообщение по шаблону"""
+    text, reply_markup = render(key, **fields)
+    return update.message.reply_text(text, reply_markup=reply_markup)
+
+
+# Начало регистрации
+register(
+    'welcome',
+    "Привет, {first_name}! ✨\n\n"
+    "Я бот «7 канала Красноярск» для участия в\n"
+    "розыгрыше призов от НЕТАЙНОГО САНТЫ!\n\n"
+    "Для участия в розыгрыше:\n"
+    "1. Отправь кодовое слово из эфира «7 канал Красноярск».\n"
+    "2. Поделись своим контактным номером.\n",
+    START_KEYBOARD
+)
+register(
+    'restart',
+    "Начнем заново! ✨\n\n"
+    "Введите кодовое слово из эфира:\n",
+    START_KEYBOARD
+)
+register(
+    'cancelled',
+    "Регистрация отменена.\n\n"
+    "Нажмите /start для начала заново:",
+    START_KEYBOARD
+)
+
+# Кодовое слово
+register(
+    'empty_message',
+    "❌ Получено пустое сообщение.\n"
+    "Попробуйте еще раз или нажмите /start для начала:",
+    START_KEYBOARD
+)
+register(
+    'code_too_long',
+    "❌ Сообщение слишком длинное.\n"
+    f"Максимальная длина: {MAX_INPUT_LENGTH} символов.\n"
+    "Попробуйте еще раз или нажмите /start для начала:",
+    START_KEYBOARD
+)
+register(
+    'code_forbidden',
+    "❌ Недопустимый ввод.\n"
+    "Попробуйте еще раз или нажмите /start для начала:",
+    START_KEYBOARD
+)
+register(
+    'code_word_too_long',
+    f"❌ Кодовое слово должно содержать не более {MAX_KODE_SLOVO_LENGTH} символов "
+    "(без учета пробелов). Вы ввели {length} символов.\n"
+    "Попробуйте еще раз или нажмите /start для начала:",
+    START_KEYBOARD
+)
+register(
+    'code_empty',
+    "❌ Кодовое слово не может быть пустым.\n"
+    "Попробуйте еще раз или нажмите /start для начала:",
+    START_KEYBOARD
+)
+register(
+    'code_error',
+    "⚠️ Ошибка обработки кодового слова. Нажмите /start для начала заново:",
+    START_KEYBOARD
+)
+register(
+    'already_participated',
+    "❌ Вы уже участвовали в розыгрыше сегодня!\n\n"
+    "Вы можете участвовать завтра снова!\n"
+    "Нажмите /start для участия в другом розыгрыше:",
+    START_KEYBOARD
+)
+
+# Номер телефона
+register(
+    'phone_request',
+    "Принимая участие в розыгрыше, вы подтверждаете свое ознакомление и согласие с условиями розыгрыша «Нетайный Санта», размещенными на сайте https://trk7.ru\n"
+    "Победитель (получатель приза) идентифицируется по номеру телефона в сообщении с кодовым словом.\n\n"
+    "Теперь поделитесь номером телефона, чтобы мы смогли связаться с вами в случае вашего выигрыша.\n"
+    "Вы можете:\n"
+    "1. Нажать кнопку '📱 Отправить мой номер телефона'\n"
+    "2. Ввести номер вручную (например: +79123456789 или 89123456789)",
+    PHONE_KEYBOARD
+)
+register(
+    'phone_too_long',
+    "❌ Номер телефона слишком длинный.\n"
+    "Попробуйте еще раз или нажмите /start для начала заново:",
+    PHONE_KEYBOARD
+)
+register(
+    'phone_empty',
+    "❌ Номер телефона не может быть пустым.\n"
+    "Попробуйте еще раз или нажмите /start для начала заново:",
+    PHONE_KEYBOARD
+)
+register(
+    'phone_invalid',
+    "❌ Номер телефона слишком короткий или неверный.\n"
+    "Примеры: +79123456789, 89123456789\n\n"
+    "Попробуйте еще раз или нажмите /start для начала заново:",
+    PHONE_KEYBOARD
+)
+register(
+    'phone_missing',
+    "❌ Не удалось получить номер телефона.\n"
+    "Попробуйте еще раз или нажмите /start для начала заново:",
+    PHONE_KEYBOARD
+)
+register(
+    'user_unknown',
+    "❌ Не удалось определить пользователя. Нажмите /start для начала заново."
+)
+register(
+    'session_expired',
+    "⚠️ Сессия устарела. Нажмите /start для начала заново:",
+    START_KEYBOARD
+)
+register(
+    'save_error',
+    "⚠️ Произошла ошибка при сохранении данных.\n"
+    "Пожалуйста, попробуйте позже или свяжитесь с администратором.\n\n"
+    "Нажмите /start для повторной попытки:",
+    START_KEYBOARD
+)
+register(
+    'phone_error',
+    "⚠️ Произошла ошибка. Нажмите /start для начала заново:",
+    START_KEYBOARD
+)
+register(
+    'registered',
+    "Спасибо за ваше участие в розыгрыше «Нетайный Санта»!\n\n"
+    "Вы зарегистрированы в качестве участника!\n\n"
+    "Победитель и приз победителю (пользователю телефонного номера) - платеж в размере 1000 рублей передается в течение 48 часов с момента появления кодового слова ежедневного розыгрыша при условии ввода правильного кодового слова и идентификации победителя как физического лица.\n\n"
+    "Включай каждый будний день «7 канал Красноярск» с 18:30 до 20:00 и участвуй в игре «Нетайный Санта»!\n",
+    REMOVE_KEYBOARD
+)
+
+# Прочее
+register(
+    'busy',
+    "⏳ Обрабатываю предыдущее сообщение, подождите..."
+)
+register(
+    'unexpected_error',
+    "⚠️ Произошла непредвиденная ошибка.\n"
+    "Пожалуйста, попробуйте позже.\n\n"
+    "Нажмите /start для начала заново:",
+    START_KEYBOARD
+)
+register(
+    'help',
+    "Правила розыгрыша «Нетайный Санта»  (далее «Розыгрыш» )\n\n"
+    "Срок проведения розыгрыша — С 15 по 25 декабря 2025 года\n\n"
+    "Порядок проведения Розыгрыша:\n"
+    "В период с 15 по 25 декабря 2025 года по будням с 18:30 до 20:00 на телеканале «7 канал Красноярск» в любой момент на экране появляется  всплывающий баннер с кодовым словом. Победителем является первый участник, приславший указанное кодовое слово в телеграмм-бот «7 канала Красноярск» Санта7бот.\n"
+    "Приз Победителю (пользователю телефонного номера) - платеж в размере 1000 рублей передается в течение 48 часов с момента  появления кодового слова ежедневного Розыгрыша при условии идентификации Победителя как физического лица.\n\n"
+    "Один и тот же зритель может становится Победителем неоднократно.\n\n"
+    "Среди всех Победителей за период Розыгрыша, будет случайным образом  выбран обладатель главного приза. Итоги розыгрыша главного приза – демонстрируются в вечернем выпуске новостей 31 декабря 2025 года.\n\n"
+    "Принимая участие в Розыгрыше  путем направления кодового слова на указанный номер телефона-участник Розыгрыша, подтверждает свое согласие на участие в Розыгрыше, ознакомление и согласие с настоящими Правилами Розыгрыша во всех пунктах без каких-либо изъятий.\n\n"
+    "Победитель (получатель приза) идентифицируется по реквизитам - номеру телефона с которого отправлено кодовое слово.\n\n"
+    "Получатели призов берут на себя ответственность за оплату налогов и иные обязательства, связанные с получением призов, в соответствии с законодательством РФ: (ст. 217 НК РФ, в т.ч.- получение рекламных подарков (выигрышей), совокупная стоимость которых превышает 4 000,00 руб. за календарный год).  Принятием приза \n"
+    "Победитель подтверждает уведомление  надлежащим образом о вышеуказанной обязанности.\n\n"
+    "Розыгрыш не является лотереей либо иной игрой, основанной на риске, поэтому не требует обязательной регистрации или направления уведомления в соответствующие государственные органы.\n"
+    "Организатор розыгрыша – редакция СМИ «7 канал Красноярск».\n\n"
+    "Телефон для справок:** 2-900-333\n",
+    START_KEYBOARD
+)
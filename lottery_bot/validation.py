@@ -0,0 +1,102 @@
+# lottery_bot/validation.py
+import re
+from collections import namedtuple
+
+# Максимальная длина сообщения с кодовым словом (защита от слишком длинных сообщений)
+MAX_INPUT_LENGTH = 100
+
+# Максимальная длина кодового слова без учета пробелов
+MAX_KODE_SLOVO_LENGTH = 16
+
+# Ограничения для номера телефона, введенного текстом
+MAX_PHONE_INPUT_LENGTH = 30
+MIN_PHONE_LENGTH = 11
+
+# Результаты проверки
+OK = 'ok'
+START = 'start'                  # Пользователь отправил /start
+TOO_LONG = 'too_long'            # Сообщение длиннее допустимого
+FORBIDDEN = 'forbidden'          # Подозрительные ключевые слова или символы
+EMPTY = 'empty'                  # После очистки ничего не осталось
+WORD_TOO_LONG = 'word_too_long'  # Кодовое слово длиннее MAX_KODE_SLOVO_LENGTH
+INVALID = 'invalid'              # Номер телефона слишком короткий или неверный
+
+# status - один из результатов выше, value - очищенное значение (для OK),
+# detail - найденный запрещенный фрагмент или длина отклоненного ввода
+Verdict = namedtuple('Verdict', ['status', 'value', 'detail'])
+
+START_COMMAND = '/start'
+
+# Ключевые слова SQL (поиск подстроки без учета регистра) и подозрительные последовательности -
+# одно регулярное выражение вместо отдельного прохода по тексту для каждого слова
+SQL_KEYWORDS = ['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'DROP', 'UNION', 'OR', 'AND']
+SUSPICIOUS_PATTERNS = ['--', ';', '/*', '*/', "'", '"', '`']
+FORBIDDEN_PATTERN = re.compile(
+    '|'.join(re.escape(token) for token in SQL_KEYWORDS + SUSPICIOUS_PATTERNS),
+    re.IGNORECASE
+)
+
+# Разрешенные символы (кириллица, латиница, цифры, некоторые знаки препинания)
+SAFE_CHARS = r'a-zA-Zа-яА-ЯёЁ0-9\-_.,!?()@#%&*+='
+
+# Удаление за один проход и запрещенных символов, и пробельных (в кодовом слове они не нужны)
+KODE_SLOVO_STRIP_PATTERN = re.compile(f'[^{SAFE_CHARS}]')
+
+# Хотя бы один разрешенный символ
+SAFE_CHAR_PATTERN = re.compile(f'[{SAFE_CHARS}]')
+
+# В номере телефона остаются только цифры и +
+PHONE_STRIP_PATTERN = re.compile(r'[^0-9+]')
+
+
+def validate_kode_slovo(text):
+    """Проверка сообщения с кодовым словом; при OK value - слово без пробелов"""
+    raw_text = text.strip() if text else ''
+
+    if len(raw_text) > MAX_INPUT_LENGTH:
+        return Verdict(TOO_LONG, None, len(raw_text))
+
+    if raw_text == START_COMMAND:
+        return Verdict(START, None, None)
+
+    match = FORBIDDEN_PATTERN.search(raw_text)
+    if match:
+        return Verdict(FORBIDDEN, None, match.group(0))
+
+    kode_slovo = KODE_SLOVO_STRIP_PATTERN.sub('', raw_text)
+
+    if not kode_slovo:
+        return Verdict(EMPTY, None, None)
+
+    if len(kode_slovo) > MAX_KODE_SLOVO_LENGTH:
+        return Verdict(WORD_TOO_LONG, None, len(kode_slovo))
+
+    return Verdict(OK, kode_slovo, None)
+
+
+def validate_phone(text):
+    """Проверка номера телефона, введенного текстом; при OK value - нормализованный номер"""
+    raw_text = text.strip() if text else ''
+
+    if raw_text == START_COMMAND:
+        return Verdict(START, None, None)
+
+    if len(raw_text) > MAX_PHONE_INPUT_LENGTH:
+        return Verdict(TOO_LONG, None, len(raw_text))
+
+    phone = PHONE_STRIP_PATTERN.sub('', raw_text)
+
+    if not phone:
+        # Пустой ввод и ввод без цифр - разные ответы пользователю
+        if not SAFE_CHAR_PATTERN.search(raw_text):
+            return Verdict(EMPTY, None, None)
+        return Verdict(INVALID, None, None)
+
+    # Если есть +, оставляем только один в начале
+    if '+' in phone:
+        phone = '+' + phone.replace('+', '')
+
+    if len(phone) < MIN_PHONE_LENGTH:
+        return Verdict(INVALID, None, None)
+
+    return Verdict(OK, phone, None)
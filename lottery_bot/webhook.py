@@ -0,0 +1,168 @@
+# lottery_bot/webhook.py
+import hmac
+import json
+import logging
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telegram import Update
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает secret_token, указанный в setWebhook
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Ограничение размера тела запроса (обновления Telegram намного меньше)
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class WebhookReceiver:
+    """
+    Прием обновлений по webhook встроенным HTTP-сервером.
+    Обновление разбирается и кладется прямо в очередь диспетчера, ответ 200
+    отправляется сразу, не дожидаясь обработки. Если очередь диспетчера
+    длиннее max_queue или диспетчер остановлен, отвечаем 503 - Telegram
+    повторит доставку позже.
+    """
+
+    def __init__(self, dispatcher, listen='0.0.0.0', port=8443, path='/webhook', secret_token=None, max_queue=1000):
+        self.dispatcher = dispatcher
+        self.listen = listen
+        self.port = port
+        self.path = path if path.startswith('/') else f'/{path}'
+        self.secret_token = secret_token
+        self.max_queue = max_queue
+
+        self._server = None
+        self._thread = None
+
+        # Статистика
+        self._stats_lock = threading.Lock()
+        self.accepted = 0
+        self.rejected_busy = 0
+        self.rejected_invalid = 0
+
+    def start(self):
+        """Запуск HTTP-сервера в отдельном потоке"""
+        receiver = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                receiver._handle_post(self)
+
+            def log_message(self, format, *args):
+                # Каждый запрос не логируем - при наплыве это тысячи строк в секунду
+                pass
+
+        self._server = ThreadingHTTPServer((self.listen, self.port), RequestHandler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='webhook-receiver', daemon=True)
+        self._thread.start()
+        logger.info(f"✅ Webhook-сервер слушает {self.listen}:{self.port}{self.path}")
+
+    def stop(self):
+        """Остановка HTTP-сервера"""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        logger.info("Webhook-сервер остановлен")
+
+    def get_stats(self):
+        """Текущие показатели приема обновлений"""
+        with self._stats_lock:
+            return {
+                'accepted': self.accepted,
+                'rejected_busy': self.rejected_busy,
+                'rejected_invalid': self.rejected_invalid,
+                'queue_depth': self._queue_depth(),
+                'max_queue': self.max_queue,
+            }
+
+    def _queue_depth(self):
+        return self.dispatcher.update_queue.qsize()
+
+    def _is_busy(self):
+        """Не принимаем обновления: очередь диспетчера переполнена или он остановлен"""
+        return not self.dispatcher.running or self.dispatcher.update_queue.qsize() >= self.max_queue
+
+    def _enqueue(self, data):
+        """Передача обновления (JSON от Telegram) на обработку; False - нет места, ответить 503"""
+        self.dispatcher.update_queue.put(Update.de_json(data, self.dispatcher.bot))
+        return True
+
+    def _count(self, field):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _reply(self, request, status):
+        request.send_response(status)
+        request.send_header('Content-Length', '0')
+        request.end_headers()
+
+    def _handle_post(self, request):
+        """Обработка одного POST-запроса от Telegram"""
+        try:
+            if request.path != self.path:
+                self._reply(request, 404)
+                return
+
+            # Проверка секретного токена (сравнение за постоянное время)
+            if self.secret_token:
+                token = request.headers.get(SECRET_TOKEN_HEADER, '')
+                if not hmac.compare_digest(token, self.secret_token):
+                    self._count('rejected_invalid')
+                    logger.warning(f"Webhook: запрос с неверным секретным токеном от {request.client_address[0]}")
+                    self._reply(request, 403)
+                    return
+
+            # Ограничение нагрузки: не принимаем больше, чем успеваем обработать
+            if self._is_busy():
+                self._count('rejected_busy')
+                self._reply(request, 503)
+                return
+
+            length = int(request.headers.get('Content-Length', 0))
+            if length <= 0 or length > MAX_BODY_SIZE:
+                self._count('rejected_invalid')
+                self._reply(request, 400)
+                return
+
+            try:
+                data = json.loads(request.rfile.read(length).decode('utf-8'))
+                accepted = self._enqueue(data)
+            except Exception as e:
+                self._count('rejected_invalid')
+                logger.warning(f"Webhook: не удалось разобрать обновление: {e}")
+                self._reply(request, 400)
+                return
+
+            if not accepted:
+                self._count('rejected_busy')
+                self._reply(request, 503)
+                return
+
+            self._count('accepted')
+            self._reply(request, 200)
+
+        except Exception as e:
+            logger.error(f"Ошибка в webhook-обработчике: {e}\n{traceback.format_exc()}")
+            try:
+                self._reply(request, 500)
+            except:
+                pass
+
+
+def register_webhook(bot):
+    """Сообщаем Telegram адрес webhook"""
+    # secret_token не поддерживается аргументами PTB 13, передаем напрямую
+    api_kwargs = {'secret_token': config.WEBHOOK_SECRET_TOKEN} if config.WEBHOOK_SECRET_TOKEN else None
+    bot.set_webhook(
+        url=config.WEBHOOK_URL,
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        api_kwargs=api_kwargs
+    )
+    logger.info(f"Webhook зарегистрирован: {config.WEBHOOK_URL}")
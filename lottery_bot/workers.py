@@ -0,0 +1,140 @@
+# lottery_bot/workers.py
+import logging
+import queue
+import threading
+import traceback
+from telegram.ext.utils.promise import Promise
+
+logger = logging.getLogger(__name__)
+
+# Маркер остановки потока
+_STOP = object()
+
+
+class WorkerLane:
+    """
+    Пул потоков с сохранением порядка по ключу.
+    Задачи с одним ключом (ID пользователя) всегда попадают в один поток
+    и выполняются строго по очереди, задачи разных пользователей - параллельно.
+    """
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = max(1, workers)
+        self._queues = [queue.Queue() for _ in range(self.workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f'{name}-lane-{i}', daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        self.completed = 0
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        """Запуск потоков пула"""
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"✅ Пул '{self.name}' запущен: {self.workers} потоков")
+
+    def stop(self):
+        """Остановка пула: уже поставленные задачи будут выполнены"""
+        for q in self._queues:
+            q.put(_STOP)
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join()
+
+    def submit(self, key, task):
+        """Постановка задачи в поток, закрепленный за ключом"""
+        self._queues[hash(key) % self.workers].put(task)
+
+    def queue_depth(self):
+        """Число задач, ожидающих выполнения"""
+        return sum(q.qsize() for q in self._queues)
+
+    def _run(self, tasks):
+        """Цикл потока пула"""
+        while True:
+            task = tasks.get()
+            if task is _STOP:
+                break
+            try:
+                task()
+            except Exception as e:
+                logger.error(f"Ошибка в пуле '{self.name}': {e}\n{traceback.format_exc()}")
+            with self._stats_lock:
+                self.completed += 1
+
+
+def update_key(update):
+    """Ключ упорядочивания обновления: пользователь, иначе чат"""
+    if update is None:
+        return 0
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return 0
+
+
+class WorkerLanes:
+    """
+    Раздельные пулы для обработчиков участников и администратора.
+    Тяжелые админские операции (/list, статистика, выгрузки) не занимают
+    потоки, которые обслуживают регистрацию.
+    """
+
+    def __init__(self, user_workers, admin_workers):
+        self.user_lane = WorkerLane('user', user_workers)
+        self.admin_lane = WorkerLane('admin', admin_workers)
+
+    def start(self):
+        self.user_lane.start()
+        self.admin_lane.start()
+
+    def stop(self):
+        self.user_lane.stop()
+        self.admin_lane.stop()
+
+    def user(self, callback):
+        """Обработчик, выполняемый в пуле участников"""
+        return self._wrap(self.user_lane, callback)
+
+    def admin(self, callback):
+        """Обработчик, выполняемый в пуле администратора"""
+        return self._wrap(self.admin_lane, callback)
+
+    def get_stats(self):
+        """Текущие показатели пулов"""
+        return {
+            lane.name: {
+                'workers': lane.workers,
+                'queue_depth': lane.queue_depth(),
+                'completed': lane.completed,
+            }
+            for lane in (self.user_lane, self.admin_lane)
+        }
+
+    @staticmethod
+    def _wrap(lane, callback):
+        """
+        Обертка обработчика: вызов ставится в пул, диспетчеру сразу возвращается Promise.
+        ConversationHandler по Promise переводит диалог в состояние WAITING
+        до завершения обработки, как и при run_async.
+        """
+        def handler(update, context):
+            promise = Promise(callback, (update, context), {}, update=update)
+
+            def task():
+                promise.run()
+                if promise.exception is not None:
+                    context.dispatcher.dispatch_error(update, promise.exception, promise=promise)
+                else:
+                    # Как и для run_async: user_data сохраняются после завершения обработчика
+                    context.dispatcher.update_persistence(update=update)
+
+            lane.submit(update_key(update), task)
+            return promise
+
+        handler.__name__ = getattr(callback, '__name__', 'handler')
+        handler.__doc__ = callback.__doc__
+        return handler
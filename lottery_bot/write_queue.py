@@ -0,0 +1,193 @@
+# lottery_bot/write_queue.py
+import logging
+import queue
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Маркер остановки потока-писателя
+_STOP = object()
+
+
+class PendingRegistration:
+    """Заявка на регистрацию, ожидающая записи в составе пакета"""
+    __slots__ = ('row', 'done', 'result', 'error', 'claimed', 'cancelled')
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.claimed = False  # писатель взял заявку в транзакцию
+        self.cancelled = False  # обработчик перестал ждать, заявку не записывать
+
+
+class ParticipantWriteQueue:
+    """
+    Очередь отложенной записи участников с групповым коммитом.
+    Один поток-писатель собирает заявки и записывает их одной транзакцией
+    каждые flush_interval_ms мс или по накоплении max_batch_size заявок.
+    Обработчик получает ответ только после COMMIT своего пакета.
+    """
+
+    def __init__(self, db, max_queue_size=10000, max_batch_size=200, flush_interval_ms=20, submit_timeout=30):
+        self.db = db
+        self.max_queue_size = max_queue_size
+        self.max_batch_size = max_batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.submit_timeout = submit_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._claim_lock = threading.Lock()  # отмена заявки против взятия ее в пакет
+        self._thread = threading.Thread(target=self._run, name='participant-writer', daemon=True)
+
+        # Статистика для настройки параметров
+        self._stats_lock = threading.Lock()
+        self.batches_committed = 0
+        self.rows_committed = 0
+        self.failed_batches = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        """Запуск потока-писателя"""
+        self._thread.start()
+        logger.info(f"✅ Групповой коммит включен: пакет до {self.max_batch_size} заявок, "
+                    f"интервал {self.flush_interval_ms} мс, очередь {self.max_queue_size}")
+
+    def stop(self):
+        """Остановка писателя: оставшиеся в очереди заявки будут записаны"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        logger.info("Поток группового коммита остановлен")
+
+    def submit(self, row):
+        """
+        Постановка заявки в очередь и ожидание коммита пакета.
+        Возвращает RegistrationResult или None, если очередь переполнена.
+        По истечении submit_timeout заявка отменяется, если писатель еще не взял ее
+        в транзакцию; иначе ответ дожидается коммита.
+        """
+        pending = PendingRegistration(row)
+
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            return None
+
+        if not pending.done.wait(self.submit_timeout):
+            with self._claim_lock:
+                if not pending.claimed:
+                    pending.cancelled = True
+                    raise Exception("Превышено время ожидания записи в базу данных")
+            # Пакет с заявкой уже записывается - ждем его результата
+            pending.done.wait()
+
+        if pending.error is not None:
+            raise pending.error
+
+        return pending.result
+
+    def get_stats(self):
+        """Текущие показатели очереди"""
+        with self._stats_lock:
+            avg_flush_ms = self._total_flush_ms / self.batches_committed if self.batches_committed else 0.0
+            avg_batch_size = self.rows_committed / self.batches_committed if self.batches_committed else 0.0
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_size': self.max_queue_size,
+                'max_batch_size': self.max_batch_size,
+                'flush_interval_ms': self.flush_interval_ms,
+                'batches_committed': self.batches_committed,
+                'rows_committed': self.rows_committed,
+                'failed_batches': self.failed_batches,
+                'last_batch_size': self.last_batch_size,
+                'avg_batch_size': avg_batch_size,
+                'last_flush_ms': self.last_flush_ms,
+                'avg_flush_ms': avg_flush_ms,
+                'max_flush_ms': self.max_flush_ms,
+            }
+
+    def _run(self):
+        """Цикл потока-писателя"""
+        interval = self.flush_interval_ms / 1000
+        stopping = False
+
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            # Добираем пакет до лимита или до истечения интервала
+            batch = [item]
+            deadline = time.monotonic() + interval
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+
+        # Дописываем то, что успело попасть в очередь
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for start in range(0, len(batch), self.max_batch_size):
+            self._flush(batch[start:start + self.max_batch_size])
+
+    def _flush(self, batch):
+        """Запись пакета одной транзакцией и пробуждение ожидающих обработчиков"""
+        # Отмененные по таймауту заявки не записываются
+        with self._claim_lock:
+            batch = [pending for pending in batch if not pending.cancelled]
+            for pending in batch:
+                pending.claimed = True
+        if not batch:
+            return
+
+        started = time.perf_counter()
+
+        try:
+            results = self.db.insert_participants_batch([pending.row for pending in batch])
+        except Exception as e:
+            logger.error(f"❌ Не удалось записать пакет из {len(batch)} заявок: {e}\n{traceback.format_exc()}")
+            with self._stats_lock:
+                self.failed_batches += 1
+            for pending in batch:
+                pending.error = e
+                pending.done.set()
+            return
+
+        flush_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self.batches_committed += 1
+            self.rows_committed += len(batch)
+            self.last_batch_size = len(batch)
+            self.last_flush_ms = flush_ms
+            self._total_flush_ms += flush_ms
+            self.max_flush_ms = max(self.max_flush_ms, flush_ms)
+
+        logger.debug(f"Пакет из {len(batch)} заявок записан за {flush_ms:.1f} мс")
+
+        for pending, result in zip(batch, results):
+            pending.result = result
+            pending.done.set()
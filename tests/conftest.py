@@ -0,0 +1,24 @@
+# tests/conftest.py
+import os
+import sys
+
+# Модули бота импортируются без пакета (from config import config), как в самом боте
+BOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lottery_bot')
+sys.path.insert(0, BOT_DIR)
+
+# Настройки до первого импорта config
+os.environ.setdefault('BOT_TOKEN', '123456:TEST')
+os.environ.setdefault('ADMIN_ID', '1')
+os.environ.setdefault('SLOW_QUERY_LOG', '')
+
+import pytest
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Пустая база последней версии схемы, запись без группового коммита"""
+    from database import Database
+
+    database = Database(str(tmp_path / 'lottery.db'), batch_writes=False)
+    yield database
+    database.close()
@@ -0,0 +1,59 @@
+# tests/test_draws.py
+import json
+
+DATE = '20.01.2026'
+ISO_DATE = '2026-01-20'
+
+
+def add_participants(db, words):
+    db.insert_participants_batch([
+        (ISO_DATE, word, 100 + i, f'user{i}', f'Имя {i}', '+79990000000', f'12:{i // 60:02d}:{i % 60:02d}')
+        for i, word in enumerate(words)
+    ])
+
+
+def test_same_seed_gives_same_winners(db):
+    add_participants(db, ['Снежинка'] * 30)
+    db.set_code_words(DATE, ['Снежинка'])
+
+    first = db.draw_winners(DATE, winners_count=5, seed=12345)
+    second = db.draw_winners(DATE, winners_count=5, seed=12345)
+
+    assert first.pool_size == second.pool_size == 30
+    assert [row[0] for row in first.winners] == [row[0] for row in second.winners]
+    assert len({row[0] for row in first.winners}) == 5
+
+    # Журнал хранит seed и порядок победителей для проверки результата
+    logged = db.get_connection().execute(
+        'SELECT seed, pool_size, winner_ids FROM draws WHERE id = ?', (first.draw_id,)
+    ).fetchone()
+    assert (logged[0], logged[1]) == (12345, 30)
+    assert json.loads(logged[2]) == [row[0] for row in first.winners]
+
+
+def test_only_correct_answers_take_part(db):
+    add_participants(db, ['снеж инка', 'Мандарин', 'СНЕЖИНКА', 'ёлка', 'Снежинка'])
+    db.set_code_words(DATE, ['Снежинка'])
+
+    result = db.draw_winners(DATE, winners_count=10, seed=1)
+
+    assert result.pool_size == 3
+    assert sorted(row[6] for row in result.winners) == [100, 102, 104]
+
+
+def test_registration_after_set_word_is_graded_on_insert(db):
+    db.set_code_words(DATE, ['Снежинка'])
+    add_participants(db, ['Мандарин', 'Снежинка'])
+
+    assert db.count_correct(DATE) == 1
+    assert [row[6] for row in db.draw_winners(DATE, seed=7).winners] == [101]
+
+
+def test_draw_without_correct_answers_has_no_winners(db):
+    add_participants(db, ['Мандарин'])
+    db.set_code_words(DATE, ['Снежинка'])
+
+    result = db.draw_winners(DATE, winners_count=3, seed=1)
+
+    assert result.pool_size == 0
+    assert result.winners == []
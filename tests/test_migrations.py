@@ -0,0 +1,113 @@
+# tests/test_migrations.py
+import sqlite3
+
+import migrations
+from database import Database
+from migrations import MIGRATIONS, get_schema_version, run_migrations
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Схема базы до появления миграций (user_version = 0, даты DD.MM.YYYY)
+LEGACY_SCHEMA = '''
+    CREATE TABLE participants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        kode_slovo TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        first_name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        registration_time TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_date ON participants(date);
+    CREATE UNIQUE INDEX idx_user_date_unique ON participants(user_id, date);
+'''
+
+LEGACY_ROWS = [
+    ('30.12.2025', 'Снежинка', 1, 'one', 'Один', '+79990000001', '10:00:00'),
+    ('30.12.2025', 'ёлка', 2, None, 'Два', '+79990000002', '10:05:00'),
+    ('31.12.2025', 'Снежинка', 1, 'one', 'Один', '+79990000001', '11:00:00'),
+    ('31.12.2025', 'Мандарин', 3, 'three', 'Три', '+79990000003', '11:30:00'),
+    ('01.01.2026', 'Салют', 4, 'four', 'Четыре', '+79990000004', '09:00:00'),
+]
+
+
+def legacy_database(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany('''
+        INSERT INTO participants (date, kode_slovo, user_id, username, first_name, phone, registration_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', LEGACY_ROWS)
+    conn.commit()
+    return conn
+
+
+def index_names(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_legacy_database_is_migrated_to_latest_version(tmp_path, monkeypatch):
+    # Маленькие пакеты: перенос дат проходит несколько транзакций
+    monkeypatch.setattr(migrations, 'MIGRATION_BATCH_SIZE', 2)
+    conn = legacy_database(str(tmp_path / 'legacy.db'))
+
+    assert run_migrations(conn) == LATEST_VERSION
+    assert get_schema_version(conn) == LATEST_VERSION
+
+    dates = [row[0] for row in conn.execute('SELECT date FROM participants ORDER BY id')]
+    assert dates == ['2025-12-30', '2025-12-30', '2025-12-31', '2025-12-31', '2026-01-01']
+
+    stats = conn.execute('SELECT date, participants, new_users FROM daily_stats ORDER BY date').fetchall()
+    assert stats == [('2025-12-30', 2, 2), ('2025-12-31', 2, 1), ('2026-01-01', 1, 1)]
+
+    # Прежние записи считаются неправильными, пока администратор не задаст слово
+    assert conn.execute('SELECT COUNT(*) FROM participants WHERE is_correct = 0').fetchone()[0] == len(LEGACY_ROWS)
+
+    for table in ('conversations', 'user_data', 'draws', 'code_words'):
+        conn.execute(f'SELECT COUNT(*) FROM {table}')
+
+    indexes = index_names(conn)
+    assert {'idx_user_date_unique', 'idx_date_time_id', 'idx_date_correct'} <= indexes
+    assert not indexes & {'idx_date', 'idx_date_kode'}
+
+
+def test_migrations_are_not_applied_twice(tmp_path):
+    conn = legacy_database(str(tmp_path / 'legacy.db'))
+    run_migrations(conn)
+
+    assert run_migrations(conn) == LATEST_VERSION
+    assert conn.execute('SELECT COUNT(*) FROM participants').fetchone()[0] == len(LEGACY_ROWS)
+    assert conn.execute('SELECT SUM(participants) FROM daily_stats').fetchone()[0] == len(LEGACY_ROWS)
+
+
+def test_trigger_keeps_daily_stats_after_migration(tmp_path):
+    conn = legacy_database(str(tmp_path / 'legacy.db'))
+    run_migrations(conn)
+
+    conn.executemany('''
+        INSERT INTO participants (date, kode_slovo, user_id, username, first_name, phone, registration_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        ('2026-01-01', 'Салют', 1, 'one', 'Один', '+79990000001', '09:10:00'),
+        ('2026-01-01', 'Салют', 5, 'five', 'Пять', '+79990000005', '09:20:00'),
+    ])
+    conn.commit()
+
+    assert conn.execute(
+        "SELECT participants, new_users FROM daily_stats WHERE date = '2026-01-01'"
+    ).fetchone() == (3, 2)
+
+
+def test_database_opens_legacy_file(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    legacy_database(path).close()
+
+    database = Database(path, batch_writes=False)
+    try:
+        assert database.count_participants('31.12.2025') == 2
+        rows = database.get_participants_by_date('30.12.2025')
+        assert [row['phone'] for row in rows] == ['+79990000001', '+79990000002']
+    finally:
+        database.close()
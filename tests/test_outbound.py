@@ -0,0 +1,141 @@
+# tests/test_outbound.py
+import threading
+import time
+
+import pytest
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from outbound import OutboundLimiter, QueuedBot, PRIORITY_BULK, PRIORITY_REPLY, bulk
+
+
+class FakeApi:
+    """Подмена Bot._message: запоминает отправки, для чатов из retry_after отвечает 429 один раз"""
+
+    def __init__(self):
+        self.sent = []  # (chat_id, text, время отправки)
+        self.retry_after = {}  # chat_id -> секунды
+        self.started = time.monotonic()
+
+    def message(self, endpoint, data):
+        chat_id = data['chat_id']
+        if chat_id in self.retry_after:
+            raise RetryAfter(self.retry_after.pop(chat_id))
+        self.sent.append((chat_id, data.get('text'), time.monotonic() - self.started))
+        return True
+
+    def texts(self, chat_id):
+        return [text for sent_chat_id, text, _ in self.sent if sent_chat_id == chat_id]
+
+    def sent_at(self, chat_id, text):
+        return next(at for sent_chat_id, sent_text, at in self.sent if (sent_chat_id, sent_text) == (chat_id, text))
+
+
+@pytest.fixture
+def api(monkeypatch):
+    fake = FakeApi()
+    monkeypatch.setattr(Bot, '_message', lambda bot, endpoint, data, *args, **kwargs: fake.message(endpoint, data))
+    return fake
+
+
+def make_bot(global_rate=30, chat_rate=1, chat_burst=3):
+    return QueuedBot('123456:TEST', limiter=OutboundLimiter(global_rate, chat_rate, chat_burst))
+
+
+def test_busy_chat_does_not_block_other_chats(api):
+    bot = make_bot(chat_rate=1, chat_burst=3)
+
+    started = time.monotonic()
+    for number in range(6):
+        bot.send_message(chat_id=1, text=str(number))
+    bot.send_message(chat_id=2, text='other')
+    elapsed = time.monotonic() - started
+
+    # Ни обработчик чата 1, ни следующий за ним чат не ждут лимита чата 1
+    assert elapsed < 0.5
+    assert api.texts(2) == ['other']
+    assert bot.get_stats()['deferred'] == 3
+
+    bot.stop()
+    assert api.texts(1) == ['0', '1', '2', '3', '4', '5']
+    assert api.sent_at(1, '5') >= 2.5
+
+
+def test_acquire_waits_only_for_global_bucket():
+    limiter = OutboundLimiter(global_rate=10, chat_rate=1, chat_burst=1)
+
+    started = time.monotonic()
+    for _ in range(10):
+        limiter.acquire()
+    assert time.monotonic() - started < 0.05
+
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.08
+
+
+def test_reply_goes_before_bulk_when_global_limit_is_reached():
+    limiter = OutboundLimiter(global_rate=5, chat_rate=100, chat_burst=100)
+    for _ in range(5):
+        limiter.acquire()
+
+    order = []
+
+    def send(priority, name):
+        limiter.acquire(priority)
+        order.append(name)
+
+    bulk_thread = threading.Thread(target=send, args=(PRIORITY_BULK, 'bulk'))
+    bulk_thread.start()
+    time.sleep(0.02)
+    reply_thread = threading.Thread(target=send, args=(PRIORITY_REPLY, 'reply'))
+    reply_thread.start()
+    bulk_thread.join(2)
+    reply_thread.join(2)
+
+    assert order == ['reply', 'bulk']
+
+
+def test_retry_after_backs_off_only_that_chat(api):
+    bot = make_bot()
+    api.retry_after[1] = 1
+
+    bot.send_message(chat_id=1, text='flooded')
+    bot.send_message(chat_id=2, text='other')
+    assert api.texts(2) == ['other']
+    assert api.texts(1) == []
+
+    bot.stop()
+    assert api.texts(1) == ['flooded']
+    assert api.sent_at(1, 'flooded') >= 0.9
+    assert api.sent_at(2, 'other') < 0.5
+    assert bot.get_stats()['retries'] == 1
+
+
+def test_retry_after_pauses_everything_when_global_limit_is_reached(api):
+    bot = make_bot(global_rate=2, chat_rate=100, chat_burst=100)
+    bot.send_message(chat_id=1, text='first')
+    api.retry_after[2] = 0.5
+    bot.send_message(chat_id=2, text='second')
+
+    # Общая корзина опустела: 429 относится ко всему боту
+    assert bot.limiter.global_saturated()
+    started = time.monotonic()
+    bot.send_message(chat_id=3, text='third')
+    assert time.monotonic() - started >= 0.4
+
+    bot.stop()
+    assert sorted(chat_id for chat_id, _, _ in api.sent) == [1, 2, 3]
+
+
+def test_bulk_messages_use_low_priority(api, monkeypatch):
+    bot = make_bot()
+    priorities = []
+    acquire = bot.limiter.acquire
+    monkeypatch.setattr(bot.limiter, 'acquire', lambda priority=PRIORITY_REPLY: priorities.append(priority) or acquire(priority))
+
+    bot.send_message(chat_id=1, text='reply')
+    with bulk():
+        bot.send_message(chat_id=2, text='report')
+    bot.stop()
+
+    assert priorities == [PRIORITY_REPLY, PRIORITY_BULK]
@@ -0,0 +1,59 @@
+# tests/test_pagination.py
+DATE = '15.01.2026'
+ISO_DATE = '2026-01-15'
+
+
+def add_participants(db, count, iso_date=ISO_DATE):
+    # Одинаковое время у соседних записей: порядок задает id
+    db.insert_participants_batch([
+        (iso_date, 'слово', 100 + i, f'user{i}', f'Имя {i}', '+79990000000', f'10:{i // 2:02d}:00')
+        for i in range(count)
+    ])
+
+
+def cursor_of(row):
+    return row[0], row[5]
+
+
+def test_forward_pages_cover_every_row_once(db):
+    add_participants(db, 25)
+
+    seen = []
+    page = db.get_participants_page(DATE, limit=10)
+    pages = 1
+    seen.extend(page.rows)
+    while page.has_more:
+        page = db.get_participants_page(DATE, after_cursor=cursor_of(page.rows[-1]), limit=10)
+        pages += 1
+        seen.extend(page.rows)
+
+    assert pages == 3
+    assert [row[5] for row in seen] == sorted(row[5] for row in seen)
+    assert len({row[5] for row in seen}) == 25
+
+
+def test_backward_page_mirrors_forward_page(db):
+    add_participants(db, 25)
+
+    first = db.get_participants_page(DATE, limit=10)
+    second = db.get_participants_page(DATE, after_cursor=cursor_of(first.rows[-1]), limit=10)
+
+    back = db.get_participants_page(DATE, before_cursor=cursor_of(second.rows[0]), limit=10)
+    assert back.rows == first.rows
+    assert not back.has_more
+
+    partial = db.get_participants_page(DATE, before_cursor=cursor_of(second.rows[0]), limit=4)
+    assert partial.rows == first.rows[-4:]
+    assert partial.has_more
+
+
+def test_page_is_limited_to_its_date(db):
+    add_participants(db, 3)
+    db.insert_participants_batch([
+        ('2026-01-16', 'слово', 1, 'other', 'Другой', '+79990000000', '09:00:00'),
+    ])
+
+    page = db.get_participants_page(DATE, limit=10)
+    assert len(page.rows) == 3
+    assert not page.has_more
+    assert db.get_participants_page('17.01.2026', limit=10).rows == []
@@ -0,0 +1,72 @@
+# tests/test_persistence.py
+from telegram.ext import ConversationHandler
+
+from persistence import SQLitePersistence
+
+# Интервал больше длительности теста: запись идет только через flush/close
+FLUSH_INTERVAL = 3600
+
+
+def test_changes_are_written_on_flush(db):
+    persistence = SQLitePersistence(db, flush_interval=FLUSH_INTERVAL)
+    persistence.update_conversation('registration', (1, 1), 2)
+    persistence.update_user_data(1, {'kode_slovo': 'Снежинка'})
+
+    assert db.get_connection().execute('SELECT COUNT(*) FROM conversations').fetchone()[0] == 0
+
+    persistence.flush()
+    persistence.close()
+
+    restored = SQLitePersistence(db, flush_interval=FLUSH_INTERVAL)
+    try:
+        assert restored.get_conversations('registration').get((1, 1)) == 2
+        assert restored.get_user_data()[1] == {'kode_slovo': 'Снежинка'}
+    finally:
+        restored.close()
+
+
+def test_latest_change_wins_within_interval(db):
+    persistence = SQLitePersistence(db, flush_interval=FLUSH_INTERVAL)
+    persistence.update_conversation('registration', (1, 1), 1)
+    persistence.update_conversation('registration', (1, 1), 2)
+    persistence.update_user_data(1, {'step': 1})
+    persistence.update_user_data(1, {'step': 2})
+    persistence.close()
+
+    restored = SQLitePersistence(db, flush_interval=FLUSH_INTERVAL)
+    try:
+        assert restored.get_conversations('registration').get((1, 1)) == 2
+        assert restored.get_user_data()[1] == {'step': 2}
+    finally:
+        restored.close()
+
+
+def test_finished_conversation_and_empty_user_data_are_deleted(db):
+    persistence = SQLitePersistence(db, flush_interval=FLUSH_INTERVAL)
+    persistence.update_conversation('registration', (1, 1), 2)
+    persistence.update_user_data(1, {'kode_slovo': 'Снежинка'})
+    persistence.flush()
+
+    persistence.update_conversation('registration', (1, 1), ConversationHandler.END)
+    persistence.update_user_data(1, {})
+    persistence.close()
+
+    conn = db.get_connection()
+    assert conn.execute('SELECT COUNT(*) FROM conversations').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM user_data').fetchone()[0] == 0
+
+
+def test_failed_flush_keeps_changes_for_next_attempt(db, monkeypatch):
+    persistence = SQLitePersistence(db, flush_interval=FLUSH_INTERVAL)
+    persistence.update_user_data(1, {'step': 1})
+
+    def locked():
+        raise RuntimeError("database is locked")
+
+    get_connection = db.get_connection
+    monkeypatch.setattr(db, 'get_connection', locked)
+    persistence.flush()
+    monkeypatch.setattr(db, 'get_connection', get_connection)
+
+    persistence.close()
+    assert get_connection().execute('SELECT data FROM user_data WHERE user_id = 1').fetchone()[0] == '{"step": 1}'
@@ -0,0 +1,131 @@
+# tests/test_write_queue.py
+import threading
+import time
+
+import pytest
+
+from database import RegistrationResult
+from write_queue import ParticipantWriteQueue
+
+
+class FakeDatabase:
+    """Заглушка Database: запоминает записанные пакеты, запись можно задержать"""
+
+    def __init__(self):
+        self.batches = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def insert_participants_batch(self, rows):
+        self.entered.set()
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        self.batches.append(list(rows))
+        return [RegistrationResult(True, row[1], row[6]) for row in rows]
+
+    @property
+    def user_ids(self):
+        return [row[2] for batch in self.batches for row in batch]
+
+
+def make_row(user_id):
+    return ('2026-01-01', 'слово', user_id, 'user', 'Имя', '+79990000000', '12:00:00')
+
+
+def test_submit_returns_commit_result():
+    db = FakeDatabase()
+    write_queue = ParticipantWriteQueue(db)
+    write_queue.start()
+    try:
+        result = write_queue.submit(make_row(1))
+    finally:
+        write_queue.stop()
+
+    assert result == RegistrationResult(True, 'слово', '12:00:00')
+    assert db.user_ids == [1]
+
+
+def test_timed_out_registration_is_not_committed():
+    db = FakeDatabase()
+    write_queue = ParticipantWriteQueue(db, submit_timeout=0.05)
+
+    # Писатель еще не запущен: заявка ждет в очереди и отменяется по таймауту
+    with pytest.raises(Exception, match="Превышено время ожидания"):
+        write_queue.submit(make_row(1))
+
+    write_queue.start()
+    write_queue.submit(make_row(2))
+    write_queue.stop()
+
+    assert db.user_ids == [2]
+
+
+def test_timeout_after_claim_waits_for_commit():
+    db = FakeDatabase()
+    db.release.clear()
+    write_queue = ParticipantWriteQueue(db, submit_timeout=0.05)
+    write_queue.start()
+
+    outcome = {}
+
+    def submit():
+        try:
+            outcome['result'] = write_queue.submit(make_row(1))
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+
+    # Пакет уже записывается дольше submit_timeout - обработчик дожидается коммита
+    assert db.entered.wait(1)
+    time.sleep(0.2)
+    db.release.set()
+    thread.join(1)
+    write_queue.stop()
+
+    assert 'error' not in outcome
+    assert outcome['result'].created
+    assert db.user_ids == [1]
+
+
+def test_concurrent_submissions_share_transactions():
+    db = FakeDatabase()
+    write_queue = ParticipantWriteQueue(db, flush_interval_ms=50)
+    write_queue.start()
+
+    users = range(50)
+    barrier = threading.Barrier(len(users))
+    results = {}
+
+    def submit(user_id):
+        barrier.wait()
+        results[user_id] = write_queue.submit(make_row(user_id))
+
+    threads = [threading.Thread(target=submit, args=(user_id,)) for user_id in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    write_queue.stop()
+
+    assert sorted(db.user_ids) == list(users)
+    assert all(result.created for result in results.values())
+    assert len(db.batches) < len(users)
+
+
+def test_failed_batch_raises_for_every_submitter():
+    db = FakeDatabase()
+    db.error = RuntimeError("database is locked")
+    write_queue = ParticipantWriteQueue(db)
+    write_queue.start()
+    try:
+        with pytest.raises(RuntimeError, match="database is locked"):
+            write_queue.submit(make_row(1))
+    finally:
+        write_queue.stop()
+
+    assert write_queue.get_stats()['failed_batches'] == 1